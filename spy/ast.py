@@ -219,6 +219,17 @@ class GetItem(Expr):
     value: Expr
     index: Expr
 
+@dataclass(eq=False)
+class GetSlice(Expr):
+    """
+    value[start:stop]. The parser fills the missing bounds, see
+    Parser.from_py_expr_Subscript
+    """
+    precedence = 16
+    value: Expr
+    start: Expr
+    stop: Expr
+
 @dataclass(eq=False)
 class List(Expr):
     precedence = 17
@@ -62,6 +62,7 @@ class Context:
         self._d[B.w_f64] = C_Type('double')
         self._d[B.w_bool] = C_Type('bool')
         self._d[B.w_str] = C_Type('spy_Str *')
+        self._d[B.w_StrBuilder] = C_Type('spy_StrBuilder *')
         self._d[RB.w_RawBuffer] = C_Type('spy_RawBuffer *')
         self._d[JSFFI.w_JsRef] = C_Type('JsRef')
 
@@ -72,6 +73,15 @@ class Context:
             return self._d[w_type]
         raise NotImplementedError(f'Cannot translate type {w_type} to C')
 
+    def is_gc_type(self, w_type: W_Type) -> bool:
+        """
+        Return True if the values of the given type are allocated by
+        spy_GcAlloc, and thus must be tracked by the shadow stack.
+        """
+        if isinstance(w_type, W_TypeDef):
+            w_type = w_type.w_origintype
+        return w_type in (B.w_str, B.w_StrBuilder, RB.w_RawBuffer)
+
     def c_function(self, name: str, w_functype: W_FuncType) -> C_Function:
         c_restype = self.w2c(w_functype.w_restype)
         c_params = [
@@ -25,7 +25,11 @@ class CModuleWriter:
     out: TextBuilder          # main builder
     out_warnings: TextBuilder # nested builder
     out_globals: TextBuilder  # nested builder for global declarations
+    out_includes: TextBuilder # nested builder for the headers of other modules
     global_vars: set[str]
+    # the other SPy modules which are used by this one: we need to include
+    # their headers, see emit_header
+    deps: dict[str, None]
 
     def __init__(self, vm: SPyVM, w_mod: W_Module,
                  spyfile: py.path.local,
@@ -38,11 +42,32 @@ class CModuleWriter:
         self.target = target
         self.out = TextBuilder(use_colors=False)
         self.out_globals = None  # type: ignore
+        self.out_includes = None  # type: ignore
         self.global_vars = set()
+        self.deps = {}
+
+    @property
+    def hfile(self) -> py.path.local:
+        return self.cfile.new(ext='h')
 
     def write_c_source(self) -> None:
         c_src = self.emit_module()
         self.cfile.write(c_src)
+        self.hfile.write(self.emit_header())
+
+    def add_dependency_maybe(self, fqn: FQN) -> None:
+        """
+        Record that we are referencing fqn: if it belongs to another SPy
+        module, we need to include its header.
+        """
+        modname = fqn.modname
+        if modname == self.w_mod.name or modname in self.deps:
+            return
+        w_mod = self.ctx.vm.modules_w.get(modname)
+        # builtin modules are implemented by libspy, whose declarations are
+        # already in spy.h
+        if w_mod is not None and not w_mod.filepath.startswith('<'):
+            self.deps[modname] = None
 
     def new_global_var(self, prefix: str) -> str:
         """
@@ -66,6 +91,10 @@ class CModuleWriter:
         #    define SPY_LINE(SPY, C) SPY "{self.spyfile}"
         #endif
 
+        """)
+        self.out_includes = self.out.make_nested_builder()
+        self.out.wl()
+        self.out.wb("""
         // global declarations and definitions
         """)
         self.out_warnings = self.out.make_nested_builder()
@@ -94,8 +123,40 @@ class CModuleWriter:
                     return 0;
                 }}
             """)
+        for modname in self.deps:
+            self.out_includes.wl(f'#include "{modname}.h"')
         return self.out.build()
 
+    def emit_header(self) -> str:
+        """
+        Emit the declarations of all the functions and variables of the
+        module, which are needed by the other modules which use it.
+
+        The header depends only on the signatures: changing the body of a
+        function doesn't change the header, so the modules which depend on
+        it don't need to be recompiled (see ProgramCompiler).
+        """
+        guard = f'SPY_MODULE_{self.w_mod.name.upper()}_H'
+        out = TextBuilder(use_colors=False)
+        out.wb(f"""
+        #ifndef {guard}
+        #define {guard}
+
+        #include <spy.h>
+        """)
+        out.wl()
+        for fqn, w_obj in self.w_mod.items_w():
+            if isinstance(w_obj, W_ASTFunc):
+                if w_obj.color == 'red':
+                    c_func = self.ctx.c_function(fqn.c_name, w_obj.w_functype)
+                    out.wl(c_func.decl() + ';')
+            elif self.ctx.vm.dynamic_type(w_obj) is B.w_i32:
+                c_type = self.ctx.w2c(B.w_i32)
+                out.wl(f'extern {c_type} {fqn.c_name};')
+        out.wl()
+        out.wl(f'#endif /* {guard} */')
+        return out.build()
+
     def emit_jsffi_error(self) -> None:
         err = '#error "jsffi is available only for emscripten targets"'
         if err not in self.out_warnings.lines:
@@ -115,6 +176,12 @@ class CModuleWriter:
             intval = self.ctx.vm.unwrap(w_obj)
             c_type = self.ctx.w2c(w_type)
             self.out_globals.wl(f'{c_type} {fqn.c_name} = {intval};')
+        elif self.ctx.is_gc_type(w_type):
+            # the GC doesn't know about global variables, so an object
+            # which is referenced only by a global would be freed by the
+            # next collection. See spy/libspy/include/spy/gc.h
+            raise ValueError(f'global variables of type `{w_type.name}` '
+                             f'are not supported by the C backend')
         elif w_type is TYPES.w_TypeDef:
             # XXX: for now, we just ignore global TypeDefs, since they are not
             # needed. But in general, we need a way to emit prebuilt
@@ -131,6 +198,12 @@ class CFuncWriter:
     fqn: FQN
     w_func: W_ASTFunc
     last_emitted_linenos: tuple[int, int]
+    # the local variables which hold GC references, and the number of
+    # temporary slots needed to hold the GC results of calls: see
+    # emit_gc_frame
+    gc_roots: list[str]
+    gc_n_tmps: int
+    gc_next_tmp: int
 
     def __init__(self,
                  ctx: Context,
@@ -143,6 +216,9 @@ class CFuncWriter:
         self.fqn = fqn
         self.w_func = w_func
         self.last_emitted_linenos = (-1, -1) # see emit_lineno_maybe
+        self.gc_roots = []
+        self.gc_n_tmps = 0
+        self.gc_next_tmp = 0
 
     def ppc(self) -> None:
         """
@@ -166,10 +242,14 @@ class CFuncWriter:
         self.out.wl(c_func.decl() + ' {')
         with self.out.indent():
             self.emit_local_vars()
+            self.emit_gc_frame()
             for stmt in self.w_func.funcdef.body:
                 self.emit_stmt(stmt)
 
-            if self.w_func.w_functype.w_restype is not B.w_void:
+            if self.w_func.w_functype.w_restype is B.w_void:
+                if self.has_gc_frame:
+                    self.out.wl('spy_gc_pop_frame(&spy_gc_frame);')
+            else:
                 # this is a non-void function: if we arrive here, it means we
                 # reached the end of the function without a return. Ideally,
                 # we would like to also report an error message, but for now
@@ -177,6 +257,8 @@ class CFuncWriter:
                 msg = 'reached the end of the function without a `return`'
                 self.out.wl(f'abort(); /* {msg} */')
         self.out.wl('}')
+        # all the slots reserved by emit_gc_frame must have been used
+        assert self.gc_next_tmp == self.gc_n_tmps
 
     def emit_local_vars(self) -> None:
         """
@@ -189,10 +271,84 @@ class CFuncWriter:
         assert self.w_func.locals_types_w is not None
         param_names = [p.name for p in self.w_func.w_functype.params]
         for varname, w_type in self.w_func.locals_types_w.items():
+            if varname == '@return':
+                continue
             c_type = self.ctx.w2c(w_type)
-            if varname != '@return' and varname not in param_names:
+            is_gc = self.ctx.is_gc_type(w_type)
+            if is_gc:
+                self.gc_roots.append(varname)
+            if varname in param_names:
+                pass
+            elif is_gc:
+                # the GC might look at it before it's assigned
+                self.out.wl(f'{c_type} {varname} = NULL;')
+            else:
                 self.out.wl(f'{c_type} {varname};')
 
+    def get_call_restype(self, call: ast.Call) -> Optional[W_Type]:
+        if not isinstance(call.func, ast.FQNConst):
+            return None
+        w_func = self.ctx.vm.lookup_global(call.func.fqn)
+        assert isinstance(w_func, W_Func)
+        return w_func.w_functype.w_restype
+
+    def is_special_call(self, call: ast.Call) -> bool:
+        """
+        Whether fmt_expr_Call special-cases the call, instead of emitting a
+        plain call to the corresponding C function.
+        """
+        assert isinstance(call.func, ast.FQNConst)
+        fqn = call.func.fqn
+        return (fqn in self.FQN2BinOp or
+                str(fqn).startswith('jsffi::getattr_') or
+                str(fqn).startswith('jsffi::setattr_') or
+                fqn == FQN.parse('jsffi::call_method_1'))
+
+    def needs_gc_tmp(self, call: ast.Call) -> bool:
+        """
+        Whether fmt_expr_Call stores the result of the call into a
+        spy_gc_tmp slot: emit_gc_frame uses it to count the slots.
+        """
+        if not isinstance(call.func, ast.FQNConst):
+            return False
+        if self.is_special_call(call):
+            return False
+        w_restype = self.get_call_restype(call)
+        return w_restype is not None and self.ctx.is_gc_type(w_restype)
+
+    @property
+    def has_gc_frame(self) -> bool:
+        return bool(self.gc_roots) or self.gc_n_tmps > 0
+
+    def emit_gc_frame(self) -> None:
+        """
+        Push a spy_GcFrame on the shadow stack, containing the addresses of
+        all the local variables which hold GC references (see spy/gc.h).
+
+        The result of a call which returns a GC reference is not stored in any
+        local variable, e.g. the inner call in spy_str_add(spy_str_add(a, b),
+        c): to keep it alive, we store it in one of the spy_gc_tmp slots,
+        which are roots as well.
+
+        Functions which don't touch any GC reference don't need a frame.
+        """
+        self.gc_n_tmps = 0
+        for call in self.w_func.funcdef.walk(ast.Call):
+            assert isinstance(call, ast.Call)
+            if self.needs_gc_tmp(call):
+                self.gc_n_tmps += 1
+        if not self.has_gc_frame:
+            return
+        roots = [f'(void **)&{varname}' for varname in self.gc_roots]
+        if self.gc_n_tmps:
+            self.out.wl(f'void *spy_gc_tmp[{self.gc_n_tmps}] = {{NULL}};')
+            roots += [f'&spy_gc_tmp[{i}]' for i in range(self.gc_n_tmps)]
+        s_roots = ', '.join(roots)
+        n = len(roots)
+        self.out.wl(f'void **spy_gc_roots[] = {{{s_roots}}};')
+        self.out.wl(f'spy_GcFrame spy_gc_frame = {{NULL, spy_gc_roots, {n}}};')
+        self.out.wl('spy_gc_push_frame(&spy_gc_frame);')
+
     # ==============
 
     def emit_lineno_maybe(self, loc: Loc) -> None:
@@ -240,10 +396,26 @@ class CFuncWriter:
 
     def emit_stmt_Return(self, ret: ast.Return) -> None:
         v = self.fmt_expr(ret.value)
+        if not self.has_gc_frame:
+            if v is C.Void():
+                self.out.wl('return;')
+            else:
+                self.out.wl(f'return {v};')
+            return
+        # we need to pop the GC frame, but only after having computed the
+        # result
         if v is C.Void():
+            self.out.wl('spy_gc_pop_frame(&spy_gc_frame);')
             self.out.wl('return;')
         else:
-            self.out.wl(f'return {v};')
+            w_restype = self.w_func.w_functype.w_restype
+            c_restype = self.ctx.w2c(w_restype)
+            self.out.wl('{')
+            with self.out.indent():
+                self.out.wl(f'{c_restype} spy_gc_res = {v};')
+                self.out.wl('spy_gc_pop_frame(&spy_gc_frame);')
+                self.out.wl('return spy_gc_res;')
+            self.out.wl('}')
 
     def emit_stmt_VarDef(self, vardef: ast.VarDef) -> None:
         # all local vars have already been declared, nothing to do
@@ -255,6 +427,7 @@ class CFuncWriter:
         if sym.is_local:
             target = assign.target
         else:
+            self.cmod.add_dependency_maybe(sym.fqn)
             target = sym.fqn.c_name
         self.out.wl(f'{target} = {v};')
 
@@ -335,6 +508,7 @@ class CFuncWriter:
     def fmt_expr_FQNConst(self, const: ast.FQNConst) -> C.Expr:
         w_obj = self.ctx.vm.lookup_global(const.fqn)
         assert isinstance(w_obj, W_Func)
+        self.cmod.add_dependency_maybe(const.fqn)
         return C.Literal(const.fqn.c_name)
 
     def fmt_expr_Name(self, name: ast.Name) -> C.Expr:
@@ -342,6 +516,7 @@ class CFuncWriter:
         if sym.is_local:
             return C.Literal(name.id)
         else:
+            self.cmod.add_dependency_maybe(sym.fqn)
             return C.Literal(sym.fqn.c_name)
 
     def fmt_expr_BinOp(self, binop: ast.BinOp) -> C.Expr:
@@ -443,6 +618,23 @@ class CFuncWriter:
             return C.Call(c_name, [c_obj, c_attr, c_arg])
 
         # the default case is to call a function with the corresponding name
+        self.cmod.add_dependency_maybe(call.func.fqn)
         c_name = call.func.fqn.c_name
         c_args = [self.fmt_expr(arg) for arg in call.args]
-        return C.Call(c_name, c_args)
+        c_call = C.Call(c_name, c_args)
+        if self.needs_gc_tmp(call):
+            w_restype = self.get_call_restype(call)
+            assert w_restype is not None
+            return self.fmt_gc_tmp(c_call, w_restype)
+        return c_call
+
+    def fmt_gc_tmp(self, c_call: C.Expr, w_restype: W_Type) -> C.Expr:
+        """
+        Store the result of the call into a spy_gc_tmp slot, see
+        emit_gc_frame
+        """
+        i = self.gc_next_tmp
+        assert i < self.gc_n_tmps
+        self.gc_next_tmp += 1
+        c_restype = self.ctx.w2c(w_restype)
+        return C.Literal(f'(({c_restype})(spy_gc_tmp[{i}] = {c_call}))')
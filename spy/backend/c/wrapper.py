@@ -1,12 +1,13 @@
 import struct
-from typing import Any, Optional
+import ctypes
+from typing import Any, Optional, Callable, Iterable, Sequence
 import py.path
 import wasmtime
 from spy.fqn import FQN
 from spy.llwasm import LLWasmType
 from spy.libspy import LLSPyInstance
 from spy.vm.object import W_Type
-from spy.vm.str import ll_spy_Str_new
+from spy.vm.str import ll_spy_Str_new, ll_spy_Str_read
 from spy.vm.module import W_Module
 from spy.vm.function import W_Func, W_FuncType
 from spy.vm.vm import SPyVM
@@ -18,11 +19,15 @@ class WasmModuleWrapper:
     vm: SPyVM
     modname: str
     ll: LLSPyInstance
+    # whether to run each call inside an arena, see WasmFuncWrapper
+    arena: bool
 
-    def __init__(self, vm: SPyVM, modname: str, f: py.path.local) -> None:
+    def __init__(self, vm: SPyVM, modname: str, f: py.path.local, *,
+                 arena: bool = False) -> None:
         self.vm = vm
         self.modname = modname
         self.ll = LLSPyInstance.from_file(f)
+        self.arena = arena
 
     def __repr__(self) -> str:
         return f"<WasmModuleWrapper '{self.ll.llmod.f}'>"
@@ -42,7 +47,8 @@ class WasmModuleWrapper:
         w_func = self.vm.lookup_global(fqn)
         assert isinstance(w_func, W_Func)
         return WasmFuncWrapper(self.vm, self.ll,
-                               fqn.c_name, w_func.w_functype)
+                               fqn.c_name, w_func.w_functype,
+                               arena=self.arena)
 
     def read_global(self, fqn: FQN) -> Any:
         w_type = self.vm.lookup_global_type(fqn)
@@ -56,66 +62,299 @@ class WasmModuleWrapper:
 
 
 class WasmFuncWrapper:
+    """
+    Call a WASM function from Python.
+
+    Everything which doesn't depend on the actual arguments is resolved once
+    and for all in __init__: the wt.Func, the converters for the arguments
+    and the decoder for the result. Use call_many() to call the same function
+    many times, which also amortizes the Python-side dispatch.
+
+    If arena is True, each call runs inside its own libspy arena (see
+    spy/arena.h): all the objects allocated by the call, including the
+    converted arguments, are freed at once as soon as the result has been
+    decoded.
+    """
     vm: SPyVM
     ll: LLSPyInstance
     c_name: str
     w_functype: W_FuncType
+    func: wasmtime.Func
+    arity: int
+    # None means that all the arguments are passed as they are
+    converters: Optional[list[Optional[Callable[[Any], Any]]]]
+    # None means that the result is returned as it is
+    decoder: Optional[Callable[[Any], Any]]
+    arena: bool
 
     def __init__(self, vm: SPyVM, ll: LLSPyInstance, c_name: str,
-                 w_functype: W_FuncType) -> None:
+                 w_functype: W_FuncType, *, arena: bool = False) -> None:
         self.vm = vm
         self.ll = ll
         self.c_name = c_name
         self.w_functype = w_functype
+        self.arena = arena
+        func = ll.get_export(c_name)
+        assert isinstance(func, wasmtime.Func)
+        self.func = func
+        self.arity = w_functype.arity
+        converters = [self.get_converter(p.w_type) for p in w_functype.params]
+        if any(converters):
+            self.converters = converters
+        else:
+            self.converters = None
+        self.decoder = self.get_decoder(w_functype.w_restype)
 
-    def py2wasm(self, pyval: Any, w_type: W_Type) -> Any:
+    def get_converter(self, w_type: W_Type) -> Optional[Callable[[Any], Any]]:
         if w_type in (B.w_i32, B.w_f64):
-            return pyval
+            return None
         elif w_type is B.w_str:
-            # XXX: with the GC, we need to think how to keep this alive
-            return ll_spy_Str_new(self.ll, pyval)
+            # the string is allocated outside of any GC frame, and it's kept
+            # alive by the frame of the function which receives it
+            ll = self.ll
+            return lambda pyval: ll_spy_Str_new(ll, pyval)
         else:
             assert False, f'Unsupported type: {w_type}'
 
-    def from_py_args(self, py_args: Any) -> Any:
-        a = len(py_args)
-        b = self.w_functype.arity
-        if a != b:
-            raise TypeError(f'{self.c_name}: expected {b} arguments, got {a}')
-        #
-        wasm_args = []
-        for py_arg, param in zip(py_args, self.w_functype.params):
-            wasm_arg = self.py2wasm(py_arg, param.w_type)
-            wasm_args.append(wasm_arg)
-        return wasm_args
-
-    def __call__(self, *py_args: Any) -> Any:
-        wasm_args = self.from_py_args(py_args)
-        res = self.ll.call(self.c_name, *wasm_args)
-        w_type = self.w_functype.w_restype
+    def get_decoder(self, w_type: W_Type) -> Optional[Callable[[Any], Any]]:
         if isinstance(w_type, W_TypeDef):
             w_type = w_type.w_origintype
         #
         if w_type is B.w_void:
-            assert res is None
-            return None
+            return self.decode_void
         elif w_type is B.w_i32:
-            return res
+            return None
         elif w_type is B.w_f64:
-            return res
+            return None
         elif w_type is B.w_bool:
-            return bool(res)
+            return bool
         elif w_type is B.w_str:
-            # res is a  spy_Str*
-            addr = res
-            length = self.ll.mem.read_i32(addr)
-            utf8 = self.ll.mem.read(addr + 4, length)
-            return utf8.decode('utf-8')
+            return self.decode_str
         elif w_type is RB.w_RawBuffer:
-            # res is a  spy_RawBuffer*
-            addr = res
-            length = self.ll.mem.read_i32(addr)
-            buf = self.ll.mem.read(addr + 4, length)
-            return buf
+            return self.decode_RawBuffer
         else:
             assert False, f"Don't know how to read {w_type} from WASM"
+
+    @staticmethod
+    def decode_void(res: Any) -> None:
+        assert res is None
+        return None
+
+    def decode_str(self, addr: int) -> str:
+        # addr is a spy_Str*
+        return ll_spy_Str_read(self.ll, addr).decode('utf-8')
+
+    def decode_RawBuffer(self, addr: int) -> bytearray:
+        # addr is a spy_RawBuffer*
+        length = self.ll.mem.read_i32(addr)
+        return self.ll.mem.read(addr + 4, length)
+
+    def from_py_args(self, py_args: Any) -> Any:
+        a = len(py_args)
+        b = self.arity
+        if a != b:
+            raise TypeError(f'{self.c_name}: expected {b} arguments, got {a}')
+        converters = self.converters
+        if converters is None:
+            return py_args
+        return [
+            py_arg if conv is None else conv(py_arg)
+            for conv, py_arg in zip(converters, py_args)
+        ]
+
+    def _call(self, py_args: Sequence[Any]) -> Any:
+        wasm_args = self.from_py_args(py_args)
+        res = self.ll.call_func(self.func, *wasm_args)
+        decoder = self.decoder
+        if decoder is None:
+            return res
+        return decoder(res)
+
+    def _call_in_arena(self, py_args: Sequence[Any]) -> Any:
+        ll = self.ll
+        ll.arena_push()
+        try:
+            return self._call(py_args)
+        finally:
+            ll.arena_pop()
+
+    def __call__(self, *py_args: Any) -> Any:
+        if self.arena:
+            return self._call_in_arena(py_args)
+        return self._call(py_args)
+
+    def call_many(self, args_list: Iterable[Sequence[Any]]) -> list[Any]:
+        """
+        Call the function once for each tuple of arguments in args_list, and
+        return the list of results.
+        """
+        if self.arena:
+            return [self._call_in_arena(py_args) for py_args in args_list]
+        from_py_args = self.from_py_args
+        call_func = self.ll.call_func
+        func = self.func
+        decoder = self.decoder
+        results = []
+        for py_args in args_list:
+            res = call_func(func, *from_py_args(py_args))
+            if decoder is not None:
+                res = decoder(res)
+            results.append(res)
+        return results
+
+
+class NativeModuleWrapper:
+    """
+    Like WasmModuleWrapper, but for the shared libraries produced by
+    Compiler.cbuild(shared=True).
+
+    The functions are called directly through ctypes, so there is no
+    host<->wasm marshalling: in particular, i32/f64/bool arguments are passed
+    as they are, and the returned spy_Str/spy_RawBuffer are read directly
+    from the native memory.
+    """
+    vm: SPyVM
+    modname: str
+    f: py.path.local
+    lib: ctypes.CDLL
+
+    def __init__(self, vm: SPyVM, modname: str, f: py.path.local) -> None:
+        self.vm = vm
+        self.modname = modname
+        self.f = f
+        self.lib = ctypes.CDLL(str(f))
+
+    def __repr__(self) -> str:
+        return f"<NativeModuleWrapper '{self.f}'>"
+
+    def __getattr__(self, attr: str) -> Any:
+        fqn = FQN.make_global(modname=self.modname, attr=attr)
+        w_obj = self.vm.lookup_global(fqn)
+        if w_obj is None:
+            raise AttributeError(attr)
+        elif isinstance(w_obj, W_Func):
+            return NativeFuncWrapper(self.lib, fqn.c_name,
+                                     w_obj.w_functype)
+        else:
+            return self.read_global(fqn)
+
+    def read_global(self, fqn: FQN) -> Any:
+        w_type = self.vm.lookup_global_type(fqn)
+        if w_type is B.w_i32:
+            return ctypes.c_int32.in_dll(self.lib, fqn.c_name).value
+        else:
+            assert False, f'Unknown type: {w_type}'
+
+
+class NativeFuncWrapper:
+    """
+    Call a native SPy function through ctypes.
+
+    The ctypes signature is computed once from the W_FuncType. spy_Str* and
+    spy_RawBuffer* are passed as pointers: the arguments are copied into a
+    temporary buffer with the same layout as the C struct, which is kept
+    alive for the duration of the call.
+
+    The str and RawBuffer results are copied too, into a Python str and
+    bytearray: they live in memory managed by the GC of libspy, and nobody
+    keeps them alive after the call, so the next collection could free them.
+    """
+    c_name: str
+    w_functype: W_FuncType
+    w_restype: W_Type
+    params_w: list[W_Type]
+    cfunc: Any
+
+    SIZE_T = ctypes.sizeof(ctypes.c_size_t)
+
+    CTYPES: dict[W_Type, Any] = {
+        B.w_void: None,
+        B.w_i32: ctypes.c_int32,
+        B.w_f64: ctypes.c_double,
+        B.w_bool: ctypes.c_bool,
+        B.w_str: ctypes.c_void_p,
+        RB.w_RawBuffer: ctypes.c_void_p,
+    }
+
+    def __init__(self, lib: ctypes.CDLL, c_name: str,
+                 w_functype: W_FuncType) -> None:
+        self.c_name = c_name
+        self.w_functype = w_functype
+        self.w_restype = self.unwrap_typedef(w_functype.w_restype)
+        self.params_w = [self.unwrap_typedef(p.w_type)
+                         for p in w_functype.params]
+        # lib[name] returns a new function pointer every time, so we can
+        # safely set argtypes/restype on it
+        self.cfunc = lib[c_name]
+        self.cfunc.argtypes = [self.get_ctype(w_T) for w_T in self.params_w]
+        self.cfunc.restype = self.get_ctype(self.w_restype)
+
+    @staticmethod
+    def unwrap_typedef(w_type: W_Type) -> W_Type:
+        if isinstance(w_type, W_TypeDef):
+            return w_type.w_origintype
+        return w_type
+
+    def get_ctype(self, w_type: W_Type) -> Any:
+        try:
+            return self.CTYPES[w_type]
+        except KeyError:
+            raise TypeError(
+                f'Unsupported type for native calls: {w_type}')
+
+    def make_buffer(self, data: bytes) -> ctypes.Array:
+        # same layout as spy_RawBuffer: the length followed by the data
+        n = len(data)
+        buf = ctypes.create_string_buffer(self.SIZE_T + n)
+        ctypes.c_size_t.from_buffer(buf).value = n
+        ctypes.memmove(ctypes.addressof(buf) + self.SIZE_T, data, n)
+        return buf
+
+    def make_str(self, utf8: bytes) -> ctypes.Array:
+        # same layout as a non-view spy_Str: length, utf8, parent and data
+        n = len(utf8)
+        P = ctypes.sizeof(ctypes.c_void_p)
+        header = self.SIZE_T + 2*P
+        buf = ctypes.create_string_buffer(header + n)
+        addr = ctypes.addressof(buf)
+        ctypes.c_size_t.from_address(addr).value = n
+        ctypes.c_void_p.from_address(addr + self.SIZE_T).value = addr + header
+        ctypes.memmove(addr + header, utf8, n)
+        return buf
+
+    def __call__(self, *py_args: Any) -> Any:
+        a = len(py_args)
+        b = len(self.params_w)
+        if a != b:
+            raise TypeError(f'{self.c_name}: expected {b} arguments, got {a}')
+        keepalive = []
+        c_args = []
+        for py_arg, w_type in zip(py_args, self.params_w):
+            if w_type is B.w_str or w_type is RB.w_RawBuffer:
+                if w_type is B.w_str:
+                    buf = self.make_str(py_arg.encode('utf-8'))
+                else:
+                    buf = self.make_buffer(py_arg)
+                keepalive.append(buf)
+                py_arg = ctypes.addressof(buf)
+            c_args.append(py_arg)
+        res = self.cfunc(*c_args)
+        return self.to_py_result(res)
+
+    def to_py_result(self, res: Any) -> Any:
+        w_type = self.w_restype
+        if w_type is B.w_str:
+            # res is a spy_Str*, possibly a view
+            length = ctypes.c_size_t.from_address(res).value
+            utf8 = ctypes.c_void_p.from_address(res + self.SIZE_T).value
+            assert utf8 is not None
+            return ctypes.string_at(utf8, length).decode('utf-8')
+        elif w_type is RB.w_RawBuffer:
+            # res is a spy_RawBuffer*. We must copy the data, like
+            # WasmFuncWrapper.decode_RawBuffer: nobody keeps the buffer
+            # alive, so the next collection frees it
+            length = ctypes.c_size_t.from_address(res).value
+            cbuf = (ctypes.c_char * length).from_address(res + self.SIZE_T)
+            return bytearray(cbuf)
+        # void, i32, f64 and bool are already converted by ctypes
+        return res
@@ -248,6 +248,12 @@ class SPyBackend:
         i = self.fmt_expr(getitem.index)
         return f'{v}[{i}]'
 
+    def fmt_expr_GetSlice(self, node: ast.GetSlice) -> str:
+        v = self.fmt_expr(node.value)
+        a = self.fmt_expr(node.start)
+        b = self.fmt_expr(node.stop)
+        return f'{v}[{a}:{b}]'
+
     def fmt_expr_GetAttr(self, node: ast.GetAttr) -> str:
         v = self.fmt_expr(node.value)
         return f'{v}.{node.attr}'
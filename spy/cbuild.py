@@ -1,5 +1,10 @@
 from typing import Optional
+from dataclasses import dataclass
+import os
+import functools
+import hashlib
 import subprocess
+import threading
 import py.path
 import spy.libspy
 
@@ -16,10 +21,126 @@ def get_toolchain(toolchain: str) -> 'Toolchain':
         raise ValueError(f"Unknown toolchain: {toolchain}")
 
 
+@functools.lru_cache(maxsize=None)
+def get_cc_version(cc: tuple[str, ...]) -> str:
+    """
+    Return the output of `cc --version`. It is computed only once per
+    process, because it's needed for every compute_build_key.
+    """
+    try:
+        proc = subprocess.run(list(cc) + ['--version'],
+                              stdout=subprocess.PIPE,
+                              stderr=subprocess.STDOUT)
+    except OSError:
+        # the compiler doesn't exist: the compilation will fail anyway
+        return ''
+    return proc.stdout.decode('utf-8', errors='replace')
+
+
+def compute_build_key(target: str, cc: list[str], cmdline: list[str],
+                      files: list[py.path.local]) -> str:
+    """
+    Compute a hash of everything which can influence the output of a
+    compilation: the version of the compiler, the command line (minus the
+    input/output filenames), the content of the given files, the libspy
+    headers and the libspy library of the target.
+    """
+    h = hashlib.sha256()
+    def update(b: bytes) -> None:
+        # length-prefix every item, to avoid ambiguities
+        h.update(len(b).to_bytes(8, 'little'))
+        h.update(b)
+    update(get_cc_version(tuple(cc)).encode('utf-8'))
+    for arg in cmdline:
+        update(arg.encode('utf-8'))
+    for f in files:
+        update(f.read_binary())
+    for f in sorted(spy.libspy.INCLUDE.visit('*.h')):
+        update(f.relto(spy.libspy.INCLUDE).encode('utf-8'))
+        update(f.read_binary())
+    libspy_a = spy.libspy.BUILD.join(target, 'libspy.a')
+    if libspy_a.check(file=True):
+        update(libspy_a.read_binary())
+    return h.hexdigest()
+
+
+@dataclass
+class BuildCacheStats:
+    hits: int = 0
+    misses: int = 0
+
+
+class BuildCache:
+    """
+    Content-addressed cache of the outputs of Toolchain.cc, keyed by
+    compute_build_key.
+    """
+    cachedir: py.path.local
+    stats: BuildCacheStats
+    # lookup() is called concurrently by Compiler.build_many
+    _stats_lock: threading.Lock
+
+    def __init__(self, cachedir: py.path.local) -> None:
+        self.cachedir = cachedir
+        self.stats = BuildCacheStats()
+        self._stats_lock = threading.Lock()
+
+    def compute_key(self, target: str, cc: list[str], cmdline: list[str],
+                    file_c: py.path.local) -> str:
+        return compute_build_key(target, cc, cmdline, [file_c])
+
+    def lookup(self, key: str, file_out: py.path.local) -> bool:
+        """
+        If key is in the cache, copy the cached file to file_out and return
+        True.
+        """
+        cached = self.cachedir.join(key)
+        if not cached.check(file=True):
+            with self._stats_lock:
+                self.stats.misses += 1
+            return False
+        cached.copy(file_out, mode=True)
+        with self._stats_lock:
+            self.stats.hits += 1
+        return True
+
+    def store(self, key: str, file_out: py.path.local) -> None:
+        try:
+            self.cachedir.ensure(dir=True)
+            # copy and rename, so that concurrent builds never see a
+            # partially written file
+            tid = threading.get_ident()
+            tmp = self.cachedir.join(f'{key}.{os.getpid()}.{tid}.tmp')
+            file_out.copy(tmp, mode=True)
+            tmp.rename(self.cachedir.join(key))
+        except OSError:
+            pass
+
+
+def get_default_build_cache() -> Optional[BuildCache]:
+    """
+    The cache is stored in ~/.cache/spy/cbuild by default. It can be
+    overridden by setting SPY_CBUILD_CACHE: if it's the empty string, the
+    cache is disabled.
+    """
+    d = os.environ.get('SPY_CBUILD_CACHE')
+    if d is None:
+        xdg = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+        d = os.path.join(xdg, 'spy', 'cbuild')
+    if d == '':
+        return None
+    return BuildCache(py.path.local(d))
+
+BUILD_CACHE = get_default_build_cache()
+
+
 class Toolchain:
 
     TARGET = '' # 'wasi', 'native', 'emscripten'
     EXE_FILENAME_EXT = ''
+    # toolchains which produce more than one output file cannot be cached
+    # by BuildCache
+    CACHEABLE = True
 
     @property
     def CC(self) -> list[str]:
@@ -65,11 +186,24 @@ class Toolchain:
         cmdline += [f'-O{opt_level}']
         if debug_symbols:
             cmdline += ['-g']
+        flags = self.LDFLAGS + EXTRA_LDFLAGS
+        cache = BUILD_CACHE if self.CACHEABLE else None
+        if cache is not None:
+            key = cache.compute_key(self.TARGET, self.CC, cmdline + flags,
+                                    file_c)
+            if cache.lookup(key, file_out):
+                return file_out
         cmdline += [
             '-o', str(file_out),
             str(file_c)
         ]
-        cmdline += self.LDFLAGS + EXTRA_LDFLAGS
+        cmdline += flags
+        self.run(cmdline)
+        if cache is not None:
+            cache.store(key, file_out)
+        return file_out
+
+    def run(self, cmdline: list[str]) -> None:
         #print(' '.join(cmdline))
         proc = subprocess.run(cmdline,
                               stdout=subprocess.PIPE,
@@ -81,6 +215,57 @@ class Toolchain:
             lines.append(proc.stdout.decode('utf-8'))
             msg = '\n'.join(lines)
             raise Exception(msg)
+
+    # ==== separate compilation ====
+
+    @property
+    def TARGET_CFLAGS(self) -> list[str]:
+        """
+        The flags which are needed both to compile and to link for the
+        target.
+        """
+        if self.TARGET == 'native':
+            return []
+        return self.WASM_CFLAGS
+
+    def compile_flags(self, *, opt_level: int = 0,
+                      debug_symbols: bool = False) -> list[str]:
+        cmdline = self.CC + self.CFLAGS + self.TARGET_CFLAGS
+        cmdline += [f'-O{opt_level}']
+        if debug_symbols:
+            cmdline += ['-g']
+        return cmdline
+
+    def c2obj(self, file_c: py.path.local, file_o: py.path.local, *,
+              opt_level: int = 0,
+              debug_symbols: bool = False,
+              ) -> py.path.local:
+        """
+        Compile the C code to an object file, without linking it.
+        """
+        cmdline = self.compile_flags(opt_level=opt_level,
+                                     debug_symbols=debug_symbols)
+        cmdline += ['-c', '-o', str(file_o), str(file_c)]
+        self.run(cmdline)
+        return file_o
+
+    def link(self, files_o: list[py.path.local], file_out: py.path.local, *,
+             exports: Optional[list[str]] = None,
+             opt_level: int = 0,
+             debug_symbols: bool = False,
+             ) -> py.path.local:
+        """
+        Link the given object files against libspy. The names in exports are
+        exported from the resulting WASM module.
+        """
+        cmdline = self.compile_flags(opt_level=opt_level,
+                                     debug_symbols=debug_symbols)
+        cmdline += ['-o', str(file_out)]
+        cmdline += [str(f) for f in files_o]
+        cmdline += self.LDFLAGS
+        for name in exports or []:
+            cmdline.append(f'-Wl,--export={name}')
+        self.run(cmdline)
         return file_out
 
 
@@ -175,16 +360,35 @@ class NativeToolchain(Toolchain):
 
     TARGET = 'native'
     EXE_FILENAME_EXT = ''
+    SHARED_FILENAME_EXT = 'so'
 
     @property
     def CC(self) -> list[str]:
         return ['cc']
 
+    def c2shared(self, file_c: py.path.local, file_so: py.path.local, *,
+                 opt_level: int = 0,
+                 debug_symbols: bool = False,
+                 ) -> py.path.local:
+        """
+        Compile the C code to a shared library, which can be loaded by
+        NativeModuleWrapper
+        """
+        return self.cc(
+            file_c,
+            file_so,
+            opt_level=opt_level,
+            debug_symbols=debug_symbols,
+            EXTRA_CFLAGS=['-shared', '-fPIC'],
+        )
+
 
 class EmscriptenToolchain(Toolchain):
 
     TARGET = 'emscripten'
     EXE_FILENAME_EXT = 'mjs'
+    # emcc writes both the .mjs and the .wasm
+    CACHEABLE = False
 
     def __init__(self) -> None:
         self.EMCC = py.path.local.sysfind('emcc')
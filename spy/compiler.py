@@ -1,8 +1,15 @@
 import os
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
 from enum import Enum
+from typing import Optional, Any
 import py.path
 from spy.backend.c.cwriter import CModuleWriter
-from spy.cbuild import get_toolchain
+from spy.cbuild import (get_toolchain, Toolchain, NativeToolchain,
+                        compute_build_key)
 from spy.vm.vm import SPyVM
 from spy.vm.module import W_Module
 from spy.vm.function import W_ASTFunc
@@ -17,6 +24,41 @@ class ToolchainType(str, Enum):
     emscripten = "emscripten"
     native = "native"
 
+
+@dataclass
+class BuildJob:
+    """
+    One of the builds performed by Compiler.build_many.
+    """
+    modname: str
+    builddir: py.path.local
+    opt_level: int = 0
+    debug_symbols: bool = False
+    toolchain_type: ToolchainType = ToolchainType.zig
+
+
+@dataclass
+class BuildResult:
+    job: BuildJob
+    output: Optional[py.path.local] = None
+    error: Optional[Exception] = None
+    cwrite_time: float = 0.0
+    cc_time: float = 0.0
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+@dataclass
+class _PreparedJob:
+    # a job whose C source has already been written, ready for _cc
+    compiler: 'Compiler'
+    toolchain: Toolchain
+    file_c: py.path.local
+    exports: list[str]
+
+
 class Compiler:
     """
     Take a module inside a VM and compile it to C/WASM.
@@ -51,28 +93,61 @@ class Compiler:
         #
         return self.file_c
 
+    def get_exports(self) -> list[str]:
+        # ok, this logic is wrong: we cannot know which names we want to
+        # export by simply looking at their type: for example, in case of
+        # variables we want to export "red variables" but we don't want to
+        # export "blue variabes" (I guess?). For now, let's just include
+        # red functions and integers
+        return [
+            fqn.c_name
+            for fqn, w_obj in self.w_mod.items_w()
+            if (isinstance(w_obj, W_ASTFunc) and w_obj.color == 'red' or
+                isinstance(w_obj, W_I32))
+        ]
+
     def cbuild(self, *,
                opt_level: int = 0,
                debug_symbols: bool = False,
                toolchain_type: ToolchainType = ToolchainType.zig,
+               shared: bool = False,
                ) -> py.path.local:
         """
-        Build the .c file into a .wasm file or an executable
+        Build the .c file into a .wasm file or an executable.
+
+        If shared is True, build a shared library instead, which can be
+        loaded by NativeModuleWrapper: this is supported only by the native
+        toolchain.
         """
         toolchain = get_toolchain(toolchain_type)
+        if shared and not isinstance(toolchain, NativeToolchain):
+            raise ValueError('shared libraries are supported only by the '
+                             'native toolchain')
         file_c = self.cwrite(toolchain.TARGET)
-        if toolchain.TARGET == 'wasi':
-            # ok, this logic is wrong: we cannot know which names we want to
-            # export by simply looking at their type: for example, in case of
-            # variables we want to export "red variables" but we don't want to
-            # export "blue variabes" (I guess?). For now, let's just include
-            # red functions and integers
-            exports = [
-                fqn.c_name
-                for fqn, w_obj in self.w_mod.items_w()
-                if (isinstance(w_obj, W_ASTFunc) and w_obj.color == 'red' or
-                    isinstance(w_obj, W_I32))
-            ]
+        exports = self.get_exports()
+        return self._cc(toolchain, file_c, exports,
+                        opt_level=opt_level,
+                        debug_symbols=debug_symbols,
+                        shared=shared)
+
+    def _cc(self, toolchain: Toolchain, file_c: py.path.local,
+            exports: list[str], *,
+            opt_level: int,
+            debug_symbols: bool,
+            shared: bool = False,
+            ) -> py.path.local:
+        """
+        Invoke the C compiler. This doesn't touch the VM, so it is safe to
+        call it from multiple threads, see build_many.
+        """
+        if shared:
+            assert isinstance(toolchain, NativeToolchain)
+            ext = toolchain.SHARED_FILENAME_EXT
+            file_so = self.file_wasm.new(ext=ext)
+            return toolchain.c2shared(file_c, file_so,
+                                      opt_level=opt_level,
+                                      debug_symbols=debug_symbols)
+        elif toolchain.TARGET == 'wasi':
             file_wasm = toolchain.c2wasm(file_c, self.file_wasm,
                                          exports=exports,
                                          opt_level=opt_level,
@@ -88,3 +163,226 @@ class Compiler:
                             opt_level=opt_level,
                             debug_symbols=debug_symbols)
             return file_exe
+
+    # ==== concurrent builds ====
+
+    @staticmethod
+    def _prepare_jobs(vm: SPyVM, jobs: list[BuildJob],
+                      results: list[BuildResult]
+                      ) -> list[Optional[_PreparedJob]]:
+        """
+        Write the C sources of all the jobs.
+
+        This uses the VM, so it is done serially. The jobs which fail are
+        recorded in results and returned as None.
+        """
+        seen = set()
+        for job in jobs:
+            key = (str(job.builddir), job.modname)
+            if key in seen:
+                raise ValueError(
+                    f'Two jobs write {job.modname} into {job.builddir}: '
+                    f'please use a different builddir for each job')
+            seen.add(key)
+        #
+        prepared: list[Optional[_PreparedJob]] = []
+        for job, res in zip(jobs, results):
+            a = time.perf_counter()
+            try:
+                toolchain = get_toolchain(job.toolchain_type)
+                compiler = Compiler(vm, job.modname, job.builddir)
+                file_c = compiler.cwrite(toolchain.TARGET)
+                exports = compiler.get_exports()
+                prepared.append(
+                    _PreparedJob(compiler, toolchain, file_c, exports))
+            except Exception as e:
+                res.error = e
+                prepared.append(None)
+            res.cwrite_time = time.perf_counter() - a
+        return prepared
+
+    @staticmethod
+    def _run_job(pjob: _PreparedJob, res: BuildResult) -> None:
+        job = res.job
+        a = time.perf_counter()
+        try:
+            res.output = pjob.compiler._cc(
+                pjob.toolchain,
+                pjob.file_c,
+                pjob.exports,
+                opt_level=job.opt_level,
+                debug_symbols=job.debug_symbols)
+        except Exception as e:
+            res.error = e
+        res.cc_time = time.perf_counter() - a
+
+    @staticmethod
+    def build_many(vm: SPyVM, jobs: list[BuildJob], *,
+                   max_jobs: Optional[int] = None) -> list[BuildResult]:
+        """
+        Perform all the given builds, running up to max_jobs C compilers in
+        parallel (by default, os.cpu_count()).
+
+        The C sources are written serially, since CModuleWriter needs the
+        VM: the time is dominated by the C compiler anyway, which runs in a
+        subprocess.
+
+        The jobs are run by a pool of threads, not processes: each thread
+        spends almost all its time waiting for the C compiler, with the GIL
+        released, so a process pool would not build any faster, and it
+        would need to send the Compiler (and thus the VM) to the workers.
+        For this reason, there is no option to use a process pool.
+
+        It never raises because of a failed build: all the errors are
+        collected in the corresponding BuildResult, together with the
+        timings. The only exception is ValueError if two jobs would write
+        the same files, since this is a mistake of the caller and no job is
+        run at all.
+        """
+        results = [BuildResult(job) for job in jobs]
+        prepared = Compiler._prepare_jobs(vm, jobs, results)
+        max_workers = max_jobs or os.cpu_count() or 1
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [
+                executor.submit(Compiler._run_job, pjob, res)
+                for pjob, res in zip(prepared, results)
+                if pjob is not None
+            ]
+            for fut in futures:
+                fut.result()
+        return results
+
+    @staticmethod
+    async def build_many_async(vm: SPyVM, jobs: list[BuildJob], *,
+                               max_jobs: Optional[int] = None
+                               ) -> list[BuildResult]:
+        """
+        Like build_many, but it can be awaited from inside an already
+        running event loop.
+        """
+        results = [BuildResult(job) for job in jobs]
+        prepared = Compiler._prepare_jobs(vm, jobs, results)
+        sem = asyncio.Semaphore(max_jobs or os.cpu_count() or 1)
+
+        async def run_one(pjob: _PreparedJob, res: BuildResult) -> None:
+            async with sem:
+                await asyncio.to_thread(Compiler._run_job, pjob, res)
+
+        await asyncio.gather(*[
+            run_one(pjob, res)
+            for pjob, res in zip(prepared, results)
+            if pjob is not None
+        ])
+        return results
+
+
+class ProgramCompiler:
+    """
+    Compile multiple modules separately and link them together.
+
+    Each module is written to its own .c file, together with a .h file
+    containing the declarations of its functions and variables (see
+    CModuleWriter.emit_header), and compiled to its own object file.
+
+    The builds are incremental: we keep a manifest in builddir with the hash
+    of the inputs of each object file (its .c, the headers it includes and
+    the compiler flags), and we recompile only the modules whose inputs
+    changed since the last build. We relink only if at least one object file
+    changed.
+    """
+    vm: SPyVM
+    modnames: list[str]
+    builddir: py.path.local
+    toolchain: Toolchain
+    opt_level: int
+    debug_symbols: bool
+    # the modules which were recompiled by the last call to build()
+    recompiled: list[str]
+    # whether the last call to build() relinked the output
+    relinked: bool
+
+    MANIFEST = 'spy-build.json'
+
+    def __init__(self, vm: SPyVM, modnames: list[str],
+                 builddir: py.path.local, *,
+                 opt_level: int = 0,
+                 debug_symbols: bool = False,
+                 toolchain_type: ToolchainType = ToolchainType.zig,
+                 ) -> None:
+        self.vm = vm
+        self.modnames = modnames
+        self.builddir = builddir
+        self.toolchain = get_toolchain(toolchain_type)
+        self.opt_level = opt_level
+        self.debug_symbols = debug_symbols
+        self.recompiled = []
+        self.relinked = False
+
+    def load_manifest(self) -> dict[str, Any]:
+        f = self.builddir.join(self.MANIFEST)
+        if not f.check(file=True):
+            return {'objects': {}, 'link': None}
+        return json.loads(f.read())
+
+    def save_manifest(self, manifest: dict[str, Any]) -> None:
+        f = self.builddir.join(self.MANIFEST)
+        f.write(json.dumps(manifest, indent=4, sort_keys=True))
+
+    def build(self, outname: str) -> py.path.local:
+        """
+        Build all the modules and link them into builddir/outname.{wasm,exe}.
+        """
+        t = self.toolchain
+        flags = t.compile_flags(opt_level=self.opt_level,
+                                debug_symbols=self.debug_symbols)
+        # first, we write all the .c and .h files
+        compilers = []
+        exports = []
+        for modname in self.modnames:
+            compiler = Compiler(self.vm, modname, self.builddir)
+            compiler.cwrite(t.TARGET)
+            compilers.append(compiler)
+            exports += compiler.get_exports()
+        #
+        # then, we recompile the object files whose inputs changed
+        manifest = self.load_manifest()
+        old_objects = manifest['objects']
+        new_objects = {}
+        self.recompiled = []
+        files_o = []
+        for compiler in compilers:
+            modname = compiler.w_mod.name
+            file_o = compiler.file_c.new(ext='o')
+            headers = [self.builddir.join(f'{dep}.h')
+                       for dep in compiler.cwriter.deps]
+            key = compute_build_key(t.TARGET, t.CC, flags,
+                                    [compiler.file_c] + headers)
+            if old_objects.get(modname) != key or not file_o.check(file=True):
+                t.c2obj(compiler.file_c, file_o,
+                        opt_level=self.opt_level,
+                        debug_symbols=self.debug_symbols)
+                self.recompiled.append(modname)
+            new_objects[modname] = key
+            files_o.append(file_o)
+        #
+        # finally, relink if needed
+        if t.TARGET == 'wasi':
+            file_out = self.builddir.join(f'{outname}.wasm')
+        else:
+            file_out = self.builddir.join(outname).new(
+                ext=t.EXE_FILENAME_EXT)
+        link_key = compute_build_key(t.TARGET, t.CC, flags + exports,
+                                     files_o)
+        self.relinked = (manifest['link'] != link_key or
+                         not file_out.check(file=True))
+        if self.relinked:
+            # save the manifest before linking, so that the object files are
+            # not recompiled if the link fails
+            self.save_manifest({'objects': new_objects, 'link': None})
+            link_exports = exports if t.TARGET == 'wasi' else None
+            t.link(files_o, file_out,
+                   exports=link_exports,
+                   opt_level=self.opt_level,
+                   debug_symbols=self.debug_symbols)
+        self.save_manifest({'objects': new_objects, 'link': link_key})
+        return file_out
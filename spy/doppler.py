@@ -1,5 +1,7 @@
-from typing import Any, Optional, TYPE_CHECKING
+from typing import Any, Optional, Union, TYPE_CHECKING
 from types import NoneType
+import multiprocessing
+import pickle
 from fixedint import FixedInt
 from spy import ast
 from spy.location import Loc
@@ -10,6 +12,7 @@ from spy.vm.object import W_Object, W_Type
 from spy.vm.function import W_ASTFunc, W_BuiltinFunc
 from spy.vm.astframe import ASTFrame
 from spy.vm.typeconverter import JsRefConv
+from spy.vm.opimpl import W_OpImpl
 from spy.util import magic_dispatch
 
 if TYPE_CHECKING:
@@ -20,6 +23,125 @@ def redshift(vm: 'SPyVM', w_func: W_ASTFunc) -> W_ASTFunc:
     dop = FuncDoppler(vm, w_func)
     return dop.redshift()
 
+
+# ==== parallel redshift ====
+#
+# W_Objects cannot be sent across processes, so we rely on fork(): each
+# worker gets a copy of the whole VM, redshifts some functions and sends back
+# only the new FuncDefs, which are plain AST nodes.
+#
+# This works only for functions whose redshift doesn't create any new global
+# (e.g., closures which get an FQN in make_const): such functions reference
+# only objects which already exist in the parent, so the result is exactly
+# the same as the serial one. The others are rejected by the worker and
+# redshifted serially by the parent, in the original order: this way the FQNs
+# are allocated in the same order and the output is identical to the serial
+# redshift.
+#
+# Blue code executed during the redshift might also have other side effects,
+# e.g. storing into a module global or caching the result of an app-level
+# blue function in the bluecache: they happen only in the worker, and they
+# could influence the redshift of the following functions. The worker
+# detects them, and in that case the parent throws away all the parallel
+# results and redshifts everything serially.
+
+_FORKED_VM: Optional['SPyVM'] = None
+
+def can_redshift_forked() -> bool:
+    return 'fork' in multiprocessing.get_all_start_methods()
+
+def redshift_forked(vm: 'SPyVM', fqns: list[FQN],
+                    workers: int) -> Optional[list[Optional[W_ASTFunc]]]:
+    """
+    Redshift the functions stored in the given globals, using a pool of
+    forked workers.
+
+    Return a list containing the redshifted function for each FQN, or None
+    if it must be redshifted serially. Return None instead of the list if
+    the blue code had side effects, see the comment above.
+    """
+    global _FORKED_VM
+    assert workers > 1
+    assert _FORKED_VM is None, 'redshift_forked is not reentrant'
+    ctx = multiprocessing.get_context('fork')
+    chunksize = max(1, len(fqns) // (workers * 4))
+    _FORKED_VM = vm
+    try:
+        with ctx.Pool(workers) as pool:
+            results = pool.map(_redshift_in_worker, fqns, chunksize)
+    finally:
+        _FORKED_VM = None
+    if any(has_side_effects for has_side_effects, _ in results):
+        return None
+    return [_unpack_result(vm, fqn, res) for fqn, (_, res) in
+            zip(fqns, results)]
+
+def _redshift_in_worker(fqn: FQN) -> tuple[bool, Optional[bytes]]:
+    """
+    Return (has_side_effects, pickled_result)
+    """
+    vm = _FORKED_VM
+    assert vm is not None
+    w_func = vm.globals_w[fqn]
+    assert isinstance(w_func, W_ASTFunc)
+    n_fqns = len(vm.unique_fqns)
+    n_bluecache = _count_bluecache_astfunc(vm)
+    globals_w = vm.globals_w.copy()
+    try:
+        w_newfunc = redshift(vm, w_func)
+    except Exception:
+        # the parent will redshift it again and report the error
+        return False, None
+    if (_count_bluecache_astfunc(vm) != n_bluecache or
+        any(vm.globals_w[key] is not w_obj
+            for key, w_obj in globals_w.items())):
+        return True, None
+    if len(vm.unique_fqns) != n_fqns:
+        return False, None
+    assert w_newfunc.locals_types_w is not None
+    locals_types = {}
+    for name, w_type in w_newfunc.locals_types_w.items():
+        type_fqn = vm.reverse_lookup_global(w_type)
+        if type_fqn is None:
+            return False, None
+        locals_types[name] = type_fqn
+    try:
+        return False, pickle.dumps((w_newfunc.funcdef, locals_types))
+    except Exception:
+        return False, None
+
+def _count_bluecache_astfunc(vm: 'SPyVM') -> int:
+    """
+    Count the bluecache entries of app-level blue functions. The entries of
+    builtin functions (e.g. the OPERATORs) are recorded by pretty much every
+    redshift, but they are pure and don't need to be propagated.
+    """
+    bc = vm.bluecache
+    n = sum(len(bucket) for (w_func, _), bucket in bc.data.items()
+            if isinstance(w_func, W_ASTFunc))
+    n += sum(len(entries) for w_func, entries in bc.slow_data.items()
+             if isinstance(w_func, W_ASTFunc))
+    return n
+
+def _unpack_result(vm: 'SPyVM', fqn: FQN,
+                   res: Optional[bytes]) -> Optional[W_ASTFunc]:
+    if res is None:
+        return None
+    funcdef, locals_types = pickle.loads(res)
+    w_func = vm.globals_w[fqn]
+    assert isinstance(w_func, W_ASTFunc)
+    locals_types_w = {}
+    for name, type_fqn in locals_types.items():
+        w_type = vm.lookup_global(type_fqn)
+        assert isinstance(w_type, W_Type)
+        locals_types_w[name] = w_type
+    return W_ASTFunc(
+        qn = w_func.qn,
+        closure = (),
+        w_functype = w_func.w_functype,
+        funcdef = funcdef,
+        locals_types_w = locals_types_w)
+
 class FuncDoppler:
     """
     Perform a redshift on a W_ASTFunc
@@ -171,7 +293,9 @@ class FuncDoppler:
 
     # ==== expressions ====
 
-    def shift_opimpl(self, op, w_opimpl, orig_args):
+    def shift_opimpl(self, op: Union[ast.Expr, ast.Stmt], w_opimpl: W_OpImpl,
+                     orig_args: list[ast.Expr]) -> ast.Call:
+        assert w_opimpl._w_func is not None
         func = self.make_const(op.loc, w_opimpl._w_func)
         real_args = w_opimpl.redshift_args(self.vm, orig_args)
         return ast.Call(op.loc, func, real_args)
@@ -209,6 +333,13 @@ class FuncDoppler:
         w_opimpl = self.t.opimpl[op]
         return self.shift_opimpl(op, w_opimpl, [v, i])
 
+    def shift_expr_GetSlice(self, op: ast.GetSlice) -> ast.Expr:
+        v = self.shift_expr(op.value)
+        a = self.shift_expr(op.start)
+        b = self.shift_expr(op.stop)
+        w_opimpl = self.t.opimpl[op]
+        return self.shift_opimpl(op, w_opimpl, [v, a, b])
+
     def shift_expr_GetAttr(self, op: ast.GetAttr) -> ast.Expr:
         v = self.shift_expr(op.value)
         v_attr = ast.Constant(op.loc, value=op.attr)
@@ -31,6 +31,11 @@ fn_i32 = make_fn(i32)  # QN is 'test::fn', FQN is 'test::fn#1'
 fn_f64 = make_fn(f64)  # QN is 'test::fn', FQN is 'test::fn#2'
 
 See also SPyVM.get_FQN().
+
+FQNs are interned: FQN.make() returns the same object for the same
+(modname, attr, suffix), so that comparing and hashing them is cheap. For the
+same reason, both QNs and FQNs precompute their fullname and hash, and FQNs
+also their c_name: they are supposed to be immutable.
 """
 
 from typing import Optional, Any
@@ -38,6 +43,8 @@ from typing import Optional, Any
 class QN:
     modname: str
     attr: str
+    _fullname: str
+    _hash: int
 
     def __init__(self,
                  fullname: Optional[str] = None,
@@ -56,6 +63,8 @@ class QN:
         #
         self.modname = modname
         self.attr = attr
+        self._fullname = f'{modname}::{attr}'
+        self._hash = hash(self._fullname)
 
     def __repr__(self) -> str:
         return f"QN({self.fullname!r})"
@@ -66,20 +75,26 @@ class QN:
     def __eq__(self, other: Any) -> bool:
         if not isinstance(other, QN):
             return NotImplemented
-        return self.fullname == other.fullname
+        return self._fullname == other._fullname
 
     def __hash__(self) -> int:
-        return hash(self.fullname)
+        return self._hash
 
     @property
     def fullname(self) -> str:
-        return f'{self.modname}::{self.attr}'
+        return self._fullname
 
 
 class FQN:
     modname: str
     attr: str
     suffix: str
+    _fullname: str
+    _hash: int
+    _c_name: str
+
+    # the interning registry: (modname, attr, suffix) -> FQN
+    _registry: dict[tuple[str, str, str], 'FQN'] = {}
 
     def __init__(self, *args: Any, **kwargs: Any) -> None:
         raise ValueError("You cannot instantiate an FQN directly. "
@@ -87,10 +102,17 @@ class FQN:
 
     @classmethod
     def make(cls, modname: str, attr: str, suffix: str) -> 'FQN':
-        obj = cls.__new__(cls)
-        obj.modname = modname
-        obj.attr = attr
-        obj.suffix = suffix
+        key = (modname, attr, suffix)
+        obj = cls._registry.get(key)
+        if obj is None:
+            obj = cls.__new__(cls)
+            obj.modname = modname
+            obj.attr = attr
+            obj.suffix = suffix
+            obj._fullname = obj._compute_fullname()
+            obj._hash = hash(obj._fullname)
+            obj._c_name = obj._compute_c_name()
+            cls._registry[key] = obj
         return obj
 
     @classmethod
@@ -118,6 +140,9 @@ class FQN:
 
     @property
     def fullname(self) -> str:
+        return self._fullname
+
+    def _compute_fullname(self) -> str:
         s = f'{self.modname}::{self.attr}'
         if self.suffix != '':
             s += '#' + self.suffix
@@ -126,19 +151,28 @@ class FQN:
     def __repr__(self) -> str:
         return f"FQN({self.fullname!r})"
 
+    def __reduce__(self) -> Any:
+        # make sure that unpickled FQNs are interned
+        return (FQN.make, (self.modname, self.attr, self.suffix))
+
     def __str__(self) -> str:
         return self.fullname
 
     def __eq__(self, other: Any) -> bool:
+        if self is other:
+            return True
         if not isinstance(other, FQN):
             return NotImplemented
-        return self.fullname == other.fullname
+        return self._fullname == other._fullname
 
     def __hash__(self) -> int:
-        return hash(self.fullname)
+        return self._hash
 
     @property
     def c_name(self) -> str:
+        return self._c_name
+
+    def _compute_c_name(self) -> str:
         """
         Return the C name for the corresponding FQN.
 
@@ -1,4 +1,5 @@
 from typing import Any, Optional
+from dataclasses import dataclass
 import wasmtime as wt
 import spy
 from spy.llwasm import LLWasmModule, LLWasmInstance, HostModule
@@ -9,7 +10,25 @@ INCLUDE = spy.ROOT.join('libspy', 'include')
 BUILD = spy.ROOT.join('libspy', 'build')
 LIBSPY_WASM = spy.ROOT.join('libspy', 'build', 'wasi', 'libspy.wasm')
 
-LLMOD = LLWasmModule(LIBSPY_WASM)
+_LLMOD: Optional[LLWasmModule] = None
+
+def get_LLMOD() -> LLWasmModule:
+    """
+    Return the compiled libspy.wasm.
+
+    It is loaded lazily, so that importing spy.libspy (and thus creating an
+    SPyVM) doesn't pay the cost of compiling/loading it.
+    """
+    global _LLMOD
+    if _LLMOD is None:
+        _LLMOD = LLWasmModule(LIBSPY_WASM)
+    return _LLMOD
+
+def __getattr__(name: str) -> Any:
+    # backwards compatibility: libspy.LLMOD is computed on first access
+    if name == 'LLMOD':
+        return get_LLMOD()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 class LibSPyHost(HostModule):
     log: list[str]
@@ -49,24 +68,73 @@ class SPyPanicError(Exception):
     spy_panic().
     """
 
+@dataclass
+class GcStats:
+    """
+    The counters of the libspy GC, see spy/gc.h
+    """
+    collections: int
+    live_bytes: int
+    pause_ns: int
+
+
 class LLSPyInstance(LLWasmInstance):
     """
     A specialized version of LLWasmInstance which automatically link against
     LibSPyHost()
     """
 
+    # the number of arenas pushed by arena_push and not popped yet
+    arena_depth: int
+
     def __init__(self, llmod: LLWasmModule,
                  hostmods: list[HostModule]=[]) -> None:
         self.libspy = LibSPyHost()
         hostmods = [self.libspy] + hostmods
         super().__init__(llmod, hostmods)
+        self.arena_depth = 0
 
     def call(self, name: str, *args: Any) -> Any:
         func = self.get_export(name)
         assert isinstance(func, wt.Func)
+        return self.call_func(func, *args)
+
+    def call_func(self, func: wt.Func, *args: Any) -> Any:
+        """
+        Like call(), but with an already resolved wt.Func
+        """
         try:
             return func(self.store, *args)
         except wt.Trap:
+            self.reset_after_trap()
             if self.libspy.panic_message is not None:
                 raise SPyPanicError(self.libspy.panic_message)
             raise
+
+    def reset_after_trap(self) -> None:
+        # the functions which were aborted by the trap didn't pop their
+        # frames from the shadow stack of the GC, see spy/gc.h
+        reset = self.exports.get('spy_gc_reset_shadow_stack')
+        if reset is not None:
+            reset(self.store)
+
+    def arena_push(self) -> None:
+        self.call('spy_arena_push')
+        self.arena_depth += 1
+
+    def arena_pop(self) -> None:
+        self.call('spy_arena_pop')
+        self.arena_depth -= 1
+
+    def arena_contains(self, ptr: int) -> bool:
+        return bool(self.call('spy_arena_contains', ptr))
+
+    def arena_used_bytes(self) -> int:
+        return self.call('spy_arena_used_bytes')
+
+    def gc_stats(self) -> GcStats:
+        return GcStats(
+            collections = self.call('spy_gc_collections'),
+            live_bytes = self.call('spy_gc_live_bytes'),
+            pause_ns = self.call('spy_gc_pause_ns'),
+        )
@@ -25,7 +25,9 @@
 
 #include "spy/builtins.h"
 #include "spy/str.h"
+#include "spy/strbuilder.h"
 #include "spy/gc.h"
+#include "spy/arena.h"
 #include "spy/rawbuffer.h"
 #include "spy/debug.h"
 
@@ -0,0 +1,53 @@
+#ifndef SPY_ARENA_H
+#define SPY_ARENA_H
+
+#include "spy.h"
+
+/* Region/arena allocation.
+
+   Between spy_arena_push() and the corresponding spy_arena_pop(),
+   spy_GcAlloc allocates from a bump-pointer arena instead of the GC heap.
+   spy_arena_pop() frees all the objects allocated since the push, in O(1):
+   the memory is kept around and reused by the next push.
+
+   This is meant for request-shaped code, where all the temporaries die at
+   the end of the call: the caller (e.g. WasmFuncWrapper) pushes an arena,
+   calls the function, reads the result and pops the arena. Of course, it is
+   an error to use an object after the arena which contains it has been
+   popped.
+
+   Arenas can be nested, up to SPY_ARENA_MAX_DEPTH levels.
+
+   The GC never looks into arenas: arena objects are never collected, and
+   while an arena is active no collection is triggered. Because of that, an
+   object allocated outside an arena must never be modified to point to an
+   arena object: e.g., a spy_StrBuilder which lives in the GC heap always
+   allocates its buffer in the GC heap, even if it grows inside an arena (see
+   spy_GcAllocTracedNoArena).
+
+   spy_GcFree can be called on any pointer returned by spy_GcAlloc: it
+   checks whether the object is in an arena (see spy_arena_contains), and
+   in that case it does nothing.
+*/
+
+#define SPY_ARENA_MAX_DEPTH 64
+
+extern int32_t spy_arena_depth;
+
+void *spy_arena_alloc(size_t size);
+
+void
+WASM_EXPORT(spy_arena_push)(void);
+
+void
+WASM_EXPORT(spy_arena_pop)(void);
+
+// whether p points inside the memory of an arena, active or popped
+bool
+WASM_EXPORT(spy_arena_contains)(const void *p);
+
+// number of bytes currently allocated in all the active arenas
+int32_t
+WASM_EXPORT(spy_arena_used_bytes)(void);
+
+#endif /* SPY_ARENA_H */
@@ -3,13 +3,92 @@
 
 #include "spy.h"
 
+/* A simple non-moving mark & sweep GC.
+
+   All the objects allocated by spy_GcAlloc are kept in a list, and the
+   payloads are carved from size-class free lists (big objects are malloc()ed
+   directly).
+
+   The roots are tracked by a shadow stack of spy_GcFrames: each frame
+   contains the addresses of the local variables and temporaries which hold a
+   GC reference, and it is emitted by CFuncWriter for every function which
+   needs it.
+
+   A collection is triggered by spy_GcAlloc, but only if we are inside a
+   function which pushed a frame: code which runs without frames (e.g. the
+   host calling spy_str_alloc directly) can assume that the objects it
+   allocates are never collected under its feet.
+
+   Note that global variables are not roots: this is why the C backend
+   doesn't support globals of GC types (see CModuleWriter.declare_variable).
+
+   Most of the GC objects (e.g. spy_Str and spy_RawBuffer) are leaves, i.e.
+   they don't contain references to other objects. Objects which do must be
+   allocated by spy_GcAllocTraced, passing a trace function which calls
+   visit() on each of the references which they contain.
+*/
+
 typedef struct {
     void *p;
 } spy_GcRef;
 
-// for now the GC is a fake, we just malloc and leak
-static inline spy_GcRef spy_GcAlloc(size_t size) {
-    return (spy_GcRef){malloc(size)};
+typedef struct spy_GcFrame {
+    struct spy_GcFrame *prev;
+    void ***roots;
+    int32_t n;
+} spy_GcFrame;
+
+extern spy_GcFrame *spy_gc_top;
+
+static inline void
+spy_gc_push_frame(spy_GcFrame *frame) {
+    frame->prev = spy_gc_top;
+    spy_gc_top = frame;
 }
 
+static inline void
+spy_gc_pop_frame(spy_GcFrame *frame) {
+    spy_gc_top = frame->prev;
+}
+
+typedef void (*spy_GcVisitFn)(void *p);
+typedef void (*spy_GcTraceFn)(void *obj, spy_GcVisitFn visit);
+
+spy_GcRef spy_GcAllocTraced(size_t size, spy_GcTraceFn trace);
+
+static inline spy_GcRef
+spy_GcAlloc(size_t size) {
+    return spy_GcAllocTraced(size, NULL);
+}
+
+// Like spy_GcAllocTraced, but always allocate in the GC heap, even inside an
+// arena: this is needed by the objects which are referenced by non-arena
+// objects, see spy/arena.h
+spy_GcRef spy_GcAllocTracedNoArena(size_t size, spy_GcTraceFn trace);
+
+// Free an object explicitly, without waiting for a collection. p must have
+// been returned by spy_GcAlloc, and it must not be referenced anymore. If p
+// is an arena object, it does nothing.
+void spy_GcFree(void *p);
+
+// Force a collection. If it's called when there is no shadow stack (e.g.
+// directly by the host), it does nothing, see the comment at the top.
+void
+WASM_EXPORT(spy_gc_collect)(void);
+
+// Forget all the frames of the shadow stack. This must be called after a
+// trap, because the aborted functions didn't have the chance to pop them.
+void
+WASM_EXPORT(spy_gc_reset_shadow_stack)(void);
+
+// counters
+int32_t
+WASM_EXPORT(spy_gc_collections)(void);
+
+int32_t
+WASM_EXPORT(spy_gc_live_bytes)(void);
+
+int64_t
+WASM_EXPORT(spy_gc_pause_ns)(void);
+
 #endif /* SPY_GC_H */
@@ -4,14 +4,35 @@
 #include <stddef.h>
 #include "spy.h"
 
-typedef struct {
+/* A string is either:
+
+     - a normal string, which owns its data: utf8 points to data, which is
+       allocated together with the struct, and parent is NULL. Prebuilt
+       strings (e.g. the C literals emitted by the backend) are normal
+       strings whose utf8 points directly to a C string literal;
+
+     - a view, i.e. a zero-copy slice of another string: utf8 points inside
+       the data of parent, which is kept alive by the GC.
+
+   The code which only reads strings doesn't need to care about the
+   difference, since it always goes through utf8 and length.
+*/
+typedef struct spy_Str {
     size_t length;
-    const char utf8[];
+    const char *utf8;
+    struct spy_Str *parent;
+    char data[];
 } spy_Str;
 
 spy_Str *
 WASM_EXPORT(spy_str_alloc)(size_t length);
 
+// Free a string allocated by spy_str_alloc (or returned by one of the
+// functions below), e.g. when the corresponding W_Str dies. Never call it on
+// prebuilt strings, such as the ones for the C literals.
+void
+WASM_EXPORT(spy_str_free)(spy_Str *s);
+
 spy_Str *
 WASM_EXPORT(spy_str_add)(spy_Str *a, spy_Str *b);
 
@@ -27,9 +48,16 @@ spy_str_ne(spy_Str *a, spy_Str *b) {
 }
 
 // XXX: should we introduce a separate type Char?
+// The result is one of the prebuilt 1-byte strings, so it doesn't allocate.
 spy_Str *
 WASM_EXPORT(spy_str_getitem)(spy_Str *s, int32_t i);
 
+// s[start:stop], with the same semantics as Python for negative and
+// out-of-bound indexes. The result is either prebuilt (if it's empty or 1
+// byte long), s itself or a view: the data is never copied.
+spy_Str *
+WASM_EXPORT(spy_str_slice)(spy_Str *s, int32_t start, int32_t stop);
+
 spy_Str *
 WASM_EXPORT(spy_builtins$int2str)(int32_t x);
 
@@ -39,5 +67,6 @@ WASM_EXPORT(spy_builtins$int2str)(int32_t x);
 #define spy_operator$str_eq  spy_str_eq
 #define spy_operator$str_ne  spy_str_ne
 #define spy_operator$str_getitem spy_str_getitem
+#define spy_operator$str_slice spy_str_slice
 
 #endif /* SPY_STR_H */
@@ -0,0 +1,37 @@
+#ifndef SPY_STRBUILDER_H
+#define SPY_STRBUILDER_H
+
+#include "spy.h"
+
+/* StrBuilder: build a string incrementally, in amortized linear time.
+
+   The content is accumulated in buf, whose capacity grows geometrically,
+   and build() copies it into a single, freshly allocated spy_Str.
+   buf is a separate GC object, which is kept alive by the trace function of
+   the builder.
+*/
+
+typedef struct {
+    size_t length;
+    size_t capacity;
+    char *buf;
+} spy_StrBuilder;
+
+spy_StrBuilder *
+WASM_EXPORT(spy_builtins$StrBuilder_new)(void);
+
+void
+WASM_EXPORT(spy_builtins$StrBuilder_append)(spy_StrBuilder *sb, spy_Str *s);
+
+void
+WASM_EXPORT(spy_builtins$StrBuilder_append_i32)(spy_StrBuilder *sb,
+                                                int32_t x);
+
+spy_Str *
+WASM_EXPORT(spy_builtins$StrBuilder_build)(spy_StrBuilder *sb);
+
+// Free the builder and its buffer, see spy_str_free
+void
+WASM_EXPORT(spy_strbuilder_free)(spy_StrBuilder *sb);
+
+#endif /* SPY_STRBUILDER_H */
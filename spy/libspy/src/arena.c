@@ -0,0 +1,108 @@
+#include "spy.h"
+
+// see the big comment in spy/arena.h
+
+typedef struct spy_ArenaChunk {
+    struct spy_ArenaChunk *next;
+    size_t size;    // size of data
+    size_t pos;     // first free byte in data
+    char data[];
+} spy_ArenaChunk;
+
+typedef struct {
+    spy_ArenaChunk *chunk;
+    size_t pos;
+    size_t used;
+} spy_ArenaMark;
+
+#define SPY_ARENA_CHUNK_SIZE (64 * 1024)
+#define SPY_ARENA_ALIGN 8
+
+int32_t spy_arena_depth = 0;
+
+// the first chunk is never freed, and the chunks after 'current' are kept
+// around to be reused
+static spy_ArenaChunk *first = NULL;
+static spy_ArenaChunk *current = NULL;
+static size_t used = 0;
+static spy_ArenaMark marks[SPY_ARENA_MAX_DEPTH];
+
+static spy_ArenaChunk *
+new_chunk(size_t size) {
+    if (size < SPY_ARENA_CHUNK_SIZE)
+        size = SPY_ARENA_CHUNK_SIZE;
+    spy_ArenaChunk *chunk = malloc(sizeof(spy_ArenaChunk) + size);
+    if (chunk == NULL) {
+        spy_panic("out of memory");
+        return NULL;
+    }
+    chunk->next = NULL;
+    chunk->size = size;
+    chunk->pos = 0;
+    return chunk;
+}
+
+void *
+spy_arena_alloc(size_t size) {
+    size = (size + SPY_ARENA_ALIGN - 1) & ~(size_t)(SPY_ARENA_ALIGN - 1);
+    if (current->size - current->pos < size) {
+        // move to the next chunk, if it's big enough, else insert a new one
+        spy_ArenaChunk *next = current->next;
+        if (next == NULL || next->size < size) {
+            spy_ArenaChunk *chunk = new_chunk(size);
+            chunk->next = next;
+            current->next = chunk;
+            next = chunk;
+        }
+        next->pos = 0;
+        current = next;
+    }
+    void *p = current->data + current->pos;
+    current->pos += size;
+    used += size;
+    return p;
+}
+
+void
+WASM_EXPORT(spy_arena_push)(void) {
+    if (spy_arena_depth == SPY_ARENA_MAX_DEPTH) {
+        spy_panic("too many nested arenas");
+        return;
+    }
+    if (first == NULL) {
+        first = new_chunk(SPY_ARENA_CHUNK_SIZE);
+        current = first;
+    }
+    marks[spy_arena_depth] = (spy_ArenaMark){current, current->pos, used};
+    spy_arena_depth++;
+}
+
+void
+WASM_EXPORT(spy_arena_pop)(void) {
+    if (spy_arena_depth == 0) {
+        spy_panic("spy_arena_pop without a corresponding spy_arena_push");
+        return;
+    }
+    spy_arena_depth--;
+    spy_ArenaMark *mark = &marks[spy_arena_depth];
+    current = mark->chunk;
+    current->pos = mark->pos;
+    used = mark->used;
+}
+
+bool
+WASM_EXPORT(spy_arena_contains)(const void *p) {
+    // we look also into the chunks after 'current': p might point to an
+    // object of an arena which has already been popped
+    for(spy_ArenaChunk *chunk = first; chunk != NULL; chunk = chunk->next) {
+        const char *data = chunk->data;
+        if ((const char *)p >= data && (const char *)p < data + chunk->size)
+            return true;
+    }
+    return false;
+}
+
+int32_t
+WASM_EXPORT(spy_arena_used_bytes)(void) {
+    return (int32_t)used;
+}
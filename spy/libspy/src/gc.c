@@ -0,0 +1,249 @@
+#include <time.h>
+#include "spy.h"
+
+// see the big comment in spy/gc.h
+
+typedef struct spy_GcHeader {
+    struct spy_GcHeader *prev;
+    struct spy_GcHeader *next;
+    size_t size;           // size of the payload, as requested by the user
+    int32_t sizeclass;     // -1 for big objects
+    int32_t marked;
+    spy_GcTraceFn trace;   // NULL for leaves
+} spy_GcHeader;
+
+#define SPY_GC_MIN_SIZE 16
+#define SPY_GC_NUM_SIZECLASSES 8    // 16, 32, ..., 2048
+#define SPY_GC_MIN_THRESHOLD (1024 * 1024)
+
+spy_GcFrame *spy_gc_top = NULL;
+
+// list of all the allocated objects
+static spy_GcHeader *all_objects = NULL;
+// free lists, linked through the 'next' field
+static spy_GcHeader *free_lists[SPY_GC_NUM_SIZECLASSES] = {NULL};
+
+static size_t live_bytes = 0;
+static size_t allocated_since_gc = 0;
+static size_t threshold = SPY_GC_MIN_THRESHOLD;
+
+static int32_t n_collections = 0;
+static int64_t pause_ns = 0;
+
+static int32_t
+get_sizeclass(size_t size) {
+    size_t clsize = SPY_GC_MIN_SIZE;
+    for(int32_t i=0; i<SPY_GC_NUM_SIZECLASSES; i++) {
+        if (size <= clsize)
+            return i;
+        clsize *= 2;
+    }
+    return -1;
+}
+
+static size_t
+sizeclass_size(int32_t sizeclass) {
+    return (size_t)SPY_GC_MIN_SIZE << sizeclass;
+}
+
+static int64_t
+now_ns(void) {
+    struct timespec ts;
+    clock_gettime(CLOCK_MONOTONIC, &ts);
+    return (int64_t)ts.tv_sec * 1000000000 + ts.tv_nsec;
+}
+
+static void
+free_object(spy_GcHeader *hdr) {
+    // unlink from all_objects
+    if (hdr->prev)
+        hdr->prev->next = hdr->next;
+    else
+        all_objects = hdr->next;
+    if (hdr->next)
+        hdr->next->prev = hdr->prev;
+    live_bytes -= hdr->size;
+    //
+    if (hdr->sizeclass < 0) {
+        free(hdr);
+    }
+    else {
+        hdr->next = free_lists[hdr->sizeclass];
+        free_lists[hdr->sizeclass] = hdr;
+    }
+}
+
+static int
+cmp_ptr(const void *a, const void *b) {
+    uintptr_t x = (uintptr_t)*(void **)a;
+    uintptr_t y = (uintptr_t)*(void **)b;
+    return (x > y) - (x < y);
+}
+
+// state of the current collection: the sorted array of all the objects, and
+// the objects which have been marked but not traced yet
+static spy_GcHeader **objects = NULL;
+static size_t n_objects = 0;
+static spy_GcHeader **worklist = NULL;
+static size_t n_worklist = 0;
+
+static void
+mark(void *p) {
+    // p might also point to something which was not allocated by us, e.g. a
+    // prebuilt string literal: in that case, we simply ignore it
+    if (p == NULL)
+        return;
+    spy_GcHeader *key = (spy_GcHeader *)p - 1;
+    spy_GcHeader **found = bsearch(&key, objects, n_objects,
+                                   sizeof(spy_GcHeader *), cmp_ptr);
+    if (found == NULL || (*found)->marked)
+        return;
+    (*found)->marked = 1;
+    worklist[n_worklist++] = *found;
+}
+
+static void
+collect(void) {
+    int64_t start = now_ns();
+    n_collections++;
+
+    size_t n = 0;
+    for(spy_GcHeader *hdr = all_objects; hdr != NULL; hdr = hdr->next)
+        n++;
+    if (n > 0) {
+        objects = malloc(n * sizeof(spy_GcHeader *));
+        worklist = malloc(n * sizeof(spy_GcHeader *));
+        if (objects == NULL || worklist == NULL) {
+            // we cannot collect: just keep everything alive
+            free(objects);
+            free(worklist);
+            objects = worklist = NULL;
+            pause_ns += now_ns() - start;
+            return;
+        }
+    }
+    size_t i = 0;
+    for(spy_GcHeader *hdr = all_objects; hdr != NULL; hdr = hdr->next)
+        objects[i++] = hdr;
+    n_objects = n;
+    n_worklist = 0;
+    if (n > 0)
+        qsort(objects, n, sizeof(spy_GcHeader *), cmp_ptr);
+
+    // mark: start from the roots, then follow the references of the traced
+    // objects
+    for(spy_GcFrame *f = spy_gc_top; f != NULL; f = f->prev)
+        for(int32_t j=0; j<f->n; j++)
+            mark(*f->roots[j]);
+    while (n_worklist > 0) {
+        spy_GcHeader *hdr = worklist[--n_worklist];
+        if (hdr->trace != NULL)
+            hdr->trace((void *)(hdr + 1), mark);
+    }
+
+    // sweep: free all the objects which were not marked
+    spy_GcHeader *hdr = all_objects;
+    while (hdr != NULL) {
+        spy_GcHeader *next = hdr->next;
+        if (hdr->marked)
+            hdr->marked = 0;
+        else
+            free_object(hdr);
+        hdr = next;
+    }
+    free(objects);
+    free(worklist);
+    objects = worklist = NULL;
+    n_objects = 0;
+
+    allocated_since_gc = 0;
+    threshold = live_bytes > SPY_GC_MIN_THRESHOLD ?
+        live_bytes : SPY_GC_MIN_THRESHOLD;
+    pause_ns += now_ns() - start;
+}
+
+spy_GcRef
+spy_GcAllocTraced(size_t size, spy_GcTraceFn trace) {
+    if (spy_arena_depth > 0)
+        return (spy_GcRef){spy_arena_alloc(size)};
+    return spy_GcAllocTracedNoArena(size, trace);
+}
+
+spy_GcRef
+spy_GcAllocTracedNoArena(size_t size, spy_GcTraceFn trace) {
+    // we can collect only if there is a shadow stack, see gc.h. Moreover,
+    // we cannot collect inside an arena, because the GC doesn't see the
+    // references from the arena objects, see arena.h
+    if (spy_gc_top != NULL && spy_arena_depth == 0 &&
+        allocated_since_gc >= threshold)
+        collect();
+
+    int32_t sizeclass = get_sizeclass(size);
+    spy_GcHeader *hdr;
+    if (sizeclass >= 0 && free_lists[sizeclass] != NULL) {
+        hdr = free_lists[sizeclass];
+        free_lists[sizeclass] = hdr->next;
+    }
+    else {
+        size_t n = sizeclass >= 0 ? sizeclass_size(sizeclass) : size;
+        hdr = malloc(sizeof(spy_GcHeader) + n);
+        if (hdr == NULL) {
+            spy_panic("out of memory");
+            return (spy_GcRef){NULL};
+        }
+    }
+    hdr->size = size;
+    hdr->sizeclass = sizeclass;
+    hdr->marked = 0;
+    hdr->trace = trace;
+    hdr->prev = NULL;
+    hdr->next = all_objects;
+    if (all_objects)
+        all_objects->prev = hdr;
+    all_objects = hdr;
+
+    live_bytes += size;
+    allocated_since_gc += size;
+    return (spy_GcRef){(void *)(hdr + 1)};
+}
+
+void
+WASM_EXPORT(spy_gc_collect)(void) {
+    // without a shadow stack we don't know the roots: in particular, the
+    // host might be holding references to objects (e.g. the W_Strs of the
+    // interpreter), which we would free under its feet
+    if (spy_gc_top == NULL)
+        return;
+    collect();
+}
+
+void
+spy_GcFree(void *p) {
+    // arena objects are freed only by spy_arena_pop. Note that we cannot
+    // look at spy_arena_depth: an object allocated inside an arena might be
+    // freed after the pop, and vice versa
+    if (spy_arena_contains(p))
+        return;
+    spy_GcHeader *hdr = (spy_GcHeader *)p - 1;
+    free_object(hdr);
+}
+
+void
+WASM_EXPORT(spy_gc_reset_shadow_stack)(void) {
+    spy_gc_top = NULL;
+}
+
+int32_t
+WASM_EXPORT(spy_gc_collections)(void) {
+    return n_collections;
+}
+
+int32_t
+WASM_EXPORT(spy_gc_live_bytes)(void) {
+    return (int32_t)live_bytes;
+}
+
+int64_t
+WASM_EXPORT(spy_gc_pause_ns)(void) {
+    return pause_ns;
+}
@@ -6,9 +6,57 @@ spy_str_alloc(size_t length) {
     size_t size = sizeof(spy_Str) + length;
     spy_Str *res = (spy_Str*)spy_GcAlloc(size).p;
     res->length = length;
+    res->utf8 = res->data;
+    res->parent = NULL;
     return res;
 }
 
+static void
+trace_view(void *obj, spy_GcVisitFn visit) {
+    spy_Str *s = (spy_Str *)obj;
+    visit(s->parent);
+}
+
+static spy_Str *
+str_view(spy_Str *s, size_t start, size_t length) {
+    // views always point to the string which owns the data, so that we
+    // never have chains of views
+    spy_Str *parent = s->parent != NULL ? s->parent : s;
+    const char *utf8 = s->utf8 + start;
+    // this might trigger a collection: s is kept alive by the caller
+    spy_Str *res = (spy_Str*)spy_GcAllocTraced(sizeof(spy_Str), trace_view).p;
+    res->length = length;
+    res->utf8 = utf8;
+    res->parent = parent;
+    return res;
+}
+
+// prebuilt strings for all the 1-byte strings, see spy_str_getitem
+static spy_Str single_bytes[256];
+static char single_bytes_data[256];
+static bool single_bytes_ready = false;
+
+static spy_Str *
+get_single_byte(char ch) {
+    if (!single_bytes_ready) {
+        for(int i=0; i<256; i++) {
+            single_bytes_data[i] = (char)i;
+            single_bytes[i].length = 1;
+            single_bytes[i].utf8 = &single_bytes_data[i];
+            single_bytes[i].parent = NULL;
+        }
+        single_bytes_ready = true;
+    }
+    return &single_bytes[(unsigned char)ch];
+}
+
+static spy_Str empty_str = {0, "", NULL};
+
+void
+spy_str_free(spy_Str *s) {
+    spy_GcFree(s);
+}
+
 spy_Str *
 spy_str_add(spy_Str *a, spy_Str *b) {
     size_t l = a->length + b->length;
@@ -35,6 +83,9 @@ bool
 spy_str_eq(spy_Str *a, spy_Str *b) {
     if (a->length != b->length)
         return false;
+    // fast path, e.g. for views of the same parent
+    if (a->utf8 == b->utf8)
+        return true;
     return memcmp(a->utf8, b->utf8, a->length) == 0;
 }
 
@@ -49,10 +100,35 @@ spy_str_getitem(spy_Str *s, int32_t i) {
         spy_panic("string index out of bound");
         return NULL;
     }
-    spy_Str *res = spy_str_alloc(1);
-    char *buf = (char*)res->utf8;
-    buf[0] = s->utf8[i];
-    return res;
+    return get_single_byte(s->utf8[i]);
+}
+
+static int32_t
+clamp_index(int32_t i, int32_t length) {
+    if (i < 0) {
+        i += length;
+        if (i < 0)
+            i = 0;
+    }
+    else if (i > length) {
+        i = length;
+    }
+    return i;
+}
+
+spy_Str *
+spy_str_slice(spy_Str *s, int32_t start, int32_t stop) {
+    int32_t l = (int32_t)s->length;
+    start = clamp_index(start, l);
+    stop = clamp_index(stop, l);
+    if (stop <= start)
+        return &empty_str;
+    int32_t n = stop - start;
+    if (n == 1)
+        return get_single_byte(s->utf8[start]);
+    if (n == l)
+        return s; // strings are immutable
+    return str_view(s, start, n);
 }
 
 // XXX probably it would be better to implement it directly, instead of
@@ -0,0 +1,88 @@
+#include "spy.h"
+
+#define SPY_STRBUILDER_MIN_CAPACITY 16
+
+static void
+trace_strbuilder(void *obj, spy_GcVisitFn visit) {
+    spy_StrBuilder *sb = (spy_StrBuilder *)obj;
+    visit(sb->buf);
+}
+
+spy_StrBuilder *
+spy_builtins$StrBuilder_new(void) {
+    size_t size = sizeof(spy_StrBuilder);
+    spy_StrBuilder *sb =
+        (spy_StrBuilder *)spy_GcAllocTraced(size, trace_strbuilder).p;
+    sb->length = 0;
+    sb->capacity = 0;
+    sb->buf = NULL;
+    return sb;
+}
+
+static void
+strbuilder_reserve(spy_StrBuilder *sb, size_t extra) {
+    size_t needed = sb->length + extra;
+    if (needed <= sb->capacity)
+        return;
+    size_t capacity = sb->capacity * 2;
+    if (capacity < needed)
+        capacity = needed;
+    if (capacity < SPY_STRBUILDER_MIN_CAPACITY)
+        capacity = SPY_STRBUILDER_MIN_CAPACITY;
+    // this might trigger a collection, but the old buf is still reachable
+    // through sb. If sb lives in the GC heap, buf must live there too even
+    // if we are inside an arena, else sb would point to freed memory after
+    // spy_arena_pop
+    char *buf;
+    if (spy_arena_contains(sb))
+        buf = (char *)spy_GcAlloc(capacity).p;
+    else
+        buf = (char *)spy_GcAllocTracedNoArena(capacity, NULL).p;
+    if (sb->buf != NULL) {
+        memcpy(buf, sb->buf, sb->length);
+        spy_GcFree(sb->buf);
+    }
+    sb->buf = buf;
+    sb->capacity = capacity;
+}
+
+void
+spy_builtins$StrBuilder_append(spy_StrBuilder *sb, spy_Str *s) {
+    strbuilder_reserve(sb, s->length);
+    memcpy(sb->buf + sb->length, s->utf8, s->length);
+    sb->length += s->length;
+}
+
+void
+spy_builtins$StrBuilder_append_i32(spy_StrBuilder *sb, int32_t x) {
+    // 11 chars are enough for "-2147483648"
+    char tmp[11];
+    int n = 0;
+    uint32_t u = x < 0 ? -(uint32_t)x : (uint32_t)x;
+    do {
+        tmp[n++] = '0' + (u % 10);
+        u /= 10;
+    } while (u != 0);
+    if (x < 0)
+        tmp[n++] = '-';
+    strbuilder_reserve(sb, n);
+    char *p = sb->buf + sb->length;
+    for(int i=0; i<n; i++)
+        p[i] = tmp[n-1-i];
+    sb->length += n;
+}
+
+spy_Str *
+spy_builtins$StrBuilder_build(spy_StrBuilder *sb) {
+    spy_Str *res = spy_str_alloc(sb->length);
+    if (sb->length > 0)
+        memcpy((char *)res->utf8, sb->buf, sb->length);
+    return res;
+}
+
+void
+spy_strbuilder_free(spy_StrBuilder *sb) {
+    if (sb->buf != NULL)
+        spy_GcFree(sb->buf);
+    spy_GcFree(sb);
+}
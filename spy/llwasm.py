@@ -13,6 +13,12 @@ It is called 'LL' for two reasons:
 
 from typing import Any, Optional, Literal
 from typing_extensions import Self
+import os
+import ctypes
+import hashlib
+import platform
+import re
+from importlib.metadata import version
 import py.path
 import wasmtime as wt
 import struct
@@ -20,13 +26,74 @@ import struct
 LLWasmType = Literal[None, 'void *', 'int32_t', 'int16_t']
 ENGINE = wt.Engine()
 
+def get_default_cache_dir() -> Optional[py.path.local]:
+    """
+    Return the directory where to store the compiled WASM modules.
+
+    It can be overridden by setting SPY_WASM_CACHE: if it's the empty
+    string, the cache is disabled.
+    """
+    d = os.environ.get('SPY_WASM_CACHE')
+    if d is None:
+        xdg = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+        d = os.path.join(xdg, 'spy', 'wasm')
+    if d == '':
+        return None
+    return py.path.local(d)
+
+# the cache key must change whenever the compiled code might be incompatible:
+# wasmtime refuses to deserialize modules produced by a different version,
+# but it's better to never even try
+WASMTIME_VERSION = version('wasmtime')
+CACHE_DIR = get_default_cache_dir()
+
 class LLWasmModule:
+    """
+    A compiled WASM module.
+
+    Compiling with Cranelift is slow, so the native code is serialized into
+    CACHE_DIR, keyed by the hash of the .wasm content and the wasmtime
+    version. Note that wasmtime trusts the content of the cache blindly, so
+    CACHE_DIR must not be writable by other users.
+    """
     f: py.path.local
     mod: wt.Module
+    from_cache: bool
 
     def __init__(self, f: py.path.local) -> None:
         self.f = f
-        self.mod = wt.Module.from_file(ENGINE, str(f))
+        self.from_cache = False
+        if CACHE_DIR is None:
+            self.mod = wt.Module.from_file(ENGINE, str(f))
+        else:
+            self.mod = self._load_cached(CACHE_DIR)
+
+    def _load_cached(self, cache_dir: py.path.local) -> wt.Module:
+        wasm = self.f.read_binary()
+        h = hashlib.sha256(wasm)
+        h.update(f'{WASMTIME_VERSION} {platform.machine()}'.encode('ascii'))
+        cached = cache_dir.join(h.hexdigest() + '.cwasm')
+        if cached.check(file=True):
+            # NOTE: we don't use deserialize_file, because it mmaps the file
+            # and we would crash if somebody truncated it later
+            try:
+                mod = wt.Module.deserialize(ENGINE, cached.read_binary())
+                self.from_cache = True
+                return mod
+            except wt.WasmtimeError:
+                # corrupted or incompatible: recompile and overwrite it
+                pass
+        mod = wt.Module(ENGINE, wasm)
+        try:
+            cache_dir.ensure(dir=True)
+            # write to a temp file and rename, so that concurrent processes
+            # never see a partially written module
+            tmp = cache_dir.join(f'{cached.basename}.{os.getpid()}.tmp')
+            tmp.write_binary(mod.serialize())
+            tmp.rename(cached)
+        except OSError:
+            pass
+        return mod
 
     def __repr__(self) -> str:
         return f'<LLWasmModule {self.f}>'
@@ -114,6 +181,7 @@ class LLWasmInstance:
     f: py.path.local
     store: wt.Store
     instance: wt.Instance
+    exports: Any  # wasmtime._instance.InstanceExports, which is not public
     mem: 'LLWasmMemory'
 
     def __init__(self, llmod: LLWasmModule,
@@ -127,7 +195,9 @@ class LLWasmInstance:
             hostmods = hostmods
         )
         self.instance = linker.instantiate(self.store, self.llmod.mod)
-        memory = self.instance.exports(self.store).get('memory')
+        # instance.exports() builds a new object every time: compute it once
+        self.exports = self.instance.exports(self.store)
+        memory = self.exports.get('memory')
         assert isinstance(memory, wt.Memory)
         self.mem = LLWasmMemory(self.store, memory)
         for hostmod in hostmods:
@@ -140,15 +210,13 @@ class LLWasmInstance:
         return cls(llmod, hostmods)
 
     def get_export(self, name: str) -> Any:
-        exports = self.instance.exports(self.store)
-        wasm_obj = exports.get(name)
+        wasm_obj = self.exports.get(name)
         if wasm_obj is None:
             raise AttributeError(name)
         return wasm_obj
 
     def all_exports(self) -> Any:
-        exports = self.instance.exports(self.store)
-        return list(exports._extern_map)
+        return list(self.exports._extern_map)
 
     def call(self, name: str, *args: Any) -> Any:
         func = self.get_export(name)
@@ -202,45 +270,90 @@ class LLWasmInstance:
 
 class LLWasmMemory:
     """
-    Thin wrapper around wt.Memory
+    Thin wrapper around wt.Memory.
+
+    Instead of going through wt.Memory.read/write, which do a roundtrip to
+    wasmtime and allocate a new bytearray every time, we access the linear
+    memory directly through a memoryview (see get_view).
     """
     store: wt.Store
     mem: wt.Memory
+    _view: memoryview
+    _view_len: int
+
+    NUL = re.compile(b'\x00')
 
     def __init__(self, store: wt.Store, mem: wt.Memory):
         self.store = store
         self.mem = mem
+        self._view = memoryview(b'')
+        self._view_len = -1
+
+    def get_view(self) -> memoryview:
+        """
+        Return a live, writable memoryview over the whole linear memory.
+
+        The memory can grow (and move) only when the WASM code calls
+        memory.grow, which changes its length: we check it every time and
+        recreate the view if needed.
+        """
+        n = self.mem.data_len(self.store)
+        if n != self._view_len:
+            ptr = self.mem.data_ptr(self.store)
+            addr = ctypes.addressof(ptr.contents)
+            buf = (ctypes.c_ubyte * n).from_address(addr)
+            self._view = memoryview(buf).cast('B')
+            self._view_len = n
+        return self._view
+
+    def grow_to(self, n: int) -> None:
+        """
+        Grow the memory so that it is at least n bytes long.
+        """
+        PAGE = 65536
+        cur = self.mem.data_len(self.store)
+        if n > cur:
+            self.mem.grow(self.store, (n - cur + PAGE - 1) // PAGE)
+
+    def view(self, addr: int, n: int) -> memoryview:
+        """
+        Return a zero-copy view of n bytes of memory at the given address.
+
+        The view is valid only until the memory grows, so it must not be
+        stored.
+
+        Raise IndexError if the range is outside the memory, instead of
+        silently returning a truncated slice.
+        """
+        view = self.get_view()
+        if addr < 0 or n < 0 or addr + n > len(view):
+            raise IndexError("index out of range")
+        return view[addr:addr+n]
 
     def read(self, addr: int, n: int) -> bytearray:
         """
         Read n bytes of memory at the given address.
         """
-        return self.mem.read(self.store, addr, addr+n)
+        return bytearray(self.view(addr, n))
 
     def read_i32(self, addr: int) -> int:
-        rawbytes = self.read(addr, 4)
-        return struct.unpack('i', rawbytes)[0]
+        return struct.unpack_from('i', self.get_view(), addr)[0]
 
     def read_i16(self, addr: int) -> int:
-        rawbytes = self.read(addr, 2)
-        return struct.unpack('h', rawbytes)[0]
+        return struct.unpack_from('h', self.get_view(), addr)[0]
 
     def read_i8(self, addr: int) -> int:
-        rawbytes = self.read(addr, 1)
-        return rawbytes[0]
+        return self.get_view()[addr]
 
     def read_cstr(self, addr: int) -> bytearray:
         """
         Read the NULL-terminated string starting at addr.
-
-        WARNING: this is inefficient because it creates a temporary bytearray
-        for every char To be faster we probably need to bypass wasmtime and
-        access directly the ctypes-based view of the memory.
         """
-        n = 0
-        while self.read_i8(addr + n) != 0:
-            n += 1
-        return self.read(addr, n)
+        view = self.get_view()
+        # re can search directly inside the buffer, without copying it
+        m = self.NUL.search(view, addr)
+        assert m is not None, 'unterminated string'
+        return bytearray(view[addr:m.start()])
 
     def write(self, addr: int, b: bytes) -> None:
-        self.mem.write(self.store, b, addr)
+        self.view(addr, len(b))[:] = b
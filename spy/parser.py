@@ -378,9 +378,28 @@ class Parser:
             assert False, f'Unexpected literal: {py_node.value}'
 
 
-    def from_py_expr_Subscript(self, py_node: py_ast.Subscript) -> spy.ast.GetItem:
+    # the default stop of a slice such as s[a:]: out-of-bound indexes are
+    # clamped, so this means "up to the end"
+    SLICE_END = 2**31 - 1
+
+    def from_py_expr_Subscript(self,
+                               py_node: py_ast.Subscript) -> spy.ast.Expr:
         value = self.from_py_expr(py_node.value)
-        index = self.from_py_expr(py_node.slice)
+        py_slice = py_node.slice
+        if isinstance(py_slice, py_ast.Slice):
+            if py_slice.step is not None:
+                self.unsupported(py_slice.step, 'slice steps')
+            if py_slice.lower is None:
+                start: spy.ast.Expr = spy.ast.Constant(py_slice.loc, 0)
+            else:
+                start = self.from_py_expr(py_slice.lower)
+            if py_slice.upper is None:
+                stop: spy.ast.Expr = spy.ast.Constant(py_slice.loc,
+                                                      self.SLICE_END)
+            else:
+                stop = self.from_py_expr(py_slice.upper)
+            return spy.ast.GetSlice(py_node.loc, value, start, stop)
+        index = self.from_py_expr(py_slice)
         return spy.ast.GetItem(py_node.loc, value, index)
 
     def from_py_expr_Attribute(self,
@@ -3,8 +3,9 @@ from spy.fqn import FQN
 from spy.errors import SPyTypeError
 from spy.vm.b import B
 from spy.fqn import FQN
+from spy.backend.c.wrapper import WasmFuncWrapper
 from spy.tests.support import (CompilerTest, skip_backends, no_backend,
-                               expect_errors, only_interp, no_C)
+                               expect_errors, only_interp, no_C, only_C)
 
 class TestBasic(CompilerTest):
 
@@ -815,3 +816,129 @@ class TestBasic(CompilerTest):
             ('Call not allowed here', 'inc()')
         )
         self.compile_raises(src, 'foo', errors)
+
+    @only_C
+    def test_call_many(self):
+        mod = self.compile("""
+        def add(x: i32, y: i32) -> i32:
+            return x + y
+
+        def greet(name: str) -> str:
+            return 'hello ' + name
+        """)
+        add = mod.add
+        assert add.call_many([(1, 2), (3, 4), (5, 6)]) == [3, 7, 11]
+        assert add.call_many([]) == []
+        greet = mod.greet
+        assert greet.call_many([('a',), ('b',)]) == ['hello a', 'hello b']
+        with pytest.raises(TypeError, match='expected 2 arguments, got 1'):
+            add.call_many([(1, 2), (3,)])
+
+    @only_C
+    def test_gc(self):
+        mod = self.compile("""
+        def make(n: i32) -> str:
+            s: str = ''
+            i: i32 = 0
+            while i < n:
+                s = 'ab' + str(i) + 'cd'
+                i = i + 1
+            return s
+
+        def loop(n: i32) -> str:
+            s: str = 'x'
+            i: i32 = 0
+            while i < n:
+                s = make(100) + s[0]
+                i = i + 1
+            return s
+        """)
+        assert mod.make(5) == 'ab4cd'
+        # without a GC, this would allocate ~100MB
+        assert mod.loop(20000) == 'ab99cda'
+        stats = mod.ll.gc_stats()
+        assert stats.collections > 0
+        assert stats.pause_ns > 0
+        assert 0 < stats.live_bytes < 10 * 1024 * 1024
+        assert len(mod.ll.mem.get_view()) < 32 * 1024 * 1024
+
+    @only_C
+    def test_gc_global(self):
+        # globals are not GC roots, so the C backend rejects them
+        src = """
+        var s: str = 'hello'
+
+        def foo() -> str:
+            return s
+        """
+        with pytest.raises(ValueError,
+                           match='global variables of type `str`'):
+            self.compile(src)
+
+    @only_C
+    def test_arena(self):
+        mod = self.compile("""
+        def greet(name: str) -> str:
+            return 'hello ' + name + '!'
+        """)
+        ll = mod.ll
+        greet = WasmFuncWrapper(self.vm, ll, mod.greet.c_name,
+                                mod.greet.w_functype, arena=True)
+        live_bytes = ll.gc_stats().live_bytes
+        assert greet('world') == 'hello world!'
+        assert greet.call_many([('a',), ('b',)]) == ['hello a!', 'hello b!']
+        assert ll.arena_used_bytes() == 0
+        assert ll.gc_stats().live_bytes == live_bytes
+
+    def test_StrBuilder(self):
+        mod = self.compile("""
+        def join_ints(n: i32) -> str:
+            sb: StrBuilder = StrBuilder()
+            i: i32 = 0
+            while i < n:
+                if i > 0:
+                    sb.append(',')
+                sb.append_i32(i - 2)
+                i = i + 1
+            return sb.build()
+
+        def empty() -> str:
+            sb: StrBuilder = StrBuilder()
+            return sb.build()
+        """)
+        assert mod.join_ints(5) == '-2,-1,0,1,2'
+        expected = ','.join([str(i - 2) for i in range(1000)])
+        assert mod.join_ints(1000) == expected
+        assert mod.empty() == ''
+
+    def test_StrBuilder_pass_to_function(self):
+        # StrBuilder is a reference type: the callee mutates the same builder
+        mod = self.compile("""
+        def add_greeting(sb: StrBuilder, name: str) -> void:
+            sb.append('hello ')
+            sb.append(name)
+
+        def greet() -> str:
+            sb: StrBuilder = StrBuilder()
+            add_greeting(sb, 'world')
+            sb.append('!')
+            return sb.build()
+        """)
+        assert mod.greet() == 'hello world!'
+
+    @only_C
+    def test_StrBuilder_gc(self):
+        # the buffer of the builder must survive the collections triggered by
+        # the temporary strings
+        mod = self.compile("""
+        def build(n: i32) -> str:
+            sb: StrBuilder = StrBuilder()
+            i: i32 = 0
+            while i < n:
+                sb.append(str(i))
+                i = i + 1
+            return sb.build()
+        """)
+        n = 200000
+        assert mod.build(n) == ''.join([str(i) for i in range(n)])
+        assert mod.ll.gc_stats().collections > 0
@@ -0,0 +1,116 @@
+import pytest
+from spy.errors import SPyTypeError
+from spy.tests.support import CompilerTest, only_interp, expect_errors
+
+@only_interp
+class TestClosureCompiler(CompilerTest):
+
+    def test_compiled_once(self):
+        mod = self.compile("""
+        def foo(x: i32) -> i32:
+            return x + 1
+        """)
+        assert self.vm.closure_compile
+        w_foo = self.w_mod.getattr_astfunc('foo')
+        assert w_foo._compiled is None
+        assert mod.foo(1) == 2
+        code = w_foo._compiled
+        assert code is not None
+        assert mod.foo(2) == 3
+        assert w_foo._compiled is code
+
+    def test_stubs_are_replaced(self):
+        mod = self.compile("""
+        def foo(x: i32) -> i32:
+            if x == 0:
+                return 100
+            return x
+        """)
+        assert mod.foo(0) == 100
+        w_foo = self.w_mod.getattr_astfunc('foo')
+        code = w_foo.get_compiled(self.vm)
+        # the `if` has been compiled, the last `return` not yet
+        if_fn, ret_fn = code.body
+        assert if_fn.__name__ == 'exec_If'
+        assert ret_fn.__name__ == 'stub'
+        assert mod.foo(5) == 5
+        assert code.body[1].__name__ != 'stub'
+
+    def test_errors_are_still_lazy(self):
+        mod = self.compile("""
+        def foo(flag: bool) -> i32:
+            if flag:
+                return 'hello'
+            return 42
+        """)
+        assert mod.foo(False) == 42
+        errors = expect_errors(
+            'mismatched types',
+            ('expected `i32`, got `str`', "'hello'"),
+        )
+        with errors:
+            mod.foo(True)
+
+    def test_ASTFrame_mode(self):
+        self.vm.closure_compile = False
+        mod = self.compile("""
+        def foo(x: i32) -> i32:
+            return x * 2
+        """)
+        assert mod.foo(21) == 42
+        w_foo = self.w_mod.getattr_astfunc('foo')
+        assert w_foo._compiled is None
+
+    def test_loop_and_closure(self):
+        mod = self.compile("""
+        @blue
+        def make_adder(n: i32) -> dynamic:
+            def adder(x: i32) -> i32:
+                i = 0
+                while i < n:
+                    x = x + 1
+                    i = i + 1
+                return x
+            return adder
+
+        def foo(x: i32) -> i32:
+            return make_adder(3)(x) + make_adder(5)(x)
+        """)
+        assert mod.foo(10) == 28
+
+    def test_typechecker_is_shared(self):
+        mod = self.compile("""
+        def foo(x: i32) -> i32:
+            y: i32 = x * 2
+            return y
+        """)
+        w_foo = self.w_mod.getattr_astfunc('foo')
+        assert mod.foo(1) == 2
+        t = w_foo.get_typechecker(self.vm)
+        assert w_foo.get_typechecker(self.vm) is t
+        # the ASTFrame mode reuses the same TypeChecker, and it's fine to
+        # re-execute the VarDef
+        self.vm.closure_compile = False
+        assert mod.foo(2) == 4
+        assert mod.foo(3) == 6
+        assert w_foo.get_typechecker(self.vm) is t
+
+    def test_global_changes_type(self):
+        mod = self.compile("""
+        var x: dynamic = 1
+
+        def get_double() -> dynamic:
+            return x + x
+
+        def set_x(val: dynamic) -> void:
+            x = val
+        """)
+        w_get_double = self.w_mod.getattr_astfunc('get_double')
+        assert mod.get_double() == 2
+        t = w_get_double.get_typechecker(self.vm)
+        mod.set_x(10)  # same type, no invalidation
+        assert mod.get_double() == 20
+        assert w_get_double.get_typechecker(self.vm) is t
+        mod.set_x('ab')
+        assert mod.get_double() == 'abab'
+        assert w_get_double.get_typechecker(self.vm) is not t
@@ -74,7 +74,7 @@ class TestAttrOp(CompilerTest):
                 return W_OpImpl.simple(vm.wrap_func(fn))
 
             @staticmethod
-            def op_SETATTR(vm: 'SPyVM', wv_obj: W_OpImpl, wv_attr: W_Value,
+            def op_SETATTR(vm: 'SPyVM', wv_obj: W_Value, wv_attr: W_Value,
                            wv_v: W_Value) -> W_OpImpl:
                 attr = wv_attr.blue_unwrap_str(vm)
                 if attr == 'x':
@@ -29,8 +29,8 @@ class TestCallOp(CompilerTest):
                 return W_Adder(vm.unwrap_i32(w_x))
 
             @staticmethod
-            def op_CALL(vm: 'SPyVM', w_type: W_Type,
-                        w_argtypes: W_Dynamic) -> W_OpImpl:
+            def op_CALL(vm: 'SPyVM', wv_obj: W_Value,
+                        w_values: W_Dynamic) -> W_OpImpl:
                 @spy_builtin(QN('ext::call'))
                 def call(vm: 'SPyVM', w_obj: W_Adder, w_y: W_I32) -> W_I32:
                     y = vm.unwrap_i32(w_y)
@@ -130,7 +130,7 @@ class TestCallOp(CompilerTest):
                 return W_Calc(vm.unwrap_i32(w_x))
 
             @staticmethod
-            def op_CALL_METHOD(vm: 'SPyVM', wv_obj: W_Value, wv_method: W_Str,
+            def op_CALL_METHOD(vm: 'SPyVM', wv_obj: W_Value, wv_method: W_Value,
                                w_values: W_List[W_Value]) -> W_OpImpl:
                 meth = wv_method.blue_unwrap_str(vm)
                 if meth == 'add':
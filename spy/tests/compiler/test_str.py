@@ -2,7 +2,8 @@
 
 import pytest
 from spy.libspy import SPyPanicError
-from spy.tests.support import CompilerTest, skip_backends, no_backend
+from spy.tests.support import (CompilerTest, skip_backends, no_backend,
+                               only_interp)
 
 class TestStr(CompilerTest):
 
@@ -14,6 +15,18 @@ class TestStr(CompilerTest):
         """)
         assert mod.foo() == 'hello'
 
+    @only_interp
+    def test_literals_are_interned(self):
+        mod = self.compile(
+        """
+        def foo() -> str:
+            return 'hello'
+        """)
+        w_foo = mod.foo.w_func
+        w_a = self.vm.call(w_foo, [])
+        w_b = self.vm.call(w_foo, [])
+        assert w_a is w_b
+
     def test_unicode_chars(self):
         mod = self.compile(
         """
@@ -64,6 +77,32 @@ class TestStr(CompilerTest):
         with pytest.raises(SPyPanicError, match="string index out of bound"):
             mod.foo('ABCDE', -6)
 
+    def test_slice(self):
+        mod = self.compile(
+        """
+        def foo(a: str, i: i32, j: i32) -> str:
+            return a[i:j]
+
+        def head(a: str) -> str:
+            return a[:2]
+
+        def tail(a: str) -> str:
+            return a[-3:]
+
+        def eq_slice(a: str) -> bool:
+            return a[1:3] == 'BC'
+        """)
+        assert mod.foo('ABCDE', 1, 3) == 'BC'
+        assert mod.foo('ABCDE', 0, 5) == 'ABCDE'
+        assert mod.foo('ABCDE', 2, 3) == 'C'
+        assert mod.foo('ABCDE', 3, 1) == ''
+        assert mod.foo('ABCDE', -4, -1) == 'BCD'
+        assert mod.foo('ABCDE', -100, 100) == 'ABCDE'
+        assert mod.head('ABCDE') == 'AB'
+        assert mod.tail('ABCDE') == 'CDE'
+        assert mod.eq_slice('ABCDE')
+        assert not mod.eq_slice('XYZ')
+
     def test_compare(self):
         mod = self.compile(
         """
@@ -1,6 +1,7 @@
 # type: ignore
 
 import py
+import pytest
 ROOT = py.path.local(__file__).dirpath()
 
 def pytest_collection_modifyitems(session, config, items):
@@ -30,3 +31,29 @@ def pytest_collection_modifyitems(session, config, items):
             return 0   # don't touch
 
     items.sort(key=key)
+
+@pytest.fixture(scope='session', autouse=True)
+def wasm_cache_dir(tmp_path_factory):
+    """
+    Store the compiled WASM modules in a temporary directory instead of the
+    default ~/.cache/spy/wasm, so that the tests don't leave anything behind
+    in the home directory. The cache is still shared by all the tests of the
+    session.
+    """
+    import spy.llwasm
+    cache_dir = py.path.local(tmp_path_factory.mktemp('wasm-cache'))
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(spy.llwasm, 'CACHE_DIR', cache_dir)
+        yield cache_dir
+
+@pytest.fixture(scope='session', autouse=True)
+def cbuild_cache_dir(tmp_path_factory):
+    """
+    Same as wasm_cache_dir, but for the cache of the C builds, which is in
+    ~/.cache/spy/cbuild by default.
+    """
+    import spy.cbuild
+    cache_dir = py.path.local(tmp_path_factory.mktemp('cbuild-cache'))
+    with pytest.MonkeyPatch.context() as mp:
+        mp.setattr(spy.cbuild, 'BUILD_CACHE', spy.cbuild.BuildCache(cache_dir))
+        yield cache_dir
@@ -1,7 +1,8 @@
 from subprocess import getstatusoutput
 import pytest
 from spy.llwasm import LLWasmInstance
-from spy.cbuild import get_toolchain
+import spy.cbuild
+from spy.cbuild import get_toolchain, BuildCache
 from spy.tests.support import CTest
 
 class TestToolchain(CTest):
@@ -36,3 +37,44 @@ class TestToolchain(CTest):
             status, out = getstatusoutput(f"node {test_exe}")
         assert status == 0
         assert out == 'hello world\nhello debug'
+
+    def test_build_cache(self, monkeypatch):
+        cache = BuildCache(self.tmpdir.join('cache'))
+        monkeypatch.setattr(spy.cbuild, 'BUILD_CACHE', cache)
+        src = r"""
+        int add(int x, int y) {
+            return x+y;
+        }
+        """
+        test_wasm = self.compile(src, exports=['add'])
+        assert cache.stats.hits == 0
+        assert cache.stats.misses == 1
+        test_wasm.remove()
+        test_wasm = self.compile(src, exports=['add'])
+        assert cache.stats.hits == 1
+        ll = LLWasmInstance.from_file(test_wasm)
+        assert ll.call('add', 4, 8) == 12
+        #
+        # different flags or source: miss
+        self.compile(src, exports=[])
+        self.compile(src.replace('x+y', 'x-y'), exports=['add'])
+        assert cache.stats.hits == 1
+        assert cache.stats.misses == 3
+
+    def test_build_cache_cc_version(self, monkeypatch):
+        # upgrading the compiler must invalidate the cache
+        cache = BuildCache(self.tmpdir.join('cache'))
+        monkeypatch.setattr(spy.cbuild, 'BUILD_CACHE', cache)
+        src = r"""
+        int add(int x, int y) {
+            return x+y;
+        }
+        """
+        self.compile(src, exports=['add'])
+        self.compile(src, exports=['add'])
+        assert cache.stats.hits == 1
+        monkeypatch.setattr(spy.cbuild, 'get_cc_version',
+                            lambda cc: 'some other compiler 99.0')
+        self.compile(src, exports=['add'])
+        assert cache.stats.hits == 1
+        assert cache.stats.misses == 2
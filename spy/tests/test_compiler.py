@@ -0,0 +1,246 @@
+import asyncio
+import struct
+import textwrap
+import pytest
+from spy.vm.vm import SPyVM
+from spy.llwasm import LLWasmInstance
+from spy.compiler import (Compiler, BuildJob, BuildResult, ProgramCompiler,
+                          ToolchainType)
+from spy.backend.c.wrapper import NativeModuleWrapper
+
+class TestBuildMany:
+
+    @pytest.fixture(autouse=True)
+    def init(self, tmpdir):
+        self.tmpdir = tmpdir
+        tmpdir.join('mod.spy').write(textwrap.dedent("""
+        def add(x: i32, y: i32) -> i32:
+            return x + y
+        """))
+        self.vm = SPyVM()
+        self.vm.path.append(str(tmpdir))
+        self.vm.import_('mod')
+        self.vm.redshift()
+
+    def make_jobs(self) -> list[BuildJob]:
+        jobs = []
+        for opt_level in (0, 2):
+            builddir = self.tmpdir.join(f'build-O{opt_level}').ensure(dir=True)
+            jobs.append(BuildJob('mod', builddir, opt_level=opt_level))
+        # this fails, because the module doesn't exist
+        jobs.append(BuildJob('nonexistent', self.tmpdir))
+        return jobs
+
+    def check_results(self, jobs: list[BuildJob],
+                      results: list[BuildResult]) -> None:
+        assert [res.job for res in results] == jobs
+        res0, res1, res2 = results
+        for res in (res0, res1):
+            assert res.ok
+            assert res.output is not None
+            assert res.output.check(file=True)
+            assert res.cc_time > 0
+            ll = LLWasmInstance.from_file(res.output)
+            assert ll.call('spy_mod$add', 4, 8) == 12
+        assert res0.output != res1.output
+        assert not res2.ok
+        assert isinstance(res2.error, KeyError)
+
+    def test_build_many(self):
+        jobs = self.make_jobs()
+        results = Compiler.build_many(self.vm, jobs, max_jobs=2)
+        self.check_results(jobs, results)
+
+    def test_build_many_async(self):
+        jobs = self.make_jobs()
+        coro = Compiler.build_many_async(self.vm, jobs, max_jobs=2)
+        results = asyncio.run(coro)
+        self.check_results(jobs, results)
+
+    def test_build_many_cache_stats(self, monkeypatch):
+        import spy.cbuild
+        cache = spy.cbuild.BuildCache(self.tmpdir.join('cache'))
+        monkeypatch.setattr(spy.cbuild, 'BUILD_CACHE', cache)
+        jobs = []
+        for i in range(8):
+            builddir = self.tmpdir.join(f'build-{i}').ensure(dir=True)
+            jobs.append(BuildJob('mod', builddir, opt_level=i % 2))
+        results = Compiler.build_many(self.vm, jobs, max_jobs=4)
+        assert all(res.ok for res in results)
+        # the counters are updated concurrently, but no update is lost
+        assert cache.stats.hits + cache.stats.misses == 8
+
+    def test_same_output(self):
+        builddir = self.tmpdir.join('build').ensure(dir=True)
+        jobs = [
+            BuildJob('mod', builddir, opt_level=0),
+            BuildJob('mod', builddir, opt_level=2),
+        ]
+        with pytest.raises(ValueError, match='different builddir'):
+            Compiler.build_many(self.vm, jobs)
+
+
+class TestProgramCompiler:
+
+    @pytest.fixture(autouse=True)
+    def init(self, tmpdir):
+        self.tmpdir = tmpdir
+        self.builddir = tmpdir.join('build').ensure(dir=True)
+
+    def build(self, delta_src: str) -> ProgramCompiler:
+        self.tmpdir.join('delta.spy').write(textwrap.dedent(delta_src))
+        self.tmpdir.join('main.spy').write(textwrap.dedent("""
+        from delta import get_delta
+
+        def inc(x: i32) -> i32:
+            return x + get_delta()
+        """))
+        vm = SPyVM()
+        vm.path.append(str(self.tmpdir))
+        vm.import_('delta')
+        vm.import_('main')
+        vm.redshift()
+        pc = ProgramCompiler(vm, ['delta', 'main'], self.builddir)
+        self.file_wasm = pc.build('program')
+        return pc
+
+    def call_inc(self, x: int) -> int:
+        ll = LLWasmInstance.from_file(self.file_wasm)
+        return ll.call('spy_main$inc', x)
+
+    def test_incremental(self):
+        pc = self.build("""
+        def get_delta() -> i32:
+            return 10
+        """)
+        assert pc.recompiled == ['delta', 'main']
+        assert pc.relinked
+        assert self.call_inc(1) == 11
+        assert self.builddir.join('delta.h').check(file=True)
+        #
+        # nothing changed
+        pc = self.build("""
+        def get_delta() -> i32:
+            return 10
+        """)
+        assert pc.recompiled == []
+        assert not pc.relinked
+        #
+        # the body changed, but the header is the same
+        pc = self.build("""
+        def get_delta() -> i32:
+            return 20
+        """)
+        assert pc.recompiled == ['delta']
+        assert pc.relinked
+        assert self.call_inc(1) == 21
+        #
+        # the header changed: main must be recompiled too
+        pc = self.build("""
+        var y: i32 = 30
+
+        def get_delta() -> i32:
+            return y
+        """)
+        assert pc.recompiled == ['delta', 'main']
+        assert self.call_inc(1) == 31
+
+
+class TestNativeShared:
+
+    def test_shared_library(self, tmpdir):
+        tmpdir.join('mod.spy').write(textwrap.dedent("""
+        var x: i32 = 42
+
+        def add(a: i32, b: i32) -> i32:
+            return a + b
+
+        def half(a: f64) -> f64:
+            return a / 2.0
+
+        def is_pos(a: i32) -> bool:
+            return a > 0
+
+        def greet(name: str) -> str:
+            return 'hello ' + name
+        """))
+        vm = SPyVM()
+        vm.path.append(str(tmpdir))
+        vm.import_('mod')
+        vm.redshift()
+        compiler = Compiler(vm, 'mod', tmpdir)
+        file_so = compiler.cbuild(toolchain_type=ToolchainType.native,
+                                  shared=True)
+        assert file_so.ext == '.so'
+        mod = NativeModuleWrapper(vm, 'mod', file_so)
+        assert mod.add(4, 8) == 12
+        assert mod.half(5.0) == 2.5
+        assert mod.is_pos(1) is True
+        assert mod.is_pos(-1) is False
+        assert mod.greet('world') == 'hello world'
+        assert mod.greet('àèìòù') == 'hello àèìòù'
+        assert mod.x == 42
+        with pytest.raises(TypeError, match='expected 2 arguments, got 1'):
+            mod.add(1)
+
+    def test_shared_RawBuffer(self, tmpdir):
+        tmpdir.join('mod.spy').write(textwrap.dedent("""
+        from rawbuffer import RawBuffer, rb_alloc, rb_set_i32
+
+        def make_buf() -> RawBuffer:
+            buf: RawBuffer = rb_alloc(16)
+            rb_set_i32(buf, 0, 42)
+            rb_set_i32(buf, 4, 43)
+            rb_set_i32(buf, 8, 44)
+            rb_set_i32(buf, 12, 45)
+            return buf
+
+        def churn(n: i32) -> str:
+            s: str = ''
+            i: i32 = 0
+            while i < n:
+                s = 'ab' + str(i)
+                i = i + 1
+            return s
+        """))
+        vm = SPyVM()
+        vm.path.append(str(tmpdir))
+        vm.import_('mod')
+        vm.redshift()
+        compiler = Compiler(vm, 'mod', tmpdir)
+        file_so = compiler.cbuild(toolchain_type=ToolchainType.native,
+                                  shared=True)
+        mod = NativeModuleWrapper(vm, 'mod', file_so)
+        buf = mod.make_buf()
+        expected = struct.pack('iiii', 42, 43, 44, 45)
+        assert buf == expected
+        # the buffer is not referenced by anybody on the C side, so the
+        # collections triggered by churn() free it: the result must be a
+        # copy
+        assert mod.churn(200000) == 'ab199999'
+        assert buf == expected
+
+    def test_shared_unsupported_type(self, tmpdir):
+        tmpdir.join('mod.spy').write(textwrap.dedent("""
+        def make() -> StrBuilder:
+            return StrBuilder()
+        """))
+        vm = SPyVM()
+        vm.path.append(str(tmpdir))
+        vm.import_('mod')
+        vm.redshift()
+        compiler = Compiler(vm, 'mod', tmpdir)
+        file_so = compiler.cbuild(toolchain_type=ToolchainType.native,
+                                  shared=True)
+        mod = NativeModuleWrapper(vm, 'mod', file_so)
+        with pytest.raises(TypeError, match='Unsupported type for native'):
+            mod.make
+
+    def test_shared_wrong_toolchain(self, tmpdir):
+        tmpdir.join('mod.spy').write('def foo() -> void:\n    pass\n')
+        vm = SPyVM()
+        vm.path.append(str(tmpdir))
+        vm.import_('mod')
+        compiler = Compiler(vm, 'mod', tmpdir)
+        with pytest.raises(ValueError, match='only by the native toolchain'):
+            compiler.cbuild(shared=True)
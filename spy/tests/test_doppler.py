@@ -1,8 +1,10 @@
 import textwrap
 import pytest
 from spy import ast
+from spy.fqn import FQN
 from spy.vm.vm import SPyVM
 from spy.vm.function import W_ASTFunc
+from spy.doppler import can_redshift_forked
 from spy.backend.spy import SPyBackend, FQN_FORMAT
 from spy.util import print_diff
 
@@ -176,3 +178,97 @@ class TestDoppler:
         def foo() -> dynamic:
             return [1, 2, 7]
         """)
+
+    def test_redshift_worklist(self):
+        self.tmpdir.join('other.spy').write(textwrap.dedent("""
+        def bar() -> i32:
+            return 1
+        """))
+        self.vm.import_('other')
+        self.tmpdir.join('test.spy').write(textwrap.dedent("""
+        @blue
+        def make_fn():
+            def fn(x: i32) -> i32:
+                return x * 2
+            return fn
+
+        def foo() -> i32:
+            return make_fn()(21)
+        """))
+        self.vm.import_('test')
+        assert [str(fqn) for fqn in self.vm.redshift_worklist] == [
+            'other::bar', 'test::foo']
+        # redshift only 'test', including the closure discovered along the
+        # way
+        self.vm.redshift(modname='test')
+        assert [str(fqn) for fqn in self.vm.redshift_worklist] == [
+            'other::bar']
+        w_fn = self.vm.lookup_global(FQN.parse('test::fn#0'))
+        assert isinstance(w_fn, W_ASTFunc) and w_fn.redshifted
+        self.vm.redshift()
+        assert self.vm.redshift_worklist == []
+        w_bar = self.vm.lookup_global(FQN.parse('other::bar'))
+        assert isinstance(w_bar, W_ASTFunc) and w_bar.redshifted
+
+    @pytest.mark.skipif(not can_redshift_forked(), reason='fork not supported')
+    def test_redshift_workers(self):
+        src = """
+        @blue
+        def make_fn(n: i32):
+            def fn(x: i32) -> i32:
+                return x * n
+            return fn
+
+        def add(x: i32, y: i32) -> i32:
+            return x + y
+
+        def foo() -> i32:
+            z: i32 = add(1, 2) * 3
+            return z
+
+        def bar() -> i32:
+            return make_fn(2)(21)
+
+        def baz() -> i32:
+            return make_fn(3)(add(4, 5))
+        """
+        self.redshift(src)
+        expected = SPyBackend(self.vm, fqn_format='full').dump_mod('test')
+        #
+        self.vm = SPyVM()
+        self.vm.path.append(str(self.tmpdir))
+        self.vm.import_('test')
+        self.vm.redshift(workers=2)
+        assert self.vm.redshift_worklist == []
+        got = SPyBackend(self.vm, fqn_format='full').dump_mod('test')
+        assert got == expected
+
+    @pytest.mark.skipif(not can_redshift_forked(), reason='fork not supported')
+    def test_redshift_workers_side_effects(self):
+        src = """
+        var counter: i32 = 0
+
+        @blue
+        def incr(n: i32) -> i32:
+            counter = counter + n
+            return counter
+
+        def foo() -> i32:
+            return incr(1)
+
+        def bar() -> i32:
+            return incr(10)
+
+        def baz() -> i32:
+            return incr(1)
+        """
+        self.redshift(src)
+        expected = SPyBackend(self.vm, fqn_format='full').dump_mod('test')
+        #
+        self.vm = SPyVM()
+        self.vm.path.append(str(self.tmpdir))
+        self.vm.import_('test')
+        self.vm.redshift(workers=2)
+        assert self.vm.redshift_worklist == []
+        got = SPyBackend(self.vm, fqn_format='full').dump_mod('test')
+        assert got == expected
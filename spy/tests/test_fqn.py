@@ -73,3 +73,11 @@ def test_FQN_parse():
     assert fqn.modname == "aaa"
     assert fqn.attr == "bbb"
     assert fqn.suffix == "0"
+
+def test_FQN_interned():
+    a = FQN.make("aaa", "bbb", suffix="0")
+    b = FQN.parse("aaa::bbb#0")
+    c = FQN.make("aaa", "bbb", suffix="1")
+    assert a is b
+    assert a is not c
+    assert FQN.make_global("aaa", "bbb") is FQN.parse("aaa::bbb")
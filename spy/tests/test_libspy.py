@@ -1,21 +1,9 @@
-import struct
 import pytest
 from spy.llwasm import LLWasmModule
 from spy.libspy import LLSPyInstance, SPyPanicError
+from spy.vm.str import ll_spy_Str_read
 from spy.tests.support import CTest
 
-def mk_spy_Str(utf8: bytes) -> bytes:
-    """
-    Return the spy_Str representation of the given utf8 bytes.
-
-    For example, for b'hello' we have the following in-memory repr:
-         <i   4 bytes of length, little endian
-         5s   5 bytes of data (b'hello')
-    """
-    n = len(utf8)
-    fmt = f'<i{n}s'
-    return struct.pack(fmt, n, utf8)
-
 class TestLibSPy(CTest):
 
     def test_walloc(self):
@@ -57,13 +45,13 @@ class TestLibSPy(CTest):
         test_wasm = self.compile(src, exports=['H', 'mk_W'])
         ll = LLSPyInstance.from_file(test_wasm)
         ptr_H = ll.read_global('H')
-        assert ll.mem.read(ptr_H, 10) == mk_spy_Str(b'hello ')
+        assert ll_spy_Str_read(ll, ptr_H) == b'hello '
         #
         ptr_W = ll.call('mk_W')
-        assert ll.mem.read(ptr_W, 9) == mk_spy_Str(b'world')
+        assert ll_spy_Str_read(ll, ptr_W) == b'world'
         #
         ptr_HW = ll.call('spy_str_add', ptr_H, ptr_W)
-        assert ll.mem.read(ptr_HW, 15) == mk_spy_Str(b'hello world')
+        assert ll_spy_Str_read(ll, ptr_HW) == b'hello world'
 
     def test_debug_log(self):
         src = r"""
@@ -92,3 +80,99 @@ class TestLibSPy(CTest):
         ll = LLSPyInstance.from_file(test_wasm)
         with pytest.raises(SPyPanicError, match="don't panic!"):
             ll.call('crash')
+
+    def test_arena(self):
+        src = r"""
+        #include <spy.h>
+
+        spy_Str *mk_W(void) {
+            spy_Str *s = spy_str_alloc(5);
+            memcpy((void*)s->utf8, "world", 5);
+            return s;
+        }
+        """
+        test_wasm = self.compile(src, exports=['mk_W'])
+        ll = LLSPyInstance.from_file(test_wasm)
+        live_bytes = ll.gc_stats().live_bytes
+        ll.arena_push()
+        p1 = ll.call('mk_W')
+        used1 = ll.arena_used_bytes()
+        assert used1 > 0
+        ll.arena_push()
+        p2 = ll.call('mk_W')
+        assert ll.arena_used_bytes() > used1
+        ll.arena_pop()
+        assert ll.arena_used_bytes() == used1
+        # the memory of the popped arena is reused
+        p3 = ll.call('mk_W')
+        assert p3 == p2
+        assert ll_spy_Str_read(ll, p1) == b'world'
+        ll.arena_pop()
+        assert ll.arena_used_bytes() == 0
+        # nothing was allocated in the GC heap
+        assert ll.gc_stats().live_bytes == live_bytes
+        with pytest.raises(SPyPanicError, match='without a corresponding'):
+            ll.arena_pop()
+
+    def test_arena_strbuilder(self):
+        src = r"""
+        #include <spy.h>
+
+        spy_Str *mk_W(void) {
+            spy_Str *s = spy_str_alloc(5);
+            memcpy((void*)s->utf8, "world", 5);
+            return s;
+        }
+
+        void clobber(void) {
+            char *p = spy_GcAlloc(256).p;
+            memset(p, 'X', 256);
+        }
+        """
+        test_wasm = self.compile(src, exports=[
+            'mk_W', 'clobber', 'spy_builtins$StrBuilder_new',
+            'spy_builtins$StrBuilder_append', 'spy_builtins$StrBuilder_build',
+            'spy_strbuilder_free'])
+        ll = LLSPyInstance.from_file(test_wasm)
+        live_bytes = ll.gc_stats().live_bytes
+        # the builder is created outside the arena and grows inside it
+        sb = ll.call('spy_builtins$StrBuilder_new')
+        ll.arena_push()
+        p = ll.call('mk_W')
+        assert ll.arena_contains(p)
+        ll.call('spy_builtins$StrBuilder_append', sb, p)
+        ll.call('spy_builtins$StrBuilder_append', sb, p)
+        ll.arena_pop()
+        # reuse the memory of the popped arena
+        ll.arena_push()
+        ll.call('clobber')
+        ll.arena_pop()
+        # the buffer of the builder was not allocated in the arena
+        p2 = ll.call('spy_builtins$StrBuilder_build', sb)
+        assert ll_spy_Str_read(ll, p2) == b'worldworld'
+        # freeing an arena object is a no-op, also after the pop
+        ll.call('spy_str_free', p)
+        ll.call('spy_str_free', p2)
+        ll.call('spy_strbuilder_free', sb)
+        assert ll.gc_stats().live_bytes == live_bytes
+
+    def test_gc_collect_without_frames(self):
+        src = r"""
+        #include <spy.h>
+
+        spy_Str *mk_W(void) {
+            spy_Str *s = spy_str_alloc(5);
+            memcpy((void*)s->utf8, "world", 5);
+            return s;
+        }
+        """
+        test_wasm = self.compile(src, exports=['mk_W'])
+        ll = LLSPyInstance.from_file(test_wasm)
+        p = ll.call('mk_W')
+        live_bytes = ll.gc_stats().live_bytes
+        # the host doesn't push any frame, so we don't know the roots: the
+        # string is still referenced by us and must not be freed
+        ll.call('spy_gc_collect')
+        assert ll.gc_stats().collections == 0
+        assert ll.gc_stats().live_bytes == live_bytes
+        assert ll_spy_Str_read(ll, p) == b'world'
@@ -56,6 +56,21 @@ class TestLLWasm(CTest):
         assert ll.mem.read_i32(ptr) == 100
         assert ll.mem.read_i32(ptr+4) == 200
 
+    def test_mem_out_of_bounds(self):
+        src = r"""
+        const char *hello = "hello";
+        """
+        test_wasm = self.compile(src, exports=['hello'])
+        ll = LLWasmInstance.from_file(test_wasm)
+        n = len(ll.mem.get_view())
+        assert ll.mem.read(n-4, 4) == bytearray(4)
+        with pytest.raises(IndexError):
+            ll.mem.read(n-4, 8)
+        with pytest.raises(IndexError):
+            ll.mem.view(n, 1)
+        with pytest.raises(IndexError):
+            ll.mem.write(n-2, b'abcd')
+
     def test_write_mem(self):
         src = r"""
         #include <stdint.h>
@@ -72,6 +87,35 @@ class TestLLWasm(CTest):
         ll.mem.write(ptr, bytearray([40, 50, 60]))
         assert ll.call('foo_total') == 150
 
+    def test_read_cstr(self):
+        src = r"""
+        const char *hello = "hello";
+        """
+        test_wasm = self.compile(src, exports=['hello'])
+        ll = LLWasmInstance.from_file(test_wasm)
+        ptr = ll.read_global('hello', 'void *')
+        assert ll.mem.read_cstr(ptr) == b'hello'
+        assert ll.mem.read_cstr(ptr+3) == b'lo'
+        assert bytes(ll.mem.view(ptr, 2)) == b'he'
+
+    def test_memory_grow(self):
+        src = r"""
+        #include <stdint.h>
+        int32_t grow(void) {
+            int32_t old_pages = __builtin_wasm_memory_grow(0, 1);
+            int32_t *p = (int32_t *)(old_pages * 65536);
+            *p = 42;
+            return (int32_t)p;
+        }
+        """
+        test_wasm = self.compile(src, exports=['grow'])
+        ll = LLWasmInstance.from_file(test_wasm)
+        n = len(ll.mem.get_view())
+        ptr = ll.call('grow')
+        assert ptr == n
+        assert len(ll.mem.get_view()) == n + 65536
+        assert ll.mem.read_i32(ptr) == 42
+
     def test_multiple_instances(self):
         src = r"""
         int x = 100;
@@ -130,3 +174,28 @@ class TestLLWasm(CTest):
         ll = LLWasmInstance(llmod, [math, recorder])
         assert ll.call('compute') == 900
         assert recorder.log == [100, 200]
+
+    def test_module_cache(self, monkeypatch):
+        import spy.llwasm
+        cache_dir = self.tmpdir.join('cache')
+        monkeypatch.setattr(spy.llwasm, 'CACHE_DIR', cache_dir)
+        src = r"""
+        int add(int x, int y) {
+            return x+y;
+        }
+        """
+        test_wasm = self.compile(src, exports=['add'])
+        llmod1 = LLWasmModule(test_wasm)
+        assert not llmod1.from_cache
+        assert len(cache_dir.listdir('*.cwasm')) == 1
+        llmod2 = LLWasmModule(test_wasm)
+        assert llmod2.from_cache
+        assert LLWasmInstance(llmod2).call('add', 4, 8) == 12
+        #
+        # a corrupted cache entry is ignored and overwritten
+        [cached] = cache_dir.listdir('*.cwasm')
+        cached.write_binary(b'garbage')
+        llmod3 = LLWasmModule(test_wasm)
+        assert not llmod3.from_cache
+        assert LLWasmInstance(llmod3).call('add', 4, 8) == 12
+        assert LLWasmModule(test_wasm).from_cache
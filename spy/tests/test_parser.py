@@ -271,6 +271,45 @@ class TestParser:
         """
         self.assert_dump(stmt, expected)
 
+    def test_GetSlice(self):
+        mod = self.parse("""
+        def foo() -> void:
+            s[1:3]
+            s[:]
+        """)
+        funcdef = mod.get_funcdef('foo')
+        expected = """
+        StmtExpr(
+            value=GetSlice(
+                value=Name(id='s'),
+                start=Constant(value=1),
+                stop=Constant(value=3),
+            ),
+        )
+        """
+        self.assert_dump(funcdef.body[0], expected)
+        expected = """
+        StmtExpr(
+            value=GetSlice(
+                value=Name(id='s'),
+                start=Constant(value=0),
+                stop=Constant(value=2147483647),
+            ),
+        )
+        """
+        self.assert_dump(funcdef.body[1], expected)
+
+    def test_GetSlice_step(self):
+        src = """
+        def foo() -> void:
+            s[1:3:2]
+        """
+        self.expect_errors(
+            src,
+            'not implemented yet: slice steps',
+            ('this is not supported', '2'),
+        )
+
     def test_SetItem(self):
         mod = self.parse("""
         def foo() -> void:
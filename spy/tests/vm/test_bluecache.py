@@ -0,0 +1,85 @@
+import pytest
+from spy.fqn import QN
+from spy.vm.vm import SPyVM
+from spy.vm.b import B
+from spy.vm.object import W_Object, W_I32
+from spy.vm.function import W_Func
+from spy.vm.sig import spy_builtin
+from spy.vm.opimpl import W_Value
+from spy.vm.bluecache import BlueCache
+
+class TestBlueCache:
+
+    def make_counter(self, vm: SPyVM) -> tuple[W_Func, list[W_Object]]:
+        # a blue function which counts how many times it is actually called
+        ncalls = []
+
+        @spy_builtin(QN('test::foo'), color='blue')
+        def foo(vm: 'SPyVM', w_x: W_Object) -> W_I32:
+            ncalls.append(w_x)
+            return vm.wrap(len(ncalls))  # type: ignore
+
+        return vm.wrap_func(foo), ncalls
+
+    def test_hit_miss(self):
+        vm = SPyVM()
+        w_foo, ncalls = self.make_counter(vm)
+        w_a = vm.call(w_foo, [vm.wrap(1)])
+        w_b = vm.call(w_foo, [vm.wrap(1)])
+        w_c = vm.call(w_foo, [vm.wrap('hello')])
+        w_d = vm.call(w_foo, [vm.wrap('hello')])
+        w_e = vm.call(w_foo, [B.w_i32])
+        w_f = vm.call(w_foo, [B.w_i32])
+        assert w_a is w_b
+        assert w_c is w_d
+        assert w_e is w_f
+        assert len(ncalls) == 3
+        stats = vm.bluecache.get_stats(w_foo)
+        assert stats.hits == 3
+        assert stats.misses == 3
+
+    def test_key_for(self):
+        vm = SPyVM()
+        cache = vm.bluecache
+        assert cache.key_for(vm.wrap(1)) == cache.key_for(vm.wrap(1))
+        assert cache.key_for(vm.wrap(1)) != cache.key_for(vm.wrap(2))
+        assert cache.key_for(vm.wrap('a')) == cache.key_for(vm.wrap('a'))
+        assert cache.key_for(vm.wrap('a')) != cache.key_for(vm.wrap('b'))
+        assert cache.key_for(B.w_i32) == cache.key_for(B.w_i32)
+        assert cache.key_for(B.w_i32) != cache.key_for(B.w_str)
+
+    def test_W_Value(self):
+        vm = SPyVM()
+        cache = vm.bluecache
+        w_foo, ncalls = self.make_counter(vm)
+        wv_red = W_Value('v', 0, B.w_str, None)
+        wv_a = W_Value('v', 0, B.w_str, None, w_blueval=vm.wrap('a'))
+        wv_b = W_Value('v', 0, B.w_str, None, w_blueval=vm.wrap('b'))
+        wv_a2 = W_Value('x', 0, B.w_str, None, w_blueval=vm.wrap('a'))
+        cache.record(w_foo, [wv_a], vm.wrap(1))
+        # the prefix doesn't matter
+        w_res = cache.lookup(w_foo, [wv_a2])
+        assert w_res is not None and vm.unwrap(w_res) == 1
+        # blue values are compared
+        assert cache.lookup(w_foo, [wv_b]) is None
+        # red vs blue values are considered equal, see value_eq
+        w_res = cache.lookup(w_foo, [wv_red])
+        assert w_res is not None and vm.unwrap(w_res) == 1
+        # different i or static type
+        assert cache.lookup(w_foo, [W_Value('v', 1, B.w_str, None)]) is None
+        assert cache.lookup(w_foo, [W_Value('v', 0, B.w_i32, None)]) is None
+
+    def test_lru(self):
+        vm = SPyVM()
+        vm.bluecache = BlueCache(vm, maxsize=2)
+        w_foo, ncalls = self.make_counter(vm)
+        vm.call(w_foo, [vm.wrap(1)])
+        vm.call(w_foo, [vm.wrap(2)])
+        vm.call(w_foo, [vm.wrap(1)])   # hit, 1 becomes most recently used
+        vm.call(w_foo, [vm.wrap(3)])   # evicts 2
+        assert len(vm.bluecache) == 2
+        assert len(ncalls) == 3
+        vm.call(w_foo, [vm.wrap(1)])   # hit
+        assert len(ncalls) == 3
+        vm.call(w_foo, [vm.wrap(2)])   # miss, recomputed
+        assert len(ncalls) == 4
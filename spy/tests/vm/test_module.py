@@ -22,3 +22,31 @@ class TestModule:
             (fqn_a, w_a),
             (fqn_b, w_b),
         ]
+
+    def test_store_global(self):
+        vm = SPyVM()
+        w_mod = W_Module(vm, 'mymod', 'mymod.spy')
+        vm.register_module(w_mod)
+        w_other = W_Module(vm, 'other', 'other.spy')
+        vm.register_module(w_other)
+        #
+        fqn_a = FQN.make('mymod', 'a', '')
+        fqn_b = FQN.make('mymod', 'b', '')
+        fqn_c = FQN.make('other', 'c', '')
+        w_10 = vm.wrap(10)
+        w_20 = vm.wrap(20)
+        vm.add_global(fqn_a, B.w_i32, w_10)
+        vm.add_global(fqn_c, B.w_i32, w_20)
+        vm.add_global(fqn_b, B.w_i32, w_20)
+        assert list(w_mod.keys()) == [fqn_a, fqn_b]
+        assert list(w_other.keys()) == [fqn_c]
+        assert vm.reverse_lookup_global(w_10) == fqn_a
+        assert vm.reverse_lookup_global(w_20) == fqn_c
+        #
+        vm.store_global(fqn_c, w_10)
+        assert list(w_other.items_w()) == [(fqn_c, w_10)]
+        assert vm.reverse_lookup_global(w_10) == fqn_a
+        assert vm.reverse_lookup_global(w_20) == fqn_b
+        vm.store_global(fqn_b, w_10)
+        assert vm.reverse_lookup_global(w_20) is None
+        assert list(w_mod.items_w()) == [(fqn_a, w_10), (fqn_b, w_10)]
@@ -0,0 +1,82 @@
+import pytest
+from typing import Optional
+from spy.errors import SPyTypeError
+from spy.vm.vm import SPyVM
+from spy.vm.b import B
+from spy.vm.object import W_Type
+from spy.vm.function import W_Func
+from spy.vm.opimpl import W_Value
+from spy.vm.modules.operator import OP
+from spy.vm.modules.operator.multimethod import MultiMethodTable
+from spy.vm.modules.types import W_TypeDef
+
+def value(w_type: W_Type) -> W_Value:
+    return W_Value('v', 0, w_type, None)
+
+class TestMultiMethod:
+
+    def make_table(self) -> MultiMethodTable:
+        MM = MultiMethodTable()
+        MM.register('+', 'i32', 'i32', OP.w_i32_add)
+        MM.register('+', 'f64', 'f64', OP.w_f64_add)
+        MM.register('*', 'str', 'i32', OP.w_str_mul)
+        MM.register_partial('+', 'dynamic', OP.w_dynamic_add)
+        MM.register_promotion('i32', 'f64')
+        return MM
+
+    def test_resolve(self):
+        vm = SPyVM()
+        MM = self.make_table()
+        cache = MM.get_cache(vm)
+        def resolve(op: str, w_l: W_Type, w_r: W_Type) -> Optional[W_Func]:
+            return MM.resolve(cache, op, w_l, w_r)
+        assert resolve('+', B.w_i32, B.w_i32) is OP.w_i32_add
+        assert resolve('+', B.w_i32, B.w_f64) is OP.w_f64_add
+        assert resolve('+', B.w_f64, B.w_i32) is OP.w_f64_add
+        assert resolve('+', B.w_i32, B.w_dynamic) is OP.w_dynamic_add
+        assert resolve('+', B.w_dynamic, B.w_str) is OP.w_dynamic_add
+        assert resolve('*', B.w_str, B.w_i32) is OP.w_str_mul
+        assert resolve('*', B.w_i32, B.w_str) is None
+        assert resolve('+', B.w_str, B.w_str) is None
+
+    def test_typedef(self):
+        vm = SPyVM()
+        MM = self.make_table()
+        w_MyInt = W_TypeDef('MyInt', B.w_i32)
+        assert MM.candidates(w_MyInt) == [w_MyInt, B.w_i32, B.w_object, B.w_f64]
+        w_opimpl = MM.lookup(vm, '+', value(w_MyInt), value(B.w_i32))
+        assert w_opimpl._w_func is OP.w_i32_add
+
+    def test_lookup_is_cached(self):
+        vm = SPyVM()
+        MM = self.make_table()
+        w_opimpl = MM.lookup(vm, '+', value(B.w_i32), value(B.w_f64))
+        assert w_opimpl.is_valid()
+        assert w_opimpl._converters is not None
+        assert w_opimpl._converters[0] is not None  # i32 -> f64
+        assert w_opimpl._converters[1] is None
+        #
+        # the second lookup reuses the converters, but it gets a fresh
+        # W_OpImpl with its own values
+        wv_l = value(B.w_i32)
+        wv_r = value(B.w_f64)
+        w_opimpl2 = MM.lookup(vm, '+', wv_l, wv_r)
+        assert w_opimpl2 is not w_opimpl
+        assert w_opimpl2.is_valid()
+        assert w_opimpl2._w_func is OP.w_f64_add
+        assert w_opimpl2._converters == w_opimpl._converters
+        assert w_opimpl2._args_wv is not None
+        assert w_opimpl2._args_wv[0] is wv_l
+        assert w_opimpl2._args_wv[1] is wv_r
+        # the cache is per-VM
+        vm2 = SPyVM()
+        MM.lookup(vm2, '+', value(B.w_i32), value(B.w_f64))
+        assert len(MM.get_cache(vm).opimpls) == 1
+        assert len(MM.get_cache(vm2).opimpls) == 1
+
+    def test_errors_are_not_cached(self):
+        vm = SPyVM()
+        MM = self.make_table()
+        for i in range(2):
+            with pytest.raises(SPyTypeError, match='cannot do `str` \\+ `str`'):
+                MM.lookup(vm, '+', value(B.w_str), value(B.w_str))
@@ -0,0 +1,69 @@
+import pytest
+from spy.errors import SPyTypeError
+from spy.vm.vm import SPyVM
+from spy.vm.b import B
+from spy.vm.opimpl import W_OpImpl, W_Value
+from spy.vm.modules.operator import OP
+from spy.vm.typechecker import typecheck_opimpl
+
+class TestOpImpl:
+
+    def make_opimpl(self, vm: SPyVM, w_opimpl: W_OpImpl,
+                    args_wv: list[W_Value]) -> W_OpImpl:
+        typecheck_opimpl(vm, w_opimpl, args_wv, dispatch='multi',
+                         errmsg='cannot do `{0}` + `{1}`')
+        return w_opimpl
+
+    def test_fastcall(self):
+        vm = SPyVM()
+        wv_l = W_Value('l', 0, B.w_i32, None)
+        wv_r = W_Value('r', 1, B.w_i32, None)
+        w_opimpl = self.make_opimpl(vm, W_OpImpl.simple(OP.w_i32_add),
+                                    [wv_l, wv_r])
+        w_res = w_opimpl.call(vm, [vm.wrap(1), vm.wrap(2)])
+        assert vm.unwrap(w_res) == 3
+        assert w_opimpl._fastcall is not None
+        assert w_opimpl._fastcall != w_opimpl._call_slow
+
+    def test_fastcall_converters(self):
+        vm = SPyVM()
+        wv_l = W_Value('l', 0, B.w_i32, None)
+        wv_r = W_Value('r', 1, B.w_f64, None)
+        w_opimpl = self.make_opimpl(vm, W_OpImpl.simple(OP.w_f64_add),
+                                    [wv_l, wv_r])
+        w_res = w_opimpl.call(vm, [vm.wrap(1), vm.wrap(2.5)])
+        assert vm.unwrap(w_res) == 3.5
+
+    def test_fastcall_permutation(self):
+        vm = SPyVM()
+        wv_a = W_Value('a', 0, B.w_i32, None)
+        wv_b = W_Value('b', 1, B.w_i32, None)
+        w_opimpl = W_OpImpl.with_values(OP.w_i32_sub, [wv_b, wv_a])
+        self.make_opimpl(vm, w_opimpl, [wv_a, wv_b])
+        w_res = w_opimpl.call(vm, [vm.wrap(1), vm.wrap(10)])
+        assert vm.unwrap(w_res) == 9
+
+    def test_fastcall_typecheck(self):
+        # the TypeChecker can be wrong about the types of red globals (see
+        # TypeChecker.check_expr_Name), so the fast path still checks them
+        vm = SPyVM()
+        wv_l = W_Value('l', 0, B.w_i32, None)
+        wv_r = W_Value('r', 1, B.w_i32, None)
+        w_opimpl = self.make_opimpl(vm, W_OpImpl.simple(OP.w_i32_add),
+                                    [wv_l, wv_r])
+        msg = 'Invalid cast. Expected `i32`, got `str`'
+        with pytest.raises(SPyTypeError, match=msg):
+            w_opimpl.call(vm, [vm.wrap(1), vm.wrap('ab')])
+
+    def test_fastcall_trusted(self):
+        vm = SPyVM()
+        vm.trust_typechecker = True
+        wv_l = W_Value('l', 0, B.w_i32, None)
+        wv_r = W_Value('r', 1, B.w_i32, None)
+        w_opimpl = self.make_opimpl(vm, W_OpImpl.simple(OP.w_i32_add),
+                                    [wv_l, wv_r])
+        w_res = w_opimpl.call(vm, [vm.wrap(1), vm.wrap(2)])
+        assert vm.unwrap(w_res) == 3
+        # the argument types are not checked
+        with pytest.raises(Exception, match='Type mismatch'):
+            w_opimpl.call(vm, [vm.wrap(1), vm.wrap('ab')])
@@ -1,3 +1,4 @@
+import textwrap
 import fixedint
 import pytest
 from spy.vm.vm import SPyVM
@@ -6,7 +7,7 @@ from spy.fqn import QN, FQN
 from spy.errors import SPyTypeError
 from spy.vm.object import W_Object, W_Type, spytype, W_Void, W_I32, W_Bool
 from spy.vm.str import W_Str
-from spy.vm.function import W_BuiltinFunc
+from spy.vm.function import W_Func, W_BuiltinFunc
 from spy.vm.module import W_Module
 
 class TestVM:
@@ -185,6 +186,78 @@ class TestVM:
         assert vm.unwrap(w_hello) == 'hello'
         assert repr(w_hello) == "W_Str('hello')"
 
+    def test_W_Str_cache(self):
+        vm = SPyVM()
+        w_a = vm.wrap('hello àèìòù')
+        assert isinstance(w_a, W_Str)
+        # a W_Str created from an interp-level str knows its content
+        assert w_a._str == 'hello àèìòù'
+        assert w_a._length == len('hello àèìòù'.encode('utf-8'))
+        # a W_Str created from the raw ptr reads the content lazily, once
+        w_b = W_Str.from_ptr(vm, w_a.ptr)
+        assert w_b._str is None and w_b._length is None
+        assert w_b.get_length() == len('hello àèìòù'.encode('utf-8'))
+        assert vm.unwrap_str(w_b) == 'hello àèìòù'
+        assert w_b._str == 'hello àèìòù'
+        assert w_b.get_utf8() == w_a.get_utf8()
+
+    def test_W_Str_slice(self):
+        from spy.vm.str import str_slice, ll_spy_Str_is_view
+        vm = SPyVM()
+        w_s = vm.wrap('hello world')
+        assert isinstance(w_s, W_Str)
+        assert not ll_spy_Str_is_view(vm.ll, w_s.ptr)
+        def slice(start: int, stop: int) -> W_Str:
+            w_res = vm.call(vm.wrap_func(str_slice),
+                            [w_s, vm.wrap(start), vm.wrap(stop)])
+            assert isinstance(w_res, W_Str)
+            return w_res
+        # a view shares the data of its parent, and keeps it alive
+        w_view = slice(6, 11)
+        assert ll_spy_Str_is_view(vm.ll, w_view.ptr)
+        assert w_view._w_parent is w_s
+        assert vm.unwrap_str(w_view) == 'world'
+        # these are not views
+        assert slice(0, 100) is w_s
+        w_h = slice(0, 1)
+        assert not ll_spy_Str_is_view(vm.ll, w_h.ptr)
+        assert w_h._w_parent is None
+        assert vm.unwrap_str(w_h) == 'h'
+
+    def test_intern_str(self):
+        vm = SPyVM()
+        w_a = vm.intern_str('hello')
+        w_b = vm.intern_str('hello')
+        w_c = vm.intern_str('world')
+        assert w_a is w_b
+        assert w_a is not w_c
+        assert vm.unwrap_str(w_a) == 'hello'
+
+    def test_W_Str_free(self):
+        vm = SPyVM()
+        w_lit = vm.intern_str('x' * 100)
+        live_bytes = vm.ll.gc_stats().live_bytes
+        for i in range(1000):
+            w_a = W_Str(vm, 'hello' * 20)
+            ptr = vm.ll.call('spy_str_add', w_a.ptr, w_lit.ptr)
+            w_b = W_Str.from_ptr(vm, ptr, owned=True)
+            assert w_b.get_length() == 200
+        del w_a, w_b
+        assert vm.ll.gc_stats().live_bytes == live_bytes
+        # the interned literal is still alive
+        w_lit2 = W_Str.from_ptr(vm, w_lit.ptr)
+        assert vm.unwrap_str(w_lit2) == 'x' * 100
+
+    def test_W_Str_arena(self):
+        vm = SPyVM()
+        vm.ll.arena_push()
+        # a W_Str would outlive the arena
+        with pytest.raises(ValueError, match='inside a libspy arena'):
+            W_Str(vm, 'hello')
+        vm.ll.arena_pop()
+        w_s = W_Str(vm, 'hello')
+        assert not vm.ll.arena_contains(w_s.ptr)
+
     def test_call_function(self):
         vm = SPyVM()
         w_abs = B.w_abs
@@ -200,6 +273,53 @@ class TestVM:
         with pytest.raises(SPyTypeError, match=msg):
             vm.call(w_abs, [w_x])
 
+    def test_call_trusted(self):
+        vm = SPyVM()
+        assert not vm.trust_typechecker
+        w_abs = B.w_abs
+        w_y = vm.call_trusted(w_abs, [vm.wrap(-42)])
+        assert vm.unwrap(w_y) == 42
+        # by default, call_trusted checks the types
+        w_x = vm.wrap('hello')
+        msg = 'Invalid cast. Expected `i32`, got `str`'
+        with pytest.raises(SPyTypeError, match=msg):
+            vm.call_trusted(w_abs, [w_x])
+        # if we trust the typechecker, it doesn't: abs() receives a W_Str and
+        # fails at the interp-level in vm.unwrap_i32
+        vm.trust_typechecker = True
+        with pytest.raises(Exception, match='Type mismatch'):
+            vm.call_trusted(w_abs, [w_x])
+
+    @pytest.mark.parametrize('closure_compile', [True, False])
+    def test_rebound_global_is_typechecked(self, tmpdir, closure_compile):
+        # the TypeChecker computes the static type of `x` from its value at
+        # check time, i.e. i32: when set_x() rebinds it to a str, we must get
+        # an SPyTypeError, not crash inside the interpreter
+        tmpdir.join('mod.spy').write(textwrap.dedent("""
+        var x: dynamic = 1
+
+        def set_x() -> void:
+            x = 'ab'
+
+        def foo() -> i32:
+            i = 0
+            res = 0
+            while i < 2:
+                res = x + x
+                set_x()
+                i = i + 1
+            return res
+        """))
+        vm = SPyVM()
+        vm.closure_compile = closure_compile
+        vm.path.append(str(tmpdir))
+        vm.import_('mod')
+        w_foo = vm.lookup_global(FQN.parse('mod::foo'))
+        assert isinstance(w_foo, W_Func)
+        msg = 'Invalid cast. Expected `i32`, got `str`'
+        with pytest.raises(SPyTypeError, match=msg):
+            vm.call(w_foo, [])
+
     def test_get_FQN(self):
         vm = SPyVM()
         w_mod = W_Module(vm, "test", "...")
@@ -215,6 +335,12 @@ class TestVM:
         assert b0.fullname == "test::b#0"
         b1 = vm.get_FQN(QN("test::b"), is_global=False)
         assert b1.fullname == "test::b#1"
+        #
+        # each QN has its own counter
+        c0 = vm.get_FQN(QN("test::c"), is_global=False)
+        assert c0.fullname == "test::c#0"
+        b2 = vm.get_FQN(QN("test::b"), is_global=False)
+        assert b2.fullname == "test::b#2"
 
     def test_eq(self):
         vm = SPyVM()
@@ -231,3 +357,77 @@ class TestVM:
         assert vm.is_False(vm.eq(B.w_i32, B.w_str))
         assert vm.is_True(vm.ne(B.w_i32, B.w_str))
         assert vm.is_False(vm.ne(B.w_i32, B.w_i32))
+
+    def test_lazy_ll(self):
+        vm = SPyVM()
+        assert vm._ll is None
+        assert vm.is_True(vm.eq(vm.wrap(1), vm.wrap(1)))
+        assert vm._ll is None
+        w_s = vm.wrap('hello')
+        assert vm._ll is not None
+        assert vm.unwrap(w_s) == 'hello'
+
+    def test_snapshot(self, tmpdir):
+        tmpdir.join('mod.spy').write(textwrap.dedent("""
+        var counter: i32 = 0
+
+        def inc() -> i32:
+            counter = counter + 1
+            return counter
+
+        def greet(name: str) -> str:
+            return 'hello ' + name
+        """))
+        vm = SPyVM()
+        vm.path.append(str(tmpdir))
+        vm.import_('mod')
+        w_inc = vm.modules_w['mod'].getattr_astfunc('inc')
+        w_greet = vm.modules_w['mod'].getattr_astfunc('greet')
+        assert vm.unwrap(vm.call(w_greet, [vm.wrap('world')])) == 'hello world'
+        assert vm.unwrap(vm.call(w_inc, [])) == 1
+        snap = vm.snapshot()
+        #
+        vm2 = SPyVM.from_snapshot(snap)
+        vm3 = SPyVM.from_snapshot(snap)
+        w_mod2 = vm2.modules_w['mod']
+        assert w_mod2 is not vm.modules_w['mod']
+        assert w_mod2.vm is vm2
+        w_inc2 = w_mod2.getattr_astfunc('inc')
+        assert vm2.unwrap(vm2.call(w_inc2, [])) == 2
+        assert vm2.unwrap(vm2.call(w_inc2, [])) == 3
+        # the VMs are independent
+        assert vm.unwrap(vm.call(w_inc, [])) == 2
+        w_inc3 = vm3.modules_w['mod'].getattr_astfunc('inc')
+        assert vm3.unwrap(vm3.call(w_inc3, [])) == 2
+        # the strings stored in the linear memory are copied
+        w_hello = vm2.interned_str_w['hello ']
+        assert w_hello.vm is vm2
+        assert vm2.unwrap(w_hello) == 'hello '
+        w_greet2 = w_mod2.getattr_astfunc('greet')
+        w_res = vm2.call(w_greet2, [vm2.wrap('snapshot')])
+        assert vm2.unwrap(w_res) == 'hello snapshot'
+        # types and builtins are shared
+        fqn = FQN.parse('builtins::abs')
+        assert vm2.lookup_global(fqn) is vm.lookup_global(fqn)
+        assert vm2.reverse_lookup_global(w_inc2) == FQN.parse('mod::inc')
+
+    def test_snapshot_free(self, tmpdir):
+        tmpdir.join('mod.spy').write(textwrap.dedent("""
+        var s: str = ''
+
+        def set_s(x: str) -> void:
+            s = x
+        """))
+        vm = SPyVM()
+        vm.path.append(str(tmpdir))
+        vm.import_('mod')
+        w_set_s = vm.modules_w['mod'].getattr_astfunc('set_s')
+        vm.call(w_set_s, [vm.wrap('x' * 100)])
+        snap = vm.snapshot()
+        #
+        vm2 = SPyVM.from_snapshot(snap)
+        w_set_s2 = vm2.modules_w['mod'].getattr_astfunc('set_s')
+        live_bytes = vm2.ll.gc_stats().live_bytes
+        # the restored string is freed when it's no longer referenced
+        vm2.call(w_set_s2, [vm2.wrap('')])
+        assert vm2.ll.gc_stats().live_bytes <= live_bytes - 100
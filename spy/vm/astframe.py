@@ -38,7 +38,7 @@ class ASTFrame:
         self.w_func = w_func
         self.funcdef = w_func.funcdef
         self._locals = {}
-        self.t = TypeChecker(vm, self.w_func)
+        self.t = w_func.get_typechecker(vm)
 
     def __repr__(self) -> str:
         return f'<ASTFrame for {self.w_func.qn}>'
@@ -77,11 +77,14 @@ class ASTFrame:
         w_functype = self.w_func.w_functype
         params = self.w_func.w_functype.params
         arglocs = [arg.loc for arg in self.funcdef.args]
+        check = not self.vm.trust_typechecker
         for loc, param, w_arg in zip(arglocs, params, args_w, strict=True):
-            # we assume that the arguments' types are correct. It's not the
-            # job of astframe to raise SPyTypeError if there is a type
-            # mismatch here, it is the job of vm.call_function
-            assert self.vm.isinstance(w_arg, param.w_type)
+            # we assume that the arguments' types are correct: they have been
+            # checked either by vm.call or by the TypeChecker (see
+            # vm.call_trusted). It's not the job of astframe to raise
+            # SPyTypeError if there is a type mismatch here.
+            if check:
+                assert self.vm.isinstance(w_arg, param.w_type)
             self.store_local(param.name, w_arg)
 
     def exec_stmt(self, stmt: ast.Stmt) -> None:
@@ -207,6 +210,8 @@ class ASTFrame:
         # Parser.from_py_expr_Constant
         T = type(const.value)
         assert T in (int, float, bool, str, NoneType)
+        if isinstance(const.value, str):
+            return self.vm.intern_str(const.value)
         return self.vm.wrap(const.value)
 
     def eval_expr_FQNConst(self, const: ast.FQNConst) -> W_Object:
@@ -298,6 +303,13 @@ class ASTFrame:
         w_i = self.eval_expr(op.index)
         return w_opimpl.call(self.vm, [w_val, w_i])
 
+    def eval_expr_GetSlice(self, op: ast.GetSlice) -> W_Object:
+        w_opimpl = self.t.opimpl[op]
+        w_val = self.eval_expr(op.value)
+        w_start = self.eval_expr(op.start)
+        w_stop = self.eval_expr(op.stop)
+        return w_opimpl.call(self.vm, [w_val, w_start, w_stop])
+
     def eval_expr_GetAttr(self, op: ast.GetAttr) -> W_Object:
         # this is suboptimal, but good enough for now: ideally, we would like
         # to support two cases:
@@ -1,43 +1,211 @@
-from collections import defaultdict
-from typing import TYPE_CHECKING, Optional
-from spy.fqn import QN
-from spy.vm.object import W_Object
+from collections import OrderedDict, defaultdict
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional, Hashable
+from spy.vm.object import W_Object, W_Type, W_I32, W_F64, W_Bool, W_Void
+from spy.vm.str import W_Str
+from spy.vm.list import W_List
 from spy.vm.function import W_Func
+from spy.vm.opimpl import W_Value
 if TYPE_CHECKING:
     from spy.vm.vm import SPyVM
 
 ARGS_W = list[W_Object]
 ENTRY = tuple[ARGS_W, W_Object]
+KEY = tuple[Hashable, ...]
+
+
+class Unhashable(Exception):
+    """
+    Raised by BlueCache.key_for if we don't know how to compute a canonical
+    key for a given object.
+    """
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+
 
 class BlueCache:
     """
     Store and record the results of blue functions.
 
-    Currently this is very inefficient, because for every W_Func it records a
-    list of calls, and then during lookup it does a linear search.
+    For each call we compute a canonical hashable key out of the wrapped
+    arguments (see key_for), so that the lookup is a dict lookup instead of
+    a linear search which compares all the arguments with vm.universal_eq.
+
+    The key is guaranteed to be the same for all the arguments which
+    universal_eq considers equal, but it can be coarser than that: this is
+    the case for W_Value, whose key doesn't include the blue value (see
+    value_eq for why). Because of that, each key maps to a small "bucket" of
+    entries, which are compared with args_w_eq_fast.
+
+    If one of the arguments is not hashable, we fall back to the old logic,
+    i.e. a linear search using vm.universal_eq.
 
-    We should use a SPy dict, as soon as we have it.
+    By default the cache is unbounded. If maxsize is given, we evict the least
+    recently used buckets. Note that this is safe only if the blue functions
+    involved are pure and don't rely on the identity of their results:
+    e.g. evicting `make_list_type` entries would create a new list type the
+    next time it's called.
     """
     vm: 'SPyVM'
-    data: defaultdict[W_Func, list[ENTRY]]
+    maxsize: Optional[int]
+    data: OrderedDict[tuple[W_Func, KEY], list[ENTRY]]
+    slow_data: defaultdict[W_Func, list[ENTRY]]
+    stats: defaultdict[W_Func, CacheStats]
 
-    def __init__(self, vm: 'SPyVM'):
+    def __init__(self, vm: 'SPyVM', maxsize: Optional[int] = None):
+        assert maxsize is None or maxsize > 0
         self.vm = vm
-        self.data = defaultdict(list)
+        self.maxsize = maxsize
+        self.data = OrderedDict()
+        self.slow_data = defaultdict(list)
+        self.stats = defaultdict(CacheStats)
+
+    def __len__(self) -> int:
+        n = sum(len(bucket) for bucket in self.data.values())
+        n += sum(len(entries) for entries in self.slow_data.values())
+        return n
 
     def record(self, w_func: W_Func, args_w: ARGS_W, w_result: W_Object) ->None:
         entry = (args_w, w_result)
-        self.data[w_func].append(entry)
+        key = self.key_maybe(args_w)
+        if key is None:
+            self.slow_data[w_func].append(entry)
+            return
+        datakey = (w_func, key)
+        bucket = self.data.get(datakey)
+        if bucket is None:
+            self.data[datakey] = [entry]
+            self.evict_maybe()
+        else:
+            bucket.append(entry)
 
     def lookup(self, w_func: W_Func, got_args_w: ARGS_W) -> Optional[W_Object]:
-        entries = self.data[w_func]
-        ## if w_func.qn == QN('operator::CALL_METHOD'):
-        ##     import pdb;pdb.set_trace()
-        for args_w, w_result in entries:
-            if self.args_w_eq(args_w, got_args_w):
+        w_result = self._lookup(w_func, got_args_w)
+        stats = self.stats[w_func]
+        if w_result is None:
+            stats.misses += 1
+        else:
+            stats.hits += 1
+        return w_result
+
+    def _lookup(self, w_func: W_Func, got_args_w: ARGS_W) -> Optional[W_Object]:
+        key = self.key_maybe(got_args_w)
+        if key is None:
+            for args_w, w_result in self.slow_data.get(w_func, []):
+                if self.args_w_eq(args_w, got_args_w):
+                    return w_result
+            return None
+        #
+        datakey = (w_func, key)
+        bucket = self.data.get(datakey)
+        if bucket is None:
+            return None
+        for args_w, w_result in bucket:
+            if self.args_w_eq_fast(args_w, got_args_w):
+                if self.maxsize is not None:
+                    self.data.move_to_end(datakey)
                 return w_result
         return None
 
+    def evict_maybe(self) -> None:
+        if self.maxsize is None:
+            return
+        while len(self.data) > self.maxsize:
+            self.data.popitem(last=False)
+
+    def rehash(self) -> None:
+        """
+        Recompute all the keys. This is needed if the recorded objects have
+        been copied (see VMSnapshot), because the keys contain their ids.
+        """
+        old_data = self.data
+        self.data = OrderedDict()
+        for (w_func, _), bucket in old_data.items():
+            args_w, _ = bucket[0]
+            key = self.key_maybe(args_w)
+            assert key is not None
+            self.data[(w_func, key)] = bucket
+
+    def get_stats(self, w_func: W_Func) -> CacheStats:
+        return self.stats.get(w_func, CacheStats())
+
+    # ==== canonical keys ====
+
+    def key_maybe(self, args_w: ARGS_W) -> Optional[KEY]:
+        try:
+            return tuple([self.key_for(w_arg) for w_arg in args_w])
+        except Unhashable:
+            return None
+
+    def key_for(self, w_obj: W_Object) -> Hashable:
+        """
+        Compute the canonical hashable key of a wrapped object.
+
+        Objects which compare by identity use id(): this is safe because the
+        cache keeps alive all the recorded arguments, so their ids cannot be
+        reused as long as the corresponding entries exist.
+        """
+        if isinstance(w_obj, W_Value):
+            # blue values are compared by args_w_eq_fast, see value_eq
+            return ('Value', w_obj.i, id(w_obj.w_static_type))
+        elif isinstance(w_obj, W_I32):
+            return ('num', int(w_obj.value))
+        elif isinstance(w_obj, W_F64):
+            # i32 and f64 can compare equal, see MM.register('==', ...). Note
+            # that hash(1) == hash(1.0), so they end up in the same bucket.
+            return ('num', w_obj.value)
+        elif isinstance(w_obj, W_Str):
+            return ('str', w_obj.get_utf8())
+        elif isinstance(w_obj, W_List) and type(w_obj) is not W_List:
+            # list[T] compares items structurally
+            items_w = w_obj.items_w  # type: ignore
+            items = tuple([self.key_for(w_item) for w_item in items_w])
+            return ('list', id(type(w_obj)), items)
+        elif isinstance(w_obj, (W_Type, W_Func, W_Bool, W_Void)):
+            return ('id', id(w_obj))
+        elif (w_obj.__spy_storage_category__ == 'reference' and
+              not type(w_obj).has_meth_overriden('op_EQ')):
+            return ('id', id(w_obj))
+        raise Unhashable
+
+    # ==== equality ====
+
+    def args_w_eq_fast(self, args1_w: ARGS_W, args2_w: ARGS_W) -> bool:
+        """
+        Compare two lists of arguments which are known to have the same key.
+        """
+        for w_a, w_b in zip(args1_w, args2_w, strict=True):
+            if not self.w_eq_fast(w_a, w_b):
+                return False
+        return True
+
+    def w_eq_fast(self, w_a: W_Object, w_b: W_Object) -> bool:
+        if isinstance(w_a, W_Value):
+            assert isinstance(w_b, W_Value)
+            # same semantics as value_eq: i and w_static_type are part of
+            # the key, and we compare the blue values only if both are blue
+            w_blue_a = w_a._w_blueval
+            w_blue_b = w_b._w_blueval
+            if w_blue_a is not None and w_blue_b is not None:
+                try:
+                    return self.key_for(w_blue_a) == self.key_for(w_blue_b)
+                except Unhashable:
+                    w_res = self.vm.eq(w_blue_a, w_blue_b)
+                    return self.vm.is_True(w_res)
+            return True
+        elif isinstance(w_a, W_List) and type(w_a) is not W_List:
+            assert isinstance(w_b, W_List)
+            items_a = w_a.items_w  # type: ignore
+            items_b = w_b.items_w  # type: ignore
+            return all([self.w_eq_fast(w_1, w_2)
+                        for w_1, w_2 in zip(items_a, items_b, strict=True)])
+        # for all the other objects, the key is enough
+        return True
+
     def args_w_eq(self, args1_w: ARGS_W, args2_w: ARGS_W) -> bool:
         if len(args1_w) != len(args2_w):
             return False
@@ -0,0 +1,521 @@
+"""
+Closure-compiled execution of W_ASTFunc.
+
+ASTFrame is a tree-walking interpreter: every time a node is executed, it
+calls the typechecker, does a magic_dispatch on the node and looks up the
+type converters.
+
+ClosureCompiler does all this work only once per function: each statement
+and expression is turned into a Python closure which has all the static
+information pre-bound (opimpls, converters, symbols, etc.). Executing the
+function is then just a matter of calling the closures.
+
+The closures take a single argument, which is the Namespace containing the
+local variables of the current call. Statements return None, unless they
+execute a `return`: in that case, they return the wrapped result, which is
+propagated up until CompiledFunc.run.
+
+Since some typechecking happens lazily (see TypeChecker.check_stmt_VarDef),
+statements are compiled lazily as well: each block initially contains stubs
+which compile the corresponding statement the first time it is executed, and
+then replace themselves with the compiled closure.
+
+The TypeChecker is shared by all the calls, which means that the static types
+of the function must be independent of the values of its arguments. This is
+always true for red functions, but not for blue ones: see
+W_ASTFunc.spy_call.
+"""
+
+from typing import TYPE_CHECKING, Callable, Optional
+from types import NoneType
+from spy import ast
+from spy.fqn import QN
+from spy.errors import SPyTypeError, SPyRuntimeError
+from spy.vm.b import B
+from spy.vm.object import W_Object, W_Type
+from spy.vm.function import W_Func, W_FuncType, W_ASTFunc, Namespace
+from spy.vm.list import W_List
+from spy.vm.tuple import W_Tuple
+from spy.vm.typechecker import TypeChecker
+from spy.util import magic_dispatch
+if TYPE_CHECKING:
+    from spy.vm.vm import SPyVM
+
+StmtFn = Callable[[Namespace], Optional[W_Object]]
+ExprFn = Callable[[Namespace], W_Object]
+Block = list[StmtFn]
+
+
+def run_block(block: Block, frame: Namespace) -> Optional[W_Object]:
+    for fn in block:
+        w_res = fn(frame)
+        if w_res is not None:
+            return w_res
+    return None
+
+
+class CompiledFunc:
+    """
+    The compiled version of a W_ASTFunc. See ClosureCompiler.
+    """
+    vm: 'SPyVM'
+    w_func: W_ASTFunc
+    body: Block
+
+    def __init__(self, vm: 'SPyVM', w_func: W_ASTFunc, body: Block) -> None:
+        self.vm = vm
+        self.w_func = w_func
+        self.body = body
+
+    def __repr__(self) -> str:
+        return f'<CompiledFunc for {self.w_func.qn}>'
+
+    def run(self, args_w: list[W_Object]) -> W_Object:
+        vm = self.vm
+        frame: Namespace = {}
+        params = self.w_func.w_functype.params
+        check = not vm.trust_typechecker
+        for param, w_arg in zip(params, args_w, strict=True):
+            # we assume that the arguments' types are correct, see
+            # ASTFrame.init_arguments
+            if check:
+                assert vm.isinstance(w_arg, param.w_type)
+            frame[param.name] = w_arg
+        #
+        w_res = run_block(self.body, frame)
+        if w_res is not None:
+            return w_res
+        #
+        # we reached the end of the function. If it's void, we can return
+        # None, else it's an error.
+        if self.w_func.w_functype.w_restype in (B.w_void, B.w_dynamic):
+            return B.w_None
+        else:
+            loc = self.w_func.funcdef.loc.make_end_loc()
+            msg = 'reached the end of the function without a `return`'
+            raise SPyTypeError.simple(msg, 'no return', loc)
+
+
+class ClosureCompiler:
+    vm: 'SPyVM'
+    w_func: W_ASTFunc
+    funcdef: ast.FuncDef
+    t: TypeChecker
+
+    def __init__(self, vm: 'SPyVM', w_func: W_ASTFunc) -> None:
+        assert isinstance(w_func, W_ASTFunc)
+        self.vm = vm
+        self.w_func = w_func
+        self.funcdef = w_func.funcdef
+        self.t = w_func.get_typechecker(vm)
+
+    def __repr__(self) -> str:
+        return f'<ClosureCompiler for {self.w_func.qn}>'
+
+    def compile(self) -> CompiledFunc:
+        body = self.compile_block(self.funcdef.body)
+        return CompiledFunc(self.vm, self.w_func, body)
+
+    def compile_block(self, stmts: list[ast.Stmt]) -> Block:
+        """
+        Return a block of stubs, which compile the corresponding statement
+        the first time they are executed.
+        """
+        block: Block = []
+        for i, stmt in enumerate(stmts):
+            block.append(self.make_stub(block, i, stmt))
+        return block
+
+    def make_stub(self, block: Block, i: int, stmt: ast.Stmt) -> StmtFn:
+        def stub(frame: Namespace) -> Optional[W_Object]:
+            fn = block[i]
+            if fn is stub:
+                fn = self.compile_stmt(stmt, frame)
+                block[i] = fn
+            return fn(frame)
+        return stub
+
+    def compile_stmt(self, stmt: ast.Stmt, frame: Namespace) -> StmtFn:
+        """
+        Compile the given statement.
+
+        `frame` is the Namespace of the call which is executing the stmt for
+        the first time: it is needed to evaluate the type annotations of
+        VarDef and FuncDef.
+        """
+        self.t.check_stmt(stmt)
+        return magic_dispatch(self, 'compile_stmt', stmt, frame)
+
+    def compile_expr(self, expr: ast.Expr) -> ExprFn:
+        self.t.check_expr(expr)
+        conv = self.t.expr_conv.get(expr)
+        fn = magic_dispatch(self, 'compile_expr', expr)
+        if conv is None:
+            return fn
+        vm = self.vm
+        convert = conv.convert
+
+        def eval_conv(frame: Namespace) -> W_Object:
+            return convert(vm, fn(frame))
+        return eval_conv
+
+    def eval_type_now(self, expr: ast.Expr, frame: Namespace) -> W_Type:
+        """
+        Compile and immediately evaluate a type annotation
+        """
+        w_val = self.compile_expr(expr)(frame)
+        if isinstance(w_val, W_Type):
+            return w_val
+        w_valtype = self.vm.dynamic_type(w_val)
+        msg = f'expected `type`, got `{w_valtype.name}`'
+        raise SPyTypeError.simple(msg, "expected `type`", expr.loc)
+
+    # ==== statements ====
+
+    def compile_stmt_Pass(self, stmt: ast.Pass,
+                          frame: Namespace) -> StmtFn:
+        def exec_Pass(frame: Namespace) -> None:
+            pass
+        return exec_Pass
+
+    def compile_stmt_Return(self, ret: ast.Return,
+                            frame: Namespace) -> StmtFn:
+        # the closure for the value returns a W_Object, which is exactly what
+        # a "returning" stmt is supposed to do
+        return self.compile_expr(ret.value)
+
+    def compile_stmt_FuncDef(self, funcdef: ast.FuncDef,
+                             frame: Namespace) -> StmtFn:
+        # evaluate the functype: since the TypeChecker is shared by all the
+        # calls, we do it only once
+        d = {}
+        for arg in funcdef.args:
+            d[arg.name] = self.eval_type_now(arg.type, frame)
+        w_restype = self.eval_type_now(funcdef.return_type, frame)
+        w_functype = W_FuncType.make(
+            color = funcdef.color,
+            w_restype = w_restype,
+            **d)
+        self.t.lazy_check_FuncDef(funcdef, w_functype)
+        #
+        modname = self.w_func.qn.modname # the module of the "outer" function
+        qn = QN(modname=modname, attr=funcdef.name)
+        outer_closure = self.w_func.closure
+        name = funcdef.name
+
+        def exec_FuncDef(frame: Namespace) -> None:
+            # XXX we should capture only the names actually used in the
+            # inner func
+            closure = outer_closure + (frame,)
+            frame[name] = W_ASTFunc(w_functype, qn, funcdef, closure)
+        return exec_FuncDef
+
+    def compile_stmt_VarDef(self, vardef: ast.VarDef,
+                            frame: Namespace) -> StmtFn:
+        w_type = self.eval_type_now(vardef.type, frame)
+        self.t.lazy_check_VarDef(vardef, w_type)
+
+        def exec_VarDef(frame: Namespace) -> None:
+            pass
+        return exec_VarDef
+
+    def compile_stmt_Assign(self, assign: ast.Assign,
+                            frame: Namespace) -> StmtFn:
+        value = self.compile_expr(assign.value)
+        store = self.compile_assign(assign.target)
+
+        def exec_Assign(frame: Namespace) -> None:
+            store(frame, value(frame))
+        return exec_Assign
+
+    def compile_stmt_UnpackAssign(self, unpack: ast.UnpackAssign,
+                                  frame: Namespace) -> StmtFn:
+        value = self.compile_expr(unpack.value)
+        stores = [self.compile_assign(target) for target in unpack.targets]
+        exp = len(stores)
+
+        def exec_UnpackAssign(frame: Namespace) -> None:
+            w_tup = value(frame)
+            assert isinstance(w_tup, W_Tuple)
+            got = len(w_tup.items_w)
+            if exp != got:
+                raise SPyRuntimeError(
+                    f"Wrong number of values to unpack: expected {exp}, "
+                    f"got {got}"
+                )
+            for store, w_val in zip(stores, w_tup.items_w):
+                store(frame, w_val)
+        return exec_UnpackAssign
+
+    def compile_assign(self,
+                       target: str) -> Callable[[Namespace, W_Object], None]:
+        # XXX this is semi-wrong, see ASTFrame._exec_assign
+        sym = self.funcdef.symtable.lookup(target)
+        if sym.is_local:
+            def store_local(frame: Namespace, w_val: W_Object) -> None:
+                frame[target] = w_val
+            return store_local
+        elif sym.fqn is not None:
+            assert sym.color == 'red'
+            vm = self.vm
+            fqn = sym.fqn
+
+            def store_global(frame: Namespace, w_val: W_Object) -> None:
+                vm.store_global(fqn, w_val)
+            return store_global
+        else:
+            assert False, 'closures not implemented yet'
+
+    def compile_stmt_SetAttr(self, node: ast.SetAttr,
+                             frame: Namespace) -> StmtFn:
+        vm = self.vm
+        w_opimpl = self.t.opimpl[node]
+        target = self.compile_expr(node.target)
+        w_attr = vm.wrap(node.attr)
+        value = self.compile_expr(node.value)
+
+        def exec_SetAttr(frame: Namespace) -> None:
+            w_target = target(frame)
+            w_value = value(frame)
+            w_opimpl.call(vm, [w_target, w_attr, w_value])
+        return exec_SetAttr
+
+    def compile_stmt_SetItem(self, node: ast.SetItem,
+                             frame: Namespace) -> StmtFn:
+        vm = self.vm
+        w_opimpl = self.t.opimpl[node]
+        target = self.compile_expr(node.target)
+        index = self.compile_expr(node.index)
+        value = self.compile_expr(node.value)
+
+        def exec_SetItem(frame: Namespace) -> None:
+            w_target = target(frame)
+            w_index = index(frame)
+            w_value = value(frame)
+            w_opimpl.call(vm, [w_target, w_index, w_value])
+        return exec_SetItem
+
+    def compile_stmt_StmtExpr(self, stmt: ast.StmtExpr,
+                              frame: Namespace) -> StmtFn:
+        value = self.compile_expr(stmt.value)
+
+        def exec_StmtExpr(frame: Namespace) -> None:
+            value(frame)
+        return exec_StmtExpr
+
+    def compile_stmt_If(self, if_node: ast.If, frame: Namespace) -> StmtFn:
+        w_True = B.w_True
+        test = self.compile_expr(if_node.test)
+        then_block = self.compile_block(if_node.then_body)
+        else_block = self.compile_block(if_node.else_body)
+
+        def exec_If(frame: Namespace) -> Optional[W_Object]:
+            if test(frame) is w_True:
+                return run_block(then_block, frame)
+            else:
+                return run_block(else_block, frame)
+        return exec_If
+
+    def compile_stmt_While(self, while_node: ast.While,
+                           frame: Namespace) -> StmtFn:
+        w_False = B.w_False
+        test = self.compile_expr(while_node.test)
+        body = self.compile_block(while_node.body)
+
+        def exec_While(frame: Namespace) -> Optional[W_Object]:
+            while test(frame) is not w_False:
+                w_res = run_block(body, frame)
+                if w_res is not None:
+                    return w_res
+            return None
+        return exec_While
+
+    # ==== expressions ====
+
+    def compile_expr_Constant(self, const: ast.Constant) -> ExprFn:
+        # unsupported literals are rejected directly by the parser, see
+        # Parser.from_py_expr_Constant
+        vm = self.vm
+        value = const.value
+        T = type(value)
+        assert T in (int, float, bool, str, NoneType)
+        w_const: W_Object
+        if isinstance(value, str):
+            w_const = vm.intern_str(value)
+        else:
+            w_const = vm.wrap(value)
+
+        def eval_Constant(frame: Namespace) -> W_Object:
+            return w_const
+        return eval_Constant
+
+    def compile_expr_FQNConst(self, const: ast.FQNConst) -> ExprFn:
+        vm = self.vm
+        fqn = const.fqn
+
+        def eval_FQNConst(frame: Namespace) -> W_Object:
+            w_value = vm.lookup_global(fqn)
+            assert w_value is not None
+            return w_value
+        return eval_FQNConst
+
+    def compile_expr_Name(self, name: ast.Name) -> ExprFn:
+        varname = name.id
+        sym = self.funcdef.symtable.lookup(varname)
+        if sym.fqn is not None:
+            vm = self.vm
+            fqn = sym.fqn
+
+            def eval_global(frame: Namespace) -> W_Object:
+                w_value = vm.lookup_global(fqn)
+                assert w_value is not None, \
+                    f'{fqn} not found. Bug in the ScopeAnalyzer?'
+                return w_value
+            return eval_global
+        elif sym.is_local:
+            def eval_local(frame: Namespace) -> W_Object:
+                w_obj = frame.get(varname)
+                if w_obj is None:
+                    raise SPyRuntimeError('read from uninitialized local')
+                return w_obj
+            return eval_local
+        else:
+            namespace = self.w_func.closure[sym.level]
+
+            def eval_outer(frame: Namespace) -> W_Object:
+                w_value = namespace[varname]
+                assert w_value is not None
+                return w_value
+            return eval_outer
+
+    def compile_expr_BinOp(self, binop: ast.BinOp) -> ExprFn:
+        vm = self.vm
+        w_opimpl = self.t.opimpl[binop]
+        assert w_opimpl, 'bug in the typechecker'
+        left = self.compile_expr(binop.left)
+        right = self.compile_expr(binop.right)
+
+        def eval_BinOp(frame: Namespace) -> W_Object:
+            w_l = left(frame)
+            w_r = right(frame)
+            return w_opimpl.call(vm, [w_l, w_r])
+        return eval_BinOp
+
+    compile_expr_Add = compile_expr_BinOp
+    compile_expr_Sub = compile_expr_BinOp
+    compile_expr_Mul = compile_expr_BinOp
+    compile_expr_Div = compile_expr_BinOp
+    compile_expr_Eq = compile_expr_BinOp
+    compile_expr_NotEq = compile_expr_BinOp
+    compile_expr_Lt = compile_expr_BinOp
+    compile_expr_LtE = compile_expr_BinOp
+    compile_expr_Gt = compile_expr_BinOp
+    compile_expr_GtE = compile_expr_BinOp
+
+    def compile_expr_Call(self, call: ast.Call) -> ExprFn:
+        vm = self.vm
+        color, w_functype = self.t.check_expr(call.func)
+        w_opimpl = self.t.opimpl[call]
+        func = self.compile_expr(call.func)
+        args = [self.compile_expr(arg) for arg in call.args]
+        w_STATIC_TYPE = B.w_STATIC_TYPE
+        # see ASTFrame.eval_expr_Call for the sanity checks
+        is_direct_call = w_opimpl.is_direct_call()
+        check_callable = is_direct_call and w_functype is B.w_dynamic
+        if is_direct_call:
+            assert color == 'blue', 'indirect calls not supported'
+
+        def eval_Call(frame: Namespace) -> W_Object:
+            w_func = func(frame)
+            # STATIC_TYPE is a special case, because it doesn't evaluate its
+            # arguments
+            if w_func is w_STATIC_TYPE:
+                return self._eval_STATIC_TYPE(call)
+            if check_callable and not isinstance(w_func, W_Func):
+                t = vm.dynamic_type(w_func)
+                raise SPyTypeError(f'cannot call objects of type `{t.name}`')
+            args_w = [w_func]
+            for arg in args:
+                args_w.append(arg(frame))
+            return w_opimpl.call(vm, args_w)
+        return eval_Call
+
+    def _eval_STATIC_TYPE(self, call: ast.Call) -> W_Object:
+        assert len(call.args) == 1
+        arg = call.args[0]
+        if isinstance(arg, ast.Name):
+            _, w_argtype = self.t.check_expr(arg)
+            return w_argtype
+        msg = 'STATIC_TYPE works only on simple expressions'
+        OP = arg.__class__.__name__
+        raise SPyTypeError.simple(msg, f'{OP} not allowed here', arg.loc)
+
+    def compile_expr_CallMethod(self, op: ast.CallMethod) -> ExprFn:
+        vm = self.vm
+        w_opimpl = self.t.opimpl[op]
+        target = self.compile_expr(op.target)
+        w_method = vm.wrap(op.method)
+        args = [self.compile_expr(arg) for arg in op.args]
+
+        def eval_CallMethod(frame: Namespace) -> W_Object:
+            args_w = [target(frame), w_method]
+            for arg in args:
+                args_w.append(arg(frame))
+            return w_opimpl.call(vm, args_w)
+        return eval_CallMethod
+
+    def compile_expr_GetItem(self, op: ast.GetItem) -> ExprFn:
+        vm = self.vm
+        w_opimpl = self.t.opimpl[op]
+        value = self.compile_expr(op.value)
+        index = self.compile_expr(op.index)
+
+        def eval_GetItem(frame: Namespace) -> W_Object:
+            w_val = value(frame)
+            w_i = index(frame)
+            return w_opimpl.call(vm, [w_val, w_i])
+        return eval_GetItem
+
+    def compile_expr_GetSlice(self, op: ast.GetSlice) -> ExprFn:
+        vm = self.vm
+        w_opimpl = self.t.opimpl[op]
+        value = self.compile_expr(op.value)
+        start = self.compile_expr(op.start)
+        stop = self.compile_expr(op.stop)
+
+        def eval_GetSlice(frame: Namespace) -> W_Object:
+            w_val = value(frame)
+            w_start = start(frame)
+            w_stop = stop(frame)
+            return w_opimpl.call(vm, [w_val, w_start, w_stop])
+        return eval_GetSlice
+
+    def compile_expr_GetAttr(self, op: ast.GetAttr) -> ExprFn:
+        vm = self.vm
+        w_opimpl = self.t.opimpl[op]
+        value = self.compile_expr(op.value)
+        w_attr = vm.wrap(op.attr)
+
+        def eval_GetAttr(frame: Namespace) -> W_Object:
+            return w_opimpl.call(vm, [value(frame), w_attr])
+        return eval_GetAttr
+
+    def compile_expr_List(self, op: ast.List) -> ExprFn:
+        color, w_listtype = self.t.check_expr(op)
+        assert issubclass(w_listtype.pyclass, W_List)
+        pyclass = w_listtype.pyclass
+        items = [self.compile_expr(item) for item in op.items]
+
+        def eval_List(frame: Namespace) -> W_Object:
+            items_w = [item(frame) for item in items]
+            return pyclass(items_w) # type: ignore
+        return eval_List
+
+    def compile_expr_Tuple(self, op: ast.Tuple) -> ExprFn:
+        color, w_tupletype = self.t.check_expr(op)
+        assert w_tupletype is B.w_tuple
+        items = [self.compile_expr(item) for item in op.items]
+
+        def eval_Tuple(frame: Namespace) -> W_Object:
+            return W_Tuple([item(frame) for item in items])
+        return eval_Tuple
@@ -6,6 +6,8 @@ from spy.fqn import QN
 from spy.vm.object import W_Object, W_Type, W_Void
 if TYPE_CHECKING:
     from spy.vm.vm import SPyVM
+    from spy.vm.closurecompiler import CompiledFunc
+    from spy.vm.typechecker import TypeChecker
 
 # we cannot import B due to circular imports, let's fake it
 B_w_Void = W_Void._w
@@ -162,6 +164,11 @@ class W_ASTFunc(W_Func):
     # types of local variables: this is non-None IIF the function has been
     # redshifted.
     locals_types_w: Optional[dict[str, W_Type]]
+    # the result of ClosureCompiler, computed lazily by get_compiled()
+    _compiled: Optional['CompiledFunc']
+    # the TypeChecker shared by all the calls, see get_typechecker()
+    _typechecker: Optional['TypeChecker']
+    _globals_version: int
 
     def __init__(self,
                  w_functype: W_FuncType,
@@ -176,6 +183,18 @@ class W_ASTFunc(W_Func):
         self.funcdef = funcdef
         self.closure = closure
         self.locals_types_w = locals_types_w
+        self._compiled = None
+        self._typechecker = None
+        self._globals_version = 0
+
+    def __getstate__(self) -> dict[str, Any]:
+        # the cached TypeChecker and compiled code are recomputed lazily,
+        # see VMSnapshot
+        state = self.__dict__.copy()
+        state['_compiled'] = None
+        state['_typechecker'] = None
+        state['_globals_version'] = 0
+        return state
 
     @property
     def redshifted(self) -> bool:
@@ -191,10 +210,57 @@ class W_ASTFunc(W_Func):
         return f"<spy function '{self.qn}'{extra}>"
 
     def spy_call(self, vm: 'SPyVM', args_w: list[W_Object]) -> W_Object:
+        # the static types of blue functions can depend on the values of
+        # their arguments, so we cannot compile them once and for all (see
+        # closurecompiler.py). Moreover, they are memoized by the bluecache,
+        # so we don't gain much by compiling them.
+        if vm.closure_compile and self.color == 'red':
+            return self.get_compiled(vm).run(args_w)
         from spy.vm.astframe import ASTFrame
         frame = ASTFrame(vm, self)
         return frame.run(args_w)
 
+    def get_compiled(self, vm: 'SPyVM') -> 'CompiledFunc':
+        self.invalidate_maybe(vm)
+        if self._compiled is None:
+            from spy.vm.closurecompiler import ClosureCompiler
+            self._compiled = ClosureCompiler(vm, self).compile()
+        return self._compiled
+
+    def get_typechecker(self, vm: 'SPyVM') -> 'TypeChecker':
+        """
+        Return the TypeChecker to use for a call to this function.
+
+        The typechecking results of red functions don't depend on the
+        arguments, so the same TypeChecker is shared by all the calls.  Since
+        funcdef and closure never change, caching it on the function object
+        is the same as keying it by (funcdef, closure).
+
+        Blue functions get a fresh TypeChecker for every call, because their
+        static types might depend on the values of their arguments.
+        """
+        from spy.vm.typechecker import TypeChecker
+        if self.color == 'blue':
+            return TypeChecker(vm, self)
+        self.invalidate_maybe(vm)
+        if self._typechecker is None:
+            self._typechecker = TypeChecker(vm, self)
+        return self._typechecker
+
+    def invalidate_maybe(self, vm: 'SPyVM') -> None:
+        """
+        Throw away the cached TypeChecker and compiled code if any of the
+        globals used by the function changed its type since we typechecked
+        it.
+        """
+        if self._globals_version == vm.globals_version:
+            return
+        self._globals_version = vm.globals_version
+        t = self._typechecker
+        if t is not None and not t.is_still_valid():
+            self._typechecker = None
+            self._compiled = None
+
 
 class W_BuiltinFunc(W_Func):
     """
@@ -208,7 +274,8 @@ class W_BuiltinFunc(W_Func):
         self.w_functype = w_functype
         self.qn = qn
         # _pyfunc should NEVER be called directly, because it bypasses the
-        # bluecache
+        # bluecache. The only exception is W_OpImpl._make_fastcall, which
+        # does it only for red functions
         self._pyfunc = pyfunc
 
     def __repr__(self) -> str:
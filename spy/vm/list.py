@@ -54,6 +54,11 @@ class W_List(W_Object, metaclass=Meta_W_List):
     see its docstring for details.
     """
     __spy_storage_category__ = 'reference'
+    # this is set only by the specialized list types, but declaring it here
+    # makes it possible to use it after an isinstance(w_obj, W_List). The
+    # type of the items depends on the specialization (e.g. W_List[W_Value]
+    # contains W_Values), so we cannot be more precise than Any here
+    items_w: list[Any]
 
     @classmethod
     def make_prebuilt(cls, itemcls: Type[W_Object]) -> None:
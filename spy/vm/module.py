@@ -18,6 +18,9 @@ class W_Module(W_Object):
     vm: 'SPyVM'
     name: str
     filepath: str
+    # the globals which belong to this module, in definition order. This is
+    # maintained by SPyVM._set_global and should not be modified directly
+    _dict_w: dict[FQN, W_Object]
     _frozen: bool
     __spy_storage_category__ = 'reference'
 
@@ -25,6 +28,7 @@ class W_Module(W_Object):
         self.vm = vm
         self.name = name
         self.filepath = filepath
+        self._dict_w = {}
 
     def __repr__(self) -> str:
         return f'<spy module {self.name}>'
@@ -82,14 +86,10 @@ class W_Module(W_Object):
         self.vm.store_global(fqn, w_value)
 
     def keys(self) -> Iterable[FQN]:
-        for fqn in self.vm.globals_w.keys():
-            if fqn.modname == self.name:
-                yield fqn
+        return self._dict_w.keys()
 
     def items_w(self) -> Iterable[tuple[FQN, W_Object]]:
-        for fqn, w_obj in self.vm.globals_w.items():
-            if fqn.modname == self.name:
-                yield fqn, w_obj
+        return self._dict_w.items()
 
     def pp(self) -> None:
         """
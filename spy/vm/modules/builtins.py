@@ -4,10 +4,16 @@ Second half of the `builtins` module.
 The first half is in vm/b.py. See its docstring for more details.
 """
 
+import weakref
 from typing import TYPE_CHECKING, Any
+from spy.fqn import QN
+from spy.llwasm import LLWasmInstance
 from spy.vm.object import (W_I32, W_F64, W_Bool, W_Dynamic, W_Void, W_Object,
                            W_Type)
 from spy.vm.str import W_Str
+from spy.vm.list import W_List
+from spy.vm.opimpl import W_OpImpl, W_Value
+from spy.vm.sig import spy_builtin
 from spy.vm.b import BUILTINS, B
 
 if TYPE_CHECKING:
@@ -65,3 +71,83 @@ def print_void(vm: 'SPyVM', w_x: W_Void) -> W_Void:
 def print_str(vm: 'SPyVM', w_x: W_Str) -> W_Void:
     PY_PRINT(vm.unwrap(w_x))
     return B.w_None
+
+
+@BUILTINS.spytype('StrBuilder')
+class W_StrBuilder(W_Object):
+    """
+    Build a string incrementally, in amortized linear time.
+
+    This is a 'spy_StrBuilder *' living in the linear memory of the VM (see
+    libspy/include/spy/strbuilder.h): all the operations are implemented by
+    calling the corresponding libspy functions, exactly as in the C backend.
+    """
+    __spy_storage_category__ = 'reference'
+    vm: 'SPyVM'
+    ptr: int
+
+    def __init__(self, vm: 'SPyVM') -> None:
+        self.vm = vm
+        self.ptr = vm.ll.call('spy_builtins$StrBuilder_new')
+        self._free_on_death()
+
+    def _free_on_death(self) -> None:
+        # see W_Str._free_on_death
+        if self.vm.ll.arena_depth > 0:
+            raise ValueError('cannot create a StrBuilder inside a libspy '
+                             'arena')
+        fin = weakref.finalize(self, ll_spy_StrBuilder_free, self.vm.ll,
+                               self.ptr)
+        fin.atexit = False
+
+    @staticmethod
+    def meta_op_CALL(vm: 'SPyVM', wv_obj: W_Value,
+                     w_values: W_Dynamic) -> W_OpImpl:
+        assert isinstance(w_values, W_List)
+        if len(w_values.items_w) == 0:
+            return W_OpImpl.with_values(vm.wrap_func(StrBuilder_new), [])
+        else:
+            return W_OpImpl.NULL
+
+    @staticmethod
+    def op_CALL_METHOD(vm: 'SPyVM', wv_obj: W_Value, wv_method: W_Value,
+                       w_values: W_Dynamic) -> W_OpImpl:
+        meth = wv_method.blue_unwrap_str(vm)
+        if meth == 'append':
+            fn = StrBuilder_append
+        elif meth == 'append_i32':
+            fn = StrBuilder_append_i32
+        elif meth == 'build':
+            fn = StrBuilder_build
+        else:
+            return W_OpImpl.NULL
+        assert isinstance(w_values, W_List)
+        args_wv = [wv_obj]
+        for wv_arg in w_values.items_w:
+            assert isinstance(wv_arg, W_Value)
+            args_wv.append(wv_arg)
+        return W_OpImpl.with_values(vm.wrap_func(fn), args_wv)
+
+def ll_spy_StrBuilder_free(ll: LLWasmInstance, ptr: int) -> None:
+    ll.call('spy_strbuilder_free', ptr)
+
+@spy_builtin(QN('builtins::StrBuilder_new'))
+def StrBuilder_new(vm: 'SPyVM') -> W_StrBuilder:
+    return W_StrBuilder(vm)
+
+@spy_builtin(QN('builtins::StrBuilder_append'))
+def StrBuilder_append(vm: 'SPyVM', w_sb: W_StrBuilder, w_s: W_Str) -> W_Void:
+    vm.ll.call('spy_builtins$StrBuilder_append', w_sb.ptr, w_s.ptr)
+    return B.w_None
+
+@spy_builtin(QN('builtins::StrBuilder_append_i32'))
+def StrBuilder_append_i32(vm: 'SPyVM', w_sb: W_StrBuilder,
+                          w_x: W_I32) -> W_Void:
+    x = vm.unwrap_i32(w_x)
+    vm.ll.call('spy_builtins$StrBuilder_append_i32', w_sb.ptr, x)
+    return B.w_None
+
+@spy_builtin(QN('builtins::StrBuilder_build'))
+def StrBuilder_build(vm: 'SPyVM', w_sb: W_StrBuilder) -> W_Str:
+    ptr = vm.ll.call('spy_builtins$StrBuilder_build', w_sb.ptr)
+    return W_Str.from_ptr(vm, ptr, owned=True)
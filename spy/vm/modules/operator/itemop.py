@@ -26,6 +26,25 @@ def GETITEM(vm: 'SPyVM', wv_obj: W_Value, wv_i: W_Value) -> W_OpImpl:
     return w_opimpl
 
 
+@OP.builtin(color='blue')
+def GETSLICE(vm: 'SPyVM', wv_obj: W_Value, wv_start: W_Value,
+             wv_stop: W_Value) -> W_OpImpl:
+    from spy.vm.typechecker import typecheck_opimpl
+    w_opimpl = W_OpImpl.NULL
+    pyclass = wv_obj.w_static_type.pyclass
+    if pyclass.has_meth_overriden('op_GETSLICE'):
+        w_opimpl = pyclass.op_GETSLICE(vm, wv_obj, wv_start, wv_stop)
+
+    typecheck_opimpl(
+        vm,
+        w_opimpl,
+        [wv_obj, wv_start, wv_stop],
+        dispatch = 'single',
+        errmsg = 'cannot do `{0}`[...:...]'
+    )
+    return w_opimpl
+
+
 @OP.builtin(color='blue')
 def SETITEM(vm: 'SPyVM', wv_obj: W_Value, wv_i: W_Value,
             wv_v: W_Value) -> W_OpImpl:
@@ -1,20 +1,44 @@
 """
 Poor man's implementation of multimethods.
 
-This uses a super simple logic: we keep a table of ('op', ltype, rtype) and we
-do precise lookups. For now, there is no support for implicit conversions,
-supertypes, etc.
-
-When registering an opimpl, you can specify only one of the two types, leaving
-the other as `None`. During lookup, we first try a precise lookup, and the one
-of the two partial ones, in order.
+We keep a table of ('op', ltype, rtype) -> w_func. When registering an opimpl,
+you can specify only one of the two types, leaving the other as `None`.
 
 E.g.:
     MM.register('+', 'dynamic', None, OP.w_dynamic_add)
     MM.register('+', None, 'dynamic', OP.w_dynamic_add)
 
 will call w_dynamic_add as long as one of the two operands is 'dynamic'.
+
+During lookup, each operand type is expanded into a list of candidate types,
+in order of preference (see MultiMethodTable.candidates):
+
+  1. the type itself;
+
+  2. its supertypes, following the w_base chain. For a W_TypeDef, we follow
+     its origin type instead;
+
+  3. the types it can be implicitly promoted to, e.g. i32 -> f64 (see
+     register_promotion), together with their own supertypes.
+
+Then we pick the first registered impl, trying first all the (ltype, rtype)
+pairs, ordered by "distance" from the actual types, and then the partial ones,
+i.e. (ltype, None) and (None, rtype). The necessary conversions are inserted
+by typecheck_opimpl as usual.
+
+This means that e.g. we don't need to register '+' for (i32, f64) and (f64,
+i32): they both resolve to the (f64, f64) impl.
+
+Both the resolution and the result of typecheck_opimpl (i.e., the converters)
+are cached per-VM, keyed by (op, ltype, rtype). The dispatch table is filled
+eagerly for all the pairs of registered types, and lazily for the others
+(e.g. user-defined types).
+
+Note that we don't cache the W_OpImpls themselves: they contain the W_Values
+of the call site (with their locations and symbols), so lookup() builds a
+fresh one every time.
 """
+import weakref
 from typing import Optional, TYPE_CHECKING
 from spy.vm.b import B
 from spy.vm.object import W_Type, W_Object
@@ -22,8 +46,13 @@ from spy.vm.function import W_Func
 from spy.vm.opimpl import W_OpImpl, W_Value
 if TYPE_CHECKING:
     from spy.vm.vm import SPyVM
+    from spy.vm.typeconverter import TypeConverter
 
 KeyType = tuple[str, Optional[W_Type], Optional[W_Type]]
+# W_Types are not necessarily hashable (e.g. W_FuncType), so we key the caches
+# by id(). The values keep the types alive, so that the ids cannot be reused.
+CacheKey = tuple[str, int, int]
+Converters = list[Optional['TypeConverter']]
 
 def parse_type(s: Optional[str]) -> Optional[W_Type]:
     if s is None:
@@ -32,11 +61,30 @@ def parse_type(s: Optional[str]) -> Optional[W_Type]:
     assert isinstance(w_res, W_Type)
     return w_res
 
+
+class MMCache:
+    """
+    The per-VM caches of a MultiMethodTable
+    """
+    # (op, ltype, rtype) -> (w_ltype, w_rtype, w_func or None)
+    table: dict[CacheKey, tuple[W_Type, W_Type, Optional[W_Func]]]
+    # (op, ltype, rtype) -> (w_ltype, w_rtype, w_func, converters)
+    opimpls: dict[CacheKey, tuple[W_Type, W_Type, W_Func, Converters]]
+
+    def __init__(self) -> None:
+        self.table = {}
+        self.opimpls = {}
+
+
 class MultiMethodTable:
     impls: dict[KeyType, W_Func]
+    promotions: dict[W_Type, list[W_Type]]
+    _caches: 'weakref.WeakKeyDictionary[SPyVM, MMCache]'
 
     def __init__(self) -> None:
         self.impls = {}
+        self.promotions = {}
+        self._caches = weakref.WeakKeyDictionary()
 
     def register(self,
                  op: str,
@@ -49,28 +97,139 @@ class MultiMethodTable:
         key = (op, w_ltype, w_rtype)
         assert key not in self.impls
         self.impls[key] = w_func
+        self._caches.clear()
 
     def register_partial(self, op: str, atype: str, w_func: W_Object) -> None:
         self.register(op, atype, None, w_func)
         self.register(op, None, atype, w_func)
 
+    def register_promotion(self, fromtype: str, totype: str) -> None:
+        """
+        Declare that fromtype can be implicitly promoted to totype when
+        looking up an impl. The actual conversion is done by the TypeConverter
+        returned by convert_type_maybe.
+        """
+        w_fromtype = parse_type(fromtype)
+        w_totype = parse_type(totype)
+        assert w_fromtype is not None and w_totype is not None
+        self.promotions.setdefault(w_fromtype, []).append(w_totype)
+        self._caches.clear()
+
+    def get_cache(self, vm: 'SPyVM') -> MMCache:
+        cache = self._caches.get(vm)
+        if cache is None:
+            cache = MMCache()
+            self._caches[vm] = cache
+            self.fill_table(cache)
+        return cache
+
+    def fill_table(self, cache: MMCache) -> None:
+        """
+        Precompute the dispatch table for all the pairs of registered types
+        """
+        ops = set()
+        types_w = []
+        for op, w_ltype, w_rtype in self.impls:
+            ops.add(op)
+            for w_type in (w_ltype, w_rtype):
+                if w_type is not None and w_type not in types_w:
+                    types_w.append(w_type)
+        for op in sorted(ops):
+            for w_ltype in types_w:
+                for w_rtype in types_w:
+                    self.resolve(cache, op, w_ltype, w_rtype)
+
+    # ==== lookup ====
+
+    def supertypes(self, w_type: W_Type) -> list[W_Type]:
+        """
+        Return w_type and all its supertypes, following W_TypeDef origins
+        """
+        from spy.vm.modules.types import W_TypeDef
+        res: list[W_Type] = []
+        w_t: W_Object = w_type
+        while w_t is not B.w_None:
+            assert isinstance(w_t, W_Type)
+            if w_t in res:
+                break
+            res.append(w_t)
+            if isinstance(w_t, W_TypeDef):
+                w_t = w_t.w_origintype
+            else:
+                w_t = w_t.w_base
+        return res
+
+    def candidates(self, w_type: W_Type) -> list[W_Type]:
+        """
+        Return the list of types to try when looking up an impl for w_type,
+        in order of preference
+        """
+        res = self.supertypes(w_type)
+        for w_t in res[:]:
+            for w_promoted in self.promotions.get(w_t, []):
+                for w_sup in self.supertypes(w_promoted):
+                    if w_sup not in res:
+                        res.append(w_sup)
+        return res
+
+    def resolve(self, cache: MMCache, op: str,
+                w_ltype: W_Type, w_rtype: W_Type) -> Optional[W_Func]:
+        key = (op, id(w_ltype), id(w_rtype))
+        entry = cache.table.get(key)
+        if entry is not None:
+            return entry[2]
+        w_func = self._resolve(op, w_ltype, w_rtype)
+        cache.table[key] = (w_ltype, w_rtype, w_func)
+        return w_func
+
+    def _resolve(self, op: str,
+                 w_ltype: W_Type, w_rtype: W_Type) -> Optional[W_Func]:
+        lcands = self.candidates(w_ltype)
+        rcands = self.candidates(w_rtype)
+        # first, the full pairs in order of distance: the distance of a pair
+        # is the sum of the indexes of the two candidates
+        pairs = [(i+j, i, w_l, w_r)
+                 for i, w_l in enumerate(lcands)
+                 for j, w_r in enumerate(rcands)]
+        pairs.sort(key=lambda p: (p[0], p[1]))
+        for _, _, w_l, w_r in pairs:
+            w_func = self.impls.get((op, w_l, w_r))
+            if w_func:
+                return w_func
+        # then, the partial ones
+        for w_l in lcands:
+            w_func = self.impls.get((op, w_l, None))
+            if w_func:
+                return w_func
+        for w_r in rcands:
+            w_func = self.impls.get((op, None, w_r))
+            if w_func:
+                return w_func
+        return None
+
     def lookup(self, vm: 'SPyVM', op: str,
                wv_l: W_Value, wv_r: W_Value) -> W_OpImpl:
         from spy.vm.typechecker import typecheck_opimpl
         w_ltype = wv_l.w_static_type
         w_rtype = wv_r.w_static_type
-        keys = [
-            (op, w_ltype, w_rtype),  # most precise lookup
-            (op, w_ltype, None),     # less precise ones
-            (op, None,    w_rtype),
-        ]
-        w_opimpl = W_OpImpl.NULL
-        for key in keys:
-            w_func = self.impls.get(key)
-            if w_func:
-                w_opimpl = W_OpImpl.simple(w_func)
-                break
+        cache = self.get_cache(vm)
+        key = (op, id(w_ltype), id(w_rtype))
+        entry = cache.opimpls.get(key)
+        if entry is not None:
+            _, _, w_cached_func, converters = entry
+            w_opimpl = W_OpImpl.simple(w_cached_func)
+            w_opimpl.set_args_wv([wv_l, wv_r])
+            w_opimpl._converters = converters[:]
+            w_opimpl._typechecked = True
+            return w_opimpl
         #
+        w_func = self.resolve(cache, op, w_ltype, w_rtype)
+        if w_func is None:
+            w_opimpl = W_OpImpl.NULL
+        else:
+            w_opimpl = W_OpImpl.simple(w_func)
+        # if it fails, typecheck_opimpl raises: errors are not cached, because
+        # they contain the locations of the operands
         typecheck_opimpl(
             vm,
             w_opimpl,
@@ -78,4 +237,8 @@ class MultiMethodTable:
             dispatch = 'multi',
             errmsg = 'cannot do `{0}` %s `{1}`' % op
         )
+        assert w_func is not None
+        assert w_opimpl._converters is not None
+        cache.opimpls[key] = (w_ltype, w_rtype, w_func,
+                              w_opimpl._converters[:])
         return w_opimpl
@@ -12,14 +12,14 @@ def str_add(vm: 'SPyVM', w_a: W_Str, w_b: W_Str) -> W_Str:
     assert isinstance(w_a, W_Str)
     assert isinstance(w_b, W_Str)
     ptr_c = vm.ll.call('spy_str_add', w_a.ptr, w_b.ptr)
-    return W_Str.from_ptr(vm, ptr_c)
+    return W_Str.from_ptr(vm, ptr_c, owned=True)
 
 @OP.builtin
 def str_mul(vm: 'SPyVM', w_a: W_Str, w_b: W_I32) -> W_Str:
     assert isinstance(w_a, W_Str)
     assert isinstance(w_b, W_I32)
     ptr_c = vm.ll.call('spy_str_mul', w_a.ptr, w_b.value)
-    return W_Str.from_ptr(vm, ptr_c)
+    return W_Str.from_ptr(vm, ptr_c, owned=True)
 
 @OP.builtin
 def str_eq(vm: 'SPyVM', w_a: W_Str, w_b: W_Str) -> W_Bool:
@@ -52,7 +52,7 @@ from spy.fqn import QN
 if TYPE_CHECKING:
     from spy.vm.vm import SPyVM
     from spy.vm.str import W_Str
-    from spy.vm.opimpl import W_OpImpl
+    from spy.vm.opimpl import W_OpImpl, W_Value
 
 # Basic setup of the object model: <object> and <type>
 # =====================================================
@@ -156,6 +156,11 @@ class W_Object:
                    wv_i: 'W_Value') -> 'W_OpImpl':
         raise NotImplementedError('this should never be called')
 
+    @staticmethod
+    def op_GETSLICE(vm: 'SPyVM', wv_obj: 'W_Value', wv_start: 'W_Value',
+                    wv_stop: 'W_Value') -> 'W_OpImpl':
+        raise NotImplementedError('this should never be called')
+
     @staticmethod
     def op_SETITEM(vm: 'SPyVM', wv_obj: 'W_Value', wv_i: 'W_Value',
                    wv_v: 'W_Value') -> 'W_OpImpl':
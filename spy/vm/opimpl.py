@@ -1,18 +1,23 @@
 from typing import (Annotated, Optional, ClassVar, no_type_check, TypeVar, Any,
-                    TYPE_CHECKING)
+                    Callable, TYPE_CHECKING)
 from spy import ast
 from spy.fqn import QN
 from spy.location import Loc
 from spy.irgen.symtable import Symbol
 from spy.vm.object import Member, W_Type, W_Object, spytype, W_Bool
-from spy.vm.function import W_Func, W_FuncType, W_DirectCall
+from spy.vm.function import (W_Func, W_FuncType, W_DirectCall,
+                              W_BuiltinFunc)
 from spy.vm.sig import spy_builtin
 
 if TYPE_CHECKING:
+    from spy.vm.vm import SPyVM
     from spy.vm.typeconverter import TypeConverter
 
 T = TypeVar('T')
 
+# the signature of W_OpImpl._fastcall
+FastCall = Callable[['SPyVM', list[W_Object]], W_Object]
+
 @spytype('Value')
 class W_Value(W_Object):
     """
@@ -95,8 +100,8 @@ class W_Value(W_Object):
 
     def blue_unwrap_str(self, vm: 'SPyVM') -> str:
         from spy.vm.b import B
-        self.blue_ensure(vm, B.w_str)
-        return vm.unwrap_str(self._w_blueval)
+        w_obj = self.blue_ensure(vm, B.w_str)
+        return vm.unwrap_str(w_obj)
 
     @staticmethod
     def op_EQ(vm: 'SPyVM', wv_l: 'W_Value', wv_r: 'W_Value') -> 'W_OpImpl':
@@ -135,6 +140,9 @@ class W_OpImpl(W_Object):
     _w_func: Optional[W_Func]
     _args_wv: Optional[list[W_Value]]
     _converters: Optional[list[Optional['TypeConverter']]]
+    _typechecked: bool
+    # specialized version of call(), computed lazily by _make_fastcall()
+    _fastcall: Optional[FastCall]
 
     def __init__(self, *args) -> None:
         raise NotImplementedError('Please use W_OpImpl.simple()')
@@ -146,6 +154,7 @@ class W_OpImpl(W_Object):
         w_opimpl._args_wv = None
         w_opimpl._converters = None
         w_opimpl._typechecked = False
+        w_opimpl._fastcall = None
         return w_opimpl
 
     @classmethod
@@ -155,8 +164,15 @@ class W_OpImpl(W_Object):
         w_opimpl._args_wv = args_wv
         w_opimpl._converters = [None] * len(args_wv)
         w_opimpl._typechecked = False
+        w_opimpl._fastcall = None
         return w_opimpl
 
+    def __getstate__(self) -> dict[str, Any]:
+        # _fastcall is a closure which cannot be pickled, see VMSnapshot
+        state = self.__dict__.copy()
+        state['_fastcall'] = None
+        return state
+
     def __repr__(self) -> str:
         if self._w_func is None:
             return f"<spy OpImpl NULL>"
@@ -175,13 +191,13 @@ class W_OpImpl(W_Object):
     def is_simple(self) -> bool:
         return self._args_wv is None
 
-    def is_direct_call(self):
+    def is_direct_call(self) -> bool:
         """
         This is a hack. See W_Func.op_CALL and ASTFrame.eval_expr_Call.
         """
         return isinstance(self._w_func, W_DirectCall)
 
-    def is_valid(self):
+    def is_valid(self) -> bool:
         return not self.is_null() and self._typechecked
 
     @property
@@ -192,13 +208,19 @@ class W_OpImpl(W_Object):
     def w_restype(self) -> W_Type:
         return self._w_func.w_functype.w_restype
 
-    def set_args_wv(self, args_wv):
+    def set_args_wv(self, args_wv: list[W_Value]) -> None:
         assert self._args_wv is None
         assert self._converters is None
         self._args_wv = args_wv[:]
         self._converters = [None] * len(args_wv)
 
     def call(self, vm: 'SPyVM', orig_args_w: list[W_Object]) -> W_Object:
+        fastcall = self._fastcall
+        if fastcall is None:
+            fastcall = self._fastcall = self._make_fastcall(vm)
+        return fastcall(vm, orig_args_w)
+
+    def _call_slow(self, vm: 'SPyVM', orig_args_w: list[W_Object]) -> W_Object:
         assert self.is_valid()
         real_args_w = []
         for wv_arg, conv in zip(self._args_wv, self._converters):
@@ -207,11 +229,118 @@ class W_OpImpl(W_Object):
                 w_arg = conv.convert(vm, w_arg)
             real_args_w.append(w_arg)
         #
+        # the types of the arguments have been checked by typecheck_opimpl
+        # against self.w_functype, so we can use call_trusted (which still
+        # checks them unless vm.trust_typechecker is set). The exception is a
+        # direct call to an object whose type is not exactly the one we
+        # checked against, e.g. a call to a `dynamic` (see callop.CALL)
         if self.is_direct_call():
             w_func = orig_args_w[0]
+            assert isinstance(w_func, W_Func)
+            w_functype = w_func.w_functype
+            if w_functype is self.w_functype or w_functype == self.w_functype:
+                return vm.call_trusted(w_func, real_args_w)
             return vm.call(w_func, real_args_w)
         else:
-            return vm.call(self._w_func, real_args_w)
+            assert self._w_func is not None
+            return vm.call_trusted(self._w_func, real_args_w)
+
+    def _make_fastcall(self, vm: 'SPyVM') -> FastCall:
+        """
+        Return a version of call() which is specialized for this OpImpl.
+
+        For red builtin functions, we bypass vm.call and call _pyfunc
+        directly, with the argument indexes and the converters baked in.
+        Blue functions must go through vm.call, because of the bluecache.
+
+        Note that we still need to check the types of the arguments: the
+        TypeChecker computes the static types of red globals from their
+        values at check time (see TypeChecker.check_expr_Name), so a value
+        of the "wrong" type can reach us at runtime. If vm.trust_typechecker
+        is True, we skip the check.
+        """
+        assert self.is_valid()
+        w_func = self._w_func
+        if (self.is_direct_call() or
+            not isinstance(w_func, W_BuiltinFunc) or
+            w_func.color == 'blue'):
+            return self._call_slow
+        #
+        from spy.vm.b import B
+        pyfunc = w_func._pyfunc
+        is_void = w_func.w_functype.w_restype is B.w_void
+        assert self._args_wv is not None
+        assert self._converters is not None
+        indexes = tuple([wv.i for wv in self._args_wv])
+        converters = tuple(self._converters)
+        w_types = tuple([p.w_type for p in w_func.w_functype.params])
+        if vm.trust_typechecker:
+            return self._make_fastcall_trusted(pyfunc, is_void, indexes,
+                                               converters)
+        if any(converters):
+            def fastcall(vm: 'SPyVM', orig_args_w: list[W_Object]) -> W_Object:
+                args_w = []
+                for i, conv, w_type in zip(indexes, converters, w_types):
+                    w_arg = orig_args_w[i]
+                    if conv is not None:
+                        w_arg = conv.convert(vm, w_arg)
+                    vm.typecheck(w_arg, w_type)
+                    args_w.append(w_arg)
+                return pyfunc(vm, *args_w)
+        elif indexes == (0, 1):
+            # the most common case, e.g. all the binary operators
+            w_type0, w_type1 = w_types
+            def fastcall(vm: 'SPyVM', orig_args_w: list[W_Object]) -> W_Object:
+                w_a = orig_args_w[0]
+                w_b = orig_args_w[1]
+                vm.typecheck(w_a, w_type0)
+                vm.typecheck(w_b, w_type1)
+                return pyfunc(vm, w_a, w_b)
+        else:
+            def fastcall(vm: 'SPyVM', orig_args_w: list[W_Object]) -> W_Object:
+                args_w = [orig_args_w[i] for i in indexes]
+                for w_arg, w_type in zip(args_w, w_types):
+                    vm.typecheck(w_arg, w_type)
+                return pyfunc(vm, *args_w)
+        return self._wrap_void(fastcall, is_void)
+
+    def _make_fastcall_trusted(self, pyfunc: Callable, is_void: bool,
+                               indexes: tuple[int, ...],
+                               converters: tuple[Optional['TypeConverter'], ...]
+                               ) -> FastCall:
+        """
+        Like _make_fastcall, but without the typechecks: this is used only if
+        vm.trust_typechecker is True.
+        """
+        if any(converters):
+            def fastcall(vm: 'SPyVM', orig_args_w: list[W_Object]) -> W_Object:
+                args_w = []
+                for i, conv in zip(indexes, converters):
+                    w_arg = orig_args_w[i]
+                    if conv is not None:
+                        w_arg = conv.convert(vm, w_arg)
+                    args_w.append(w_arg)
+                return pyfunc(vm, *args_w)
+        elif indexes == (0, 1):
+            def fastcall(vm: 'SPyVM', orig_args_w: list[W_Object]) -> W_Object:
+                return pyfunc(vm, orig_args_w[0], orig_args_w[1])
+        else:
+            def fastcall(vm: 'SPyVM', orig_args_w: list[W_Object]) -> W_Object:
+                return pyfunc(vm, *[orig_args_w[i] for i in indexes])
+        return self._wrap_void(fastcall, is_void)
+
+    @staticmethod
+    def _wrap_void(fastcall: FastCall, is_void: bool) -> FastCall:
+        if not is_void:
+            return fastcall
+        # see W_BuiltinFunc.spy_call
+        from spy.vm.b import B
+        def fastcall_void(vm: 'SPyVM', orig_args_w: list[W_Object]) -> W_Object:
+            w_res = fastcall(vm, orig_args_w)
+            if w_res is None:
+                return B.w_None
+            return w_res
+        return fastcall_void
 
     def redshift_args(self, vm: 'SPyVM',
                       orig_args: list[ast.Expr]) -> list[ast.Expr]:
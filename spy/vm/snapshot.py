@@ -0,0 +1,171 @@
+"""
+Snapshots of a fully initialized SPyVM.
+
+A snapshot contains a frozen copy of all the state of the VM (globals,
+modules, bluecache, etc.) plus the content of the libspy linear memory, and
+it can be used to create any number of independent VMs with
+SPyVM.from_snapshot(). This is much faster than creating a new VM and
+re-importing/re-executing the same modules from scratch.
+
+The state is copied by pickling it. Objects which are shared by all the VMs of
+the process are not copied, but pickled by reference (see SnapshotPickler):
+
+  - all the W_Types: they are compared by identity everywhere, and e.g. the
+    pyclass of list[T] is cached globally by make_list_type;
+
+  - builtin functions, and in general all the objects which live in the
+    ModuleRegistries and in class attributes of W_* classes (e.g. B.w_None,
+    W_OpImpl.NULL);
+
+  - the vm itself, which is replaced by the new one when restoring.
+
+Note that the linear memory is copied verbatim: this works because the wasm
+globals of libspy (e.g. the stack pointer) are always in their initial state
+between two calls.
+
+The objects which own some libspy memory (W_Str and W_StrBuilder) free it
+when they die, by using weakref.finalize: the finalizers are not pickled, so
+the SnapshotPickler records these objects, and restore() recreates their
+finalizers once the memory of the new VM is ready.
+"""
+
+import io
+import pickle
+from typing import TYPE_CHECKING, Any, Optional, Union
+from spy.vm.object import W_Object, W_Type
+from spy.vm.function import W_BuiltinFunc
+from spy.vm.str import W_Str
+from spy.vm.modules.builtins import BUILTINS, W_StrBuilder
+from spy.vm.modules.operator import OPERATOR
+from spy.vm.modules.types import TYPES
+from spy.vm.modules.rawbuffer import RAW_BUFFER
+from spy.vm.modules.jsffi import JSFFI
+if TYPE_CHECKING:
+    from spy.vm.vm import SPyVM
+
+
+def all_subclasses(cls: type) -> list[type]:
+    result = []
+    todo = [cls]
+    while todo:
+        cls = todo.pop()
+        for subcls in cls.__subclasses__():
+            result.append(subcls)
+            todo.append(subcls)
+    return result
+
+REGISTRIES = [BUILTINS, OPERATOR, TYPES, RAW_BUFFER, JSFFI]
+
+def find_shared_objects() -> list[Any]:
+    """
+    Find all the objects which must be pickled by reference, apart from the
+    W_Types and builtin functions which are recognized by their class.
+    """
+    shared = []
+    for reg in REGISTRIES:
+        for qn, w_obj in reg.content:
+            shared.append(w_obj)
+    for cls in [W_Object] + all_subclasses(W_Object):
+        for value in vars(cls).values():
+            if isinstance(value, W_Object):
+                shared.append(value)
+    return shared
+
+
+class SnapshotPickler(pickle.Pickler):
+
+    def __init__(self, f: io.BytesIO, vm: 'SPyVM',
+                 shared: dict[int, Any]) -> None:
+        super().__init__(f, protocol=pickle.HIGHEST_PROTOCOL)
+        self.vm = vm
+        self.shared = shared
+        self.owned_w: dict[int, Union[W_Str, W_StrBuilder]] = {}
+
+    def persistent_id(self, obj: Any) -> Any:
+        if ((isinstance(obj, W_Str) and obj._owned) or
+            isinstance(obj, W_StrBuilder)):
+            self.owned_w[id(obj)] = obj
+        if obj is self.vm:
+            return 'vm'
+        if isinstance(obj, (W_Type, W_BuiltinFunc)) or id(obj) in self.shared:
+            self.shared[id(obj)] = obj
+            return id(obj)
+        return None
+
+
+class SnapshotUnpickler(pickle.Unpickler):
+
+    def __init__(self, f: io.BytesIO, vm: 'SPyVM',
+                 shared: dict[int, Any]) -> None:
+        super().__init__(f)
+        self.vm = vm
+        self.shared = shared
+
+    def persistent_load(self, pid: Any) -> Any:
+        if pid == 'vm':
+            return self.vm
+        return self.shared[pid]
+
+
+class VMSnapshot:
+    """
+    A frozen copy of the state of a SPyVM, see SPyVM.snapshot().
+    """
+    data: bytes
+    shared: dict[int, Any]
+    memory: Optional[bytes]
+
+    def __init__(self, data: bytes, shared: dict[int, Any],
+                 memory: Optional[bytes]) -> None:
+        self.data = data
+        self.shared = shared
+        self.memory = memory
+
+    @classmethod
+    def from_vm(cls, vm: 'SPyVM') -> 'VMSnapshot':
+        shared = {id(obj): obj for obj in find_shared_objects()}
+        state = vm.__dict__.copy()
+        del state['_ll']
+        # reverse_globals and the bluecache are keyed by id(): store the
+        # objects themselves, and recompute the keys when restoring
+        state['reverse_globals'] = [
+            (vm.globals_w[fqns[0]], fqns)
+            for fqns in vm.reverse_globals.values()
+        ]
+        f = io.BytesIO()
+        pickler = SnapshotPickler(f, vm, shared)
+        pickler.dump(state)
+        # the memo is kept between the two dumps, so the restored list will
+        # contain the very same objects which are referenced by the state
+        pickler.dump(list(pickler.owned_w.values()))
+        memory = None
+        if vm._ll is not None:
+            memory = bytes(vm._ll.mem.get_view())
+        return cls(f.getvalue(), shared, memory)
+
+    def restore(self, vm: 'SPyVM') -> None:
+        """
+        Initialize the uninitialized vm with the content of the snapshot.
+        """
+        f = io.BytesIO(self.data)
+        unpickler = SnapshotUnpickler(f, vm, self.shared)
+        state = unpickler.load()
+        owned_w = unpickler.load()
+        state['reverse_globals'] = {
+            id(w_obj): fqns
+            for w_obj, fqns in state['reverse_globals']
+        }
+        vm.__dict__.update(state)
+        vm._ll = None
+        vm.bluecache.rehash()
+        if self.memory is not None:
+            mem = vm.ll.mem
+            if len(mem.get_view()) > len(self.memory):
+                raise ValueError(
+                    'the snapshot memory is smaller than the initial memory '
+                    'of libspy: the snapshot was taken with a different '
+                    'build of libspy')
+            mem.grow_to(len(self.memory))
+            mem.get_view()[:len(self.memory)] = self.memory
+        for w_obj in owned_w:
+            w_obj._free_on_death()
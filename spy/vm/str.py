@@ -1,4 +1,5 @@
-from typing import TYPE_CHECKING, Any
+import weakref
+from typing import TYPE_CHECKING, Any, Optional
 from spy.llwasm import LLWasmInstance
 from spy.fqn import QN
 from spy.vm.object import W_Object, W_Type, W_Dynamic, spytype, W_I32
@@ -17,12 +18,34 @@ def ll_spy_Str_new(ll: LLWasmInstance, s: str) -> int:
 
     Return the corresponding 'spy_Str *'
     """
-    utf8 = s.encode('utf-8')
-    length = len(utf8)
-    ptr = ll.call('spy_str_alloc', length)
-    ll.mem.write(ptr+4, utf8)
+    return ll_spy_Str_from_utf8(ll, s.encode('utf-8'))
+
+def ll_spy_Str_from_utf8(ll: LLWasmInstance, utf8: bytes) -> int:
+    """
+    Like ll_spy_Str_new, but take the already-encoded content.
+    """
+    ptr = ll.call('spy_str_alloc', len(utf8))
+    ll.mem.write(ll.mem.read_i32(ptr+4), utf8)
     return ptr
 
+def ll_spy_Str_read(ll: LLWasmInstance, ptr: int) -> bytes:
+    """
+    Return the utf8-encoded content of the given 'spy_Str *'. This works
+    also for views.
+    """
+    length = ll.mem.read_i32(ptr)
+    utf8 = ll.mem.read_i32(ptr+4)
+    return bytes(ll.mem.view(utf8, length))
+
+def ll_spy_Str_is_view(ll: LLWasmInstance, ptr: int) -> bool:
+    """
+    Return True if the given 'spy_Str *' is a view into the data of another
+    spy_Str, i.e. if its parent is not NULL.
+    """
+    return ll.mem.read_i32(ptr+8) != 0
+
+def ll_spy_Str_free(ll: LLWasmInstance, ptr: int) -> None:
+    ll.call('spy_str_free', ptr)
 
 
 @spytype('str')
@@ -32,36 +55,86 @@ class W_Str(W_Object):
 
     This is basically a 'spy_Str *', i.e. a pointer to a C struct which
     resides in the linear memory of the VM:
-        typedef struct {
+        typedef struct spy_Str {
             size_t length;
-            const char utf8[];
+            const char *utf8;
+            struct spy_Str *parent;
+            char data[];
         } spy_Str;
+
+    If parent is not NULL, the string is a view into the data of parent, see
+    libspy/include/spy/str.h. The W_Str of a view keeps alive the W_Str of
+    its parent (see _w_parent), else its spy_Str would be freed.
+
+    The W_Str owns its spy_Str, which is freed when the W_Str dies (see
+    _free_on_death), unless it was created by from_ptr(..., owned=False).
+    Note that the interned literals live as long as the VM, because
+    vm.interned_str_w keeps them alive.
     """
     vm: 'SPyVM'
     ptr: int
+    # strings are immutable, so we can cache the content on the host side
+    # and avoid reading it from the linear memory again and again. They are
+    # computed lazily, except when we create the string from an
+    # interp-level str.
+    _length: Optional[int]
+    _str: Optional[str]
+    _w_parent: Optional['W_Str']
+    _owned: bool
 
     def __init__(self, vm: 'SPyVM', s: str) -> None:
-        ptr = ll_spy_Str_new(vm.ll, s)
+        utf8 = s.encode('utf-8')
+        ptr = ll_spy_Str_from_utf8(vm.ll, utf8)
         self.vm = vm
         self.ptr = ptr
+        self._length = len(utf8)
+        self._str = s
+        self._w_parent = None
+        self._owned = True
+        self._free_on_death()
 
     @staticmethod
-    def from_ptr(vm: 'SPyVM', ptr: int) -> 'W_Str':
+    def from_ptr(vm: 'SPyVM', ptr: int, *, owned: bool = False) -> 'W_Str':
+        """
+        Wrap an existing spy_Str. If owned is True, the spy_Str is freed
+        when the W_Str dies: this is what we want for the fresh strings
+        returned by libspy functions such as spy_str_add.
+        """
         w_res = W_Str.__new__(W_Str)
         w_res.vm = vm
         w_res.ptr = ptr
+        w_res._length = None
+        w_res._str = None
+        w_res._w_parent = None
+        w_res._owned = owned
+        if owned:
+            w_res._free_on_death()
         return w_res
 
+    def _free_on_death(self) -> None:
+        # the W_Str might outlive any arena, so its spy_Str must not live in
+        # one, see spy/arena.h
+        if self.vm.ll.arena_depth > 0:
+            raise ValueError('cannot create a str inside a libspy arena')
+        # the finalizer must not reference self, else it would keep it alive
+        fin = weakref.finalize(self, ll_spy_Str_free, self.vm.ll, self.ptr)
+        # there is no point in freeing the memory at exit
+        fin.atexit = False
+
     def get_length(self) -> int:
-        return self.vm.ll.mem.read_i32(self.ptr)
+        if self._length is None:
+            self._length = self.vm.ll.mem.read_i32(self.ptr)
+        return self._length
 
     def get_utf8(self) -> bytes:
-        length = self.get_length()
-        ba = self.vm.ll.mem.read(self.ptr+4, length)
-        return bytes(ba)
+        if self._str is not None:
+            return self._str.encode('utf-8')
+        return ll_spy_Str_read(self.vm.ll, self.ptr)
 
     def _as_str(self) -> str:
-        return self.get_utf8().decode('utf-8')
+        if self._str is None:
+            self._str = self.get_utf8().decode('utf-8')
+        return self._str
 
     def __repr__(self) -> str:
         s = self._as_str()
@@ -76,15 +149,21 @@ class W_Str(W_Object):
         def str_getitem(vm: 'SPyVM', w_s: W_Str, w_i: W_I32) -> W_Str:
             assert isinstance(w_s, W_Str)
             assert isinstance(w_i, W_I32)
+            # the result is prebuilt, so we must not free it
             ptr_c = vm.ll.call('spy_str_getitem', w_s.ptr, w_i.value)
             return W_Str.from_ptr(vm, ptr_c)
         return W_OpImpl.simple(vm.wrap_func(str_getitem))
 
+    @staticmethod
+    def op_GETSLICE(vm: 'SPyVM', wv_obj: W_Value, wv_start: W_Value,
+                    wv_stop: W_Value) -> W_OpImpl:
+        return W_OpImpl.simple(vm.wrap_func(str_slice))
+
     @staticmethod
     def meta_op_CALL(vm: 'SPyVM', wv_obj: W_Value,
                      w_values: W_List[W_Value]) -> W_OpImpl:
         from spy.vm.b import B
-        args_wv = w_values.items_w
+        args_wv: list[W_Value] = w_values.items_w
         if len(args_wv) == 1 and args_wv[0].w_static_type is B.w_i32:
             wv_i = args_wv[0]
             return W_OpImpl.with_values(
@@ -99,3 +178,15 @@ class W_Str(W_Object):
 def int2str(vm: 'SPyVM', w_i: W_I32) -> W_Str:
     i = vm.unwrap_i32(w_i)
     return vm.wrap(str(i))  # type: ignore
+
+@spy_builtin(QN('operator::str_slice'))
+def str_slice(vm: 'SPyVM', w_s: W_Str, w_start: W_I32, w_stop: W_I32) -> W_Str:
+    ptr_c = vm.ll.call('spy_str_slice', w_s.ptr, w_start.value, w_stop.value)
+    if ptr_c == w_s.ptr:
+        return w_s
+    if not ll_spy_Str_is_view(vm.ll, ptr_c):
+        # prebuilt empty or 1-byte string
+        return W_Str.from_ptr(vm, ptr_c)
+    w_res = W_Str.from_ptr(vm, ptr_c, owned=True)
+    w_res._w_parent = w_s
+    return w_res
@@ -49,7 +49,12 @@ class TypeChecker:
     expr_conv: dict[ast.Expr, TypeConverter]
     opimpl: dict[ast.Node, W_OpImpl]
     locals_types_w: dict[str, W_Type]
-
+    # statements which have already been checked
+    checked_stmts: set[ast.Stmt]
+    # the dynamic types of the globals which we looked up: if one of them
+    # changes, the typechecking results are no longer valid. See
+    # is_still_valid.
+    globals_deps: dict[FQN, W_Type]
 
     def __init__(self, vm: 'SPyVM', w_func: W_ASTFunc) -> None:
         self.vm = vm
@@ -61,6 +66,8 @@ class TypeChecker:
         self.expr_conv = {}
         self.opimpl = {}
         self.locals_types_w = {}
+        self.checked_stmts = set()
+        self.globals_deps = {}
         self.declare_arguments()
 
     def declare_arguments(self) -> None:
@@ -78,6 +85,42 @@ class TypeChecker:
             f'variable already declared: {name}'
         self.locals_types_w[name] = w_type
 
+    def redeclare_local_maybe(self, name: str, w_type: W_Type) -> None:
+        """
+        Like declare_local, but it's fine if the variable has already been
+        declared with the same type. This happens for VarDef and FuncDef,
+        which are checked every time they are executed: if the TypeChecker
+        is shared by many calls (see W_ASTFunc.get_typechecker), the
+        declaration might come from a previous call.
+        """
+        w_old_type = self.locals_types_w.get(name)
+        if w_old_type is None:
+            self.declare_local(name, w_type)
+        else:
+            assert w_old_type == w_type, f'variable already declared: {name}'
+
+    def lookup_global_type(self, fqn: FQN) -> W_Type:
+        """
+        Return the dynamic type of the given global, and record it in
+        globals_deps.
+        """
+        w_value = self.vm.lookup_global(fqn)
+        assert w_value is not None
+        w_type = self.vm.dynamic_type(w_value)
+        self.globals_deps[fqn] = w_type
+        return w_type
+
+    def is_still_valid(self) -> bool:
+        """
+        Check whether the globals which we looked up still have the same
+        types as when we typechecked the function.
+        """
+        for fqn, w_type in self.globals_deps.items():
+            w_value = self.vm.lookup_global(fqn)
+            if w_value is None or self.vm.dynamic_type(w_value) is not w_type:
+                return False
+        return True
+
     def typecheck_local(self, expr: ast.Expr, name: str) -> None:
         assert name in self.locals_types_w
         got_color, w_got_type = self.check_expr(expr)
@@ -120,7 +163,10 @@ class TypeChecker:
         return None
 
     def check_stmt(self, stmt: ast.Stmt) -> None:
+        if stmt in self.checked_stmts:
+            return
         magic_dispatch(self, 'check_stmt', stmt)
+        self.checked_stmts.add(stmt)
 
     def check_expr(self, expr: ast.Expr) -> tuple[Color, W_Type]:
         """
@@ -185,7 +231,7 @@ class TypeChecker:
         """
 
     def lazy_check_VarDef(self, vardef: ast.VarDef, w_type: W_Type) -> None:
-        self.declare_local(vardef.name, w_type)
+        self.redeclare_local_maybe(vardef.name, w_type)
 
     def check_stmt_FuncDef(self, funcdef: ast.FuncDef) -> None:
         """
@@ -196,7 +242,7 @@ class TypeChecker:
         """
         See check_stmt_VarDef and lazy_check_VarDef
         """
-        self.declare_local(funcdef.name, w_type)
+        self.redeclare_local_maybe(funcdef.name, w_type)
 
     def check_stmt_StmtExpr(self, stmt: ast.StmtExpr) -> None:
         pass
@@ -278,9 +324,7 @@ class TypeChecker:
         elif sym.fqn:
             # XXX this is wrong: we should keep track of the static type of
             # FQNs. For now, we just look it up and use the dynamic type
-            w_value = self.vm.lookup_global(sym.fqn)
-            assert w_value is not None
-            return sym.color, self.vm.dynamic_type(w_value)
+            return sym.color, self.lookup_global_type(sym.fqn)
         elif sym.is_local:
             return sym.color, self.locals_types_w[name.id]
         else:
@@ -307,10 +351,7 @@ class TypeChecker:
 
     def check_expr_FQNConst(self, const: ast.FQNConst) -> tuple[Color, W_Type]:
         # XXX: I think that FQNConst should remember what was its static type
-        w_val = self.vm.lookup_global(const.fqn)
-        assert w_val is not None
-        w_type = self.vm.dynamic_type(w_val)
-        return 'blue', w_type
+        return 'blue', self.lookup_global_type(const.fqn)
 
     def check_expr_BinOp(self, binop: ast.BinOp) -> tuple[Color, W_Type]:
         w_OP = OP.from_token(binop.op) # e.g., w_ADD, w_MUL, etc.
@@ -344,6 +385,16 @@ class TypeChecker:
         self.opimpl[expr] = w_opimpl
         return color, w_opimpl.w_restype
 
+    def check_expr_GetSlice(self, expr: ast.GetSlice) -> tuple[Color, W_Type]:
+        colors, args_wv = self.check_many_exprs(
+            ['v', 'a', 'b'],
+            [expr.value, expr.start, expr.stop],
+        )
+        color = maybe_blue(*colors)
+        w_opimpl = self.vm.call_OP(OP.w_GETSLICE, args_wv)
+        self.opimpl[expr] = w_opimpl
+        return color, w_opimpl.w_restype
+
     def check_expr_GetAttr(self, expr: ast.GetAttr) -> tuple[Color, W_Type]:
         colors, args_wv = self.check_many_exprs(
             ['v', 'a'],
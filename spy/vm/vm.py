@@ -1,12 +1,11 @@
 import py
-from typing import Any, Optional, Iterable
-import itertools
+from typing import TYPE_CHECKING, Any, Optional
 from dataclasses import dataclass
 from types import FunctionType
 import fixedint
 from spy.fqn import QN, FQN
 from spy import libspy
-from spy.doppler import redshift
+from spy.doppler import redshift, redshift_forked, can_redshift_forked
 from spy.errors import SPyTypeError
 from spy.vm.object import W_Object, W_Type, W_I32, W_F64, W_Bool, W_Dynamic
 from spy.vm.str import W_Str
@@ -23,6 +22,8 @@ from spy.vm.modules.operator import OPERATOR
 from spy.vm.modules.types import TYPES, W_TypeDef
 from spy.vm.modules.rawbuffer import RAW_BUFFER
 from spy.vm.modules.jsffi import JSFFI
+if TYPE_CHECKING:
+    from spy.vm.snapshot import VMSnapshot
 
 class SPyVM:
     """
@@ -30,29 +31,83 @@ class SPyVM:
 
     Each instance of the VM contains an instance of libspy.wasm: all the
     non-scalar objects (e.g. strings) are stored in the WASM linear memory.
+    The instance is created lazily on the first access to vm.ll, so VMs which
+    never touch non-scalar objects don't pay for it.
     """
-    ll: libspy.LLSPyInstance
+    _ll: Optional[libspy.LLSPyInstance]
     globals_types: dict[FQN, W_Type]
     globals_w: dict[FQN, W_Object]
+    # reverse index of globals_w, keyed by id(w_obj). Since globals_w keeps
+    # the objects alive, ids cannot be reused as long as they are there. The
+    # same object can be stored in more than one global: the first FQN wins,
+    # as it did with the old linear search.
+    reverse_globals: dict[int, list[FQN]]
     modules_w: dict[str, W_Module]
     unique_fqns: set[FQN]
+    # the next suffix to use for non-global FQNs, see get_FQN
+    fqn_counters: dict[QN, int]
     path: list[str]
     bluecache: BlueCache
+    # if True, red W_ASTFuncs are executed by compiling them with
+    # ClosureCompiler, else by ASTFrame
+    closure_compile: bool
+    # incremented every time that a global changes its dynamic type: this is
+    # used to invalidate the typechecking results cached by W_ASTFunc
+    globals_version: int
+    # if True, vm.call_trusted and the interpreter don't check again the types
+    # of the arguments which have already been proven by the TypeChecker.
+    # This is off by default: the TypeChecker uses the dynamic types of red
+    # globals, which might change at runtime (see
+    # TypeChecker.check_expr_Name), so it's safe to turn it on only for code
+    # which doesn't rebind them.
+    trust_typechecker: bool
+    # string literals, see intern_str
+    interned_str_w: dict[str, W_Str]
+    # the FQNs of the red W_ASTFuncs which still need to be redshifted. This
+    # is filled by _set_global and drained by redshift()
+    redshift_worklist: list[FQN]
 
     def __init__(self) -> None:
-        self.ll = libspy.LLSPyInstance(libspy.LLMOD)
+        self._ll = None
         self.globals_types = {}
         self.globals_w = {}
+        self.reverse_globals = {}
         self.modules_w = {}
         self.unique_fqns = set()
+        self.fqn_counters = {}
         self.path = []
         self.bluecache = BlueCache(self)
+        self.closure_compile = True
+        self.trust_typechecker = False
+        self.interned_str_w = {}
+        self.globals_version = 0
+        self.redshift_worklist = []
         self.make_module(BUILTINS)   # builtins::
         self.make_module(OPERATOR)   # operator::
         self.make_module(TYPES)      # types::
         self.make_module(RAW_BUFFER) # rawbuffer::
         self.make_module(JSFFI)      # jsffi::
 
+    def snapshot(self) -> 'VMSnapshot':
+        """
+        Take a snapshot of the current state of the VM, which can be used to
+        create new VMs with from_snapshot(). See spy/vm/snapshot.py.
+        """
+        from spy.vm.snapshot import VMSnapshot
+        return VMSnapshot.from_vm(self)
+
+    @classmethod
+    def from_snapshot(cls, snap: 'VMSnapshot') -> 'SPyVM':
+        vm = cls.__new__(cls)
+        snap.restore(vm)
+        return vm
+
+    @property
+    def ll(self) -> libspy.LLSPyInstance:
+        if self._ll is None:
+            self._ll = libspy.LLSPyInstance(libspy.get_LLMOD())
+        return self._ll
+
     def import_(self, modname: str) -> W_Module:
         from spy.irgen.irgen import make_w_mod_from_file
         if modname in self.modules_w:
@@ -66,32 +121,79 @@ class SPyVM:
         self.modules_w[modname] = w_mod
         return w_mod
 
-    def redshift(self) -> None:
+    def redshift(self, modname: Optional[str] = None, *,
+                 workers: int = 1) -> None:
         """
-        Perform a redshift on all W_ASTFunc.
+        Perform a redshift on all W_ASTFunc which are still in the worklist.
+
+        If modname is given, redshift only the functions of that module,
+        plus all the new functions which are created in the process (e.g.,
+        closures which are given an FQN by FuncDoppler.make_const), no matter
+        in which module they live.
+
+        If workers > 1, the functions are first redshifted in parallel by a
+        pool of forked processes, see doppler.redshift_forked. The result is
+        the same as the serial redshift.
         """
-        def should_redshift(w_func: W_ASTFunc) -> bool:
-            # we don't want to redshift @blue functions
-            return w_func.color != 'blue' and not w_func.redshifted
-
-        def get_funcs() -> Iterable[tuple[FQN, W_ASTFunc]]:
-            for fqn, w_func in self.globals_w.items():
-                if isinstance(w_func, W_ASTFunc) and should_redshift(w_func):
-                    yield fqn, w_func
-
-        while True:
-            funcs = list(get_funcs())
-            if not funcs:
-                break
-            self._redshift_some(funcs)
-
-    def _redshift_some(self, funcs: list[tuple[FQN, W_ASTFunc]]) -> None:
-        for fqn, w_func in funcs:
-            assert w_func.color != 'blue'
-            assert not w_func.redshifted
-            w_newfunc = redshift(self, w_func)
-            assert w_newfunc.redshifted
-            self.globals_w[fqn] = w_newfunc
+        if modname is None:
+            todo = self.redshift_worklist
+            keep = []
+        else:
+            todo = [fqn for fqn in self.redshift_worklist
+                    if fqn.modname == modname]
+            keep = [fqn for fqn in self.redshift_worklist
+                    if fqn.modname != modname]
+        self.redshift_worklist = keep
+        if workers > 1 and todo and can_redshift_forked():
+            todo = self._redshift_forked(todo, workers)
+        n = len(keep)
+        i = 0
+        try:
+            while i < len(todo):
+                self._redshift_one(todo[i])
+                i += 1
+                # the functions which were discovered by _redshift_one are
+                # appended to redshift_worklist: move them to todo
+                todo += self.redshift_worklist[n:]
+                del self.redshift_worklist[n:]
+        finally:
+            # if something goes wrong, don't lose the remaining work
+            self.redshift_worklist += todo[i:]
+
+    def should_redshift(self, w_obj: W_Object) -> bool:
+        # we don't want to redshift @blue functions
+        return (isinstance(w_obj, W_ASTFunc) and
+                w_obj.color != 'blue' and
+                not w_obj.redshifted)
+
+    def _redshift_forked(self, todo: list[FQN], workers: int) -> list[FQN]:
+        """
+        Redshift the given functions in parallel, and return the ones which
+        must still be redshifted serially.
+        """
+        fqns = [fqn for fqn in dict.fromkeys(todo)
+                if self.should_redshift(self.globals_w[fqn])]
+        results = redshift_forked(self, fqns, workers)
+        if results is None:
+            # the blue code had side effects: redshift everything serially
+            return todo
+        leftovers = []
+        for fqn, w_newfunc in zip(fqns, results):
+            if w_newfunc is None:
+                leftovers.append(fqn)
+            else:
+                self._set_global(fqn, w_newfunc)
+        return leftovers
+
+    def _redshift_one(self, fqn: FQN) -> None:
+        w_func = self.globals_w[fqn]
+        if not self.should_redshift(w_func):
+            # the global was overwritten or it was already redshifted
+            return
+        assert isinstance(w_func, W_ASTFunc)
+        w_newfunc = redshift(self, w_func)
+        assert w_newfunc.redshifted
+        self._set_global(fqn, w_newfunc)
 
     def register_module(self, w_mod: W_Module) -> None:
         assert w_mod.name not in self.modules_w
@@ -114,17 +216,15 @@ class SPyVM:
         the same global twice.
 
         For non globals (e.g., closures) the algorithm is simple: to compute
-        an unique suffix, we just increment a numeric counter.
+        an unique suffix, we just increment a numeric counter, which is kept
+        separately for each QN.
         """
         if is_global:
             fqn = FQN.make_global(modname=qn.modname, attr=qn.attr)
         else:
-            # XXX this is potentially quadratic if we create tons of
-            # conflicting FQNs, but for now we don't care
-            for n in itertools.count():
-                fqn = FQN.make(modname=qn.modname, attr=qn.attr, suffix=str(n))
-                if fqn not in self.unique_fqns:
-                    break
+            n = self.fqn_counters.get(qn, 0)
+            self.fqn_counters[qn] = n + 1
+            fqn = FQN.make(modname=qn.modname, attr=qn.attr, suffix=str(n))
         assert fqn not in self.unique_fqns
         self.unique_fqns.add(fqn)
         return fqn
@@ -143,7 +243,7 @@ class SPyVM:
         else:
             assert self.isinstance(w_value, w_type)
         self.globals_types[fqn] = w_type
-        self.globals_w[fqn] = w_value
+        self._set_global(fqn, w_value)
 
     def lookup_global_type(self, fqn: FQN) -> Optional[W_Type]:
         assert isinstance(fqn, FQN)
@@ -157,18 +257,39 @@ class SPyVM:
             return self.globals_w.get(fqn)
 
     def reverse_lookup_global(self, w_val: W_Object) -> Optional[FQN]:
-        # XXX we should maintain a reverse-lookup table instead of doing a
-        # linear search
-        for fqn, w_obj in self.globals_w.items():
-            if w_val is w_obj:
-                return fqn
-        return None
+        fqns = self.reverse_globals.get(id(w_val))
+        if fqns is None:
+            return None
+        return fqns[0]
 
     def store_global(self, fqn: FQN, w_value: W_Object) -> None:
         assert isinstance(fqn, FQN)
         w_type = self.globals_types[fqn]
         assert self.isinstance(w_value, w_type)
+        w_old = self.globals_w[fqn]
+        if self.dynamic_type(w_old) is not self.dynamic_type(w_value):
+            self.globals_version += 1
+        self._set_global(fqn, w_value)
+
+    def _set_global(self, fqn: FQN, w_value: W_Object) -> None:
+        """
+        Low-level helper to store a global: it keeps globals_w, the
+        reverse_globals index and the namespace of the module in sync.
+        """
+        w_old = self.globals_w.get(fqn)
+        if w_old is w_value:
+            return
+        if w_old is not None:
+            fqns = self.reverse_globals[id(w_old)]
+            fqns.remove(fqn)
+            if not fqns:
+                del self.reverse_globals[id(w_old)]
         self.globals_w[fqn] = w_value
+        self.reverse_globals.setdefault(id(w_value), []).append(fqn)
+        if self.should_redshift(w_value):
+            self.redshift_worklist.append(fqn)
+        w_mod = self.modules_w[fqn.modname]
+        w_mod._dict_w[fqn] = w_value
 
     def dynamic_type(self, w_obj: W_Object) -> W_Type:
         assert isinstance(w_obj, W_Object)
@@ -274,6 +395,20 @@ class SPyVM:
         assert isinstance(w_func, W_Func)
         return w_func
 
+    def intern_str(self, s: str) -> W_Str:
+        """
+        Return the unique W_Str for the given string literal.
+
+        Strings are immutable, so we can share them: this way, a literal which
+        is evaluated many times (e.g. inside a loop) is allocated in the VM
+        memory only once.
+        """
+        w_s = self.interned_str_w.get(s)
+        if w_s is None:
+            w_s = W_Str(self, s)
+            self.interned_str_w[s] = w_s
+        return w_s
+
     def unwrap(self, w_value: W_Object) -> Any:
         """
         Useful for tests: magic funtion which wraps the given app-level w_
@@ -299,17 +434,32 @@ class SPyVM:
         return self.unwrap(w_value) # type: ignore
 
     def call(self, w_func: W_Func, args_w: list[W_Object]) -> W_Object:
+        return self._call(w_func, args_w, typecheck=True)
+
+    def call_trusted(self, w_func: W_Func, args_w: list[W_Object]) -> W_Object:
+        """
+        Like vm.call, but assume that the types of args_w have already been
+        proven correct (e.g. by the TypeChecker), so we don't check them
+        again.
+
+        This is meant to be used by the interpreter. If vm.trust_typechecker
+        is False, it is the same as vm.call.
+        """
+        return self._call(w_func, args_w, typecheck=not self.trust_typechecker)
+
+    def _call(self, w_func: W_Func, args_w: list[W_Object], *,
+              typecheck: bool) -> W_Object:
         if w_func.color == 'blue':
             # for blue functions, we memoize the result
             w_result = self.bluecache.lookup(w_func, args_w)
             if w_result is not None:
                 return w_result
-            w_result = self._call_func(w_func, args_w)
+            w_result = self._call_func(w_func, args_w, typecheck)
             self.bluecache.record(w_func, args_w, w_result)
             return w_result
         else:
             # for red functions, we just call them
-            return self._call_func(w_func, args_w)
+            return self._call_func(w_func, args_w, typecheck)
 
     def call_OP(self, w_func: W_Func, args_wv: list[W_Value]) -> W_OpImpl:
         """
@@ -321,11 +471,13 @@ class SPyVM:
         assert isinstance(w_opimpl, W_OpImpl)
         return w_opimpl
 
-    def _call_func(self, w_func: W_Func, args_w: list[W_Object]) -> W_Object:
+    def _call_func(self, w_func: W_Func, args_w: list[W_Object],
+                   typecheck: bool) -> W_Object:
         w_functype = w_func.w_functype
         assert w_functype.arity == len(args_w)
-        for param, w_arg in zip(w_functype.params, args_w):
-            self.typecheck(w_arg, param.w_type)
+        if typecheck:
+            for param, w_arg in zip(w_functype.params, args_w):
+                self.typecheck(w_arg, param.w_type)
         return w_func.spy_call(self, args_w)
 
     def eq(self, w_a: W_Dynamic, w_b: W_Dynamic) -> W_Bool: